@@ -4,7 +4,8 @@ os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'tango.settings')
 import django
 django.setup()
 
-from rango.models import Category, Page
+from rango.models import Page
+from rango.importer import CatalogueImporter
 
 def populate():
     
@@ -37,40 +38,24 @@ def populate():
             }
     
     # if you want to add more catergories or pages, add them to the dictionaries above
-	
-	# The code below goes through the cats dictionary, then adds each category,
-	# and then adds all the associated pages for that category
-	# if you are using Python 2.x then use cats.iteritems() see
-	# http://docs.quantifiedcode.com/python-anti-patterns/readability/not_using_items_to_iterate_over_a_dictionary.html
-	# for more information about using items() and how to iterate over a dictionary properly
-    
+
+    # The code below goes through the cats dictionary and hands each category, and then all of its
+    # pages, to the bulk importer (rango/importer.py). It writes them in batches rather than doing a
+    # get_or_create and a save for every row, and matches categories by name and pages by title so
+    # the script can be run again safely.
     # Using the .items returns the key and the value. In this case the key is "Python", "Django" or "Other Frameworks" and the value (cat_data) is the corresponding dictionary in cats.
-    for cat, cat_data in cats.iteritems():
-        # c = add_cat(cat)
+    importer = CatalogueImporter()
+    for cat, cat_data in cats.items():
         # Updated the population script to pass through the specific values for views and likes
-        c = add_cat(cat, cat_data["views"], cat_data["likes"])
+        importer.add_category(cat, cat_data["views"], cat_data["likes"])
         for p in cat_data["pages"]:
-            add_page(c, p["title"], p["url"], p["views"])
-    
-    # Print out what we have added to the user.
-    for c in Category.objects.all():
-        for p in Page.objects.filter(category=c):
-            print("- {0} - {1}".format(str(c), str(p)))
-
-def add_page(cat, title, url, views=0):
-    p = Page.objects.get_or_create(category=cat, title=title)[0]
-    p.url=url
-    p.views=views
-    # we need to save the changes we made!!
-    p.save()
-    return p
+            importer.add_page(cat, p["title"], p["url"], p["views"])
+    importer.finish()
 
-def add_cat(name, views=0, likes=0):
-    c = Category.objects.get_or_create(name=name)[0]
-    c.views=views
-    c.likes=likes
-    c.save()
-    return c
+    # Print out what we have added to the user.
+    # select_related fetches each page's category in the same query
+    for p in Page.objects.select_related('category').order_by('category__name', 'title'):
+        print("- {0} - {1}".format(str(p.category), str(p)))
 
 # Start execution here!
 if __name__ == '__main__':
@@ -1,13 +1,108 @@
+from django import forms
 from django.contrib import admin
+from django.contrib.admin import helpers
+from django.contrib.admin.widgets import ForeignKeyRawIdWidget
+from django.db import transaction
+from django.template.response import TemplateResponse
+from django.utils import timezone
 from rango.models import Category, Page
 from rango.models import UserProfile
+from rango import category_stats, search, signals
+from rango.pagination import EstimatedCountPaginator
 # Register your models here.
 
-class PageAdmin(admin.ModelAdmin):
-	list_display = ('title', 'category', 'url')
-class CategoryAdmin(admin.ModelAdmin):
+# The changelists are built to stay fast with millions of pages: categories are joined in rather
+# than fetched row by row, searches go through the full text index (rango/search.py) instead of
+# LIKE '%...%' scans, unfiltered lists are counted from the database's statistics, and the
+# bulk actions are single UPDATE statements.
+
+class IndexedSearchMixin(object):
+	# search_fields only says which fields are searched (and turns on the search box)
+	search_kind = None
+
+	def get_search_results(self, request, queryset, search_term):
+		return search.filter_queryset(queryset, self.search_kind, search_term), False
+
+class LinkStatusFilter(admin.SimpleListFilter):
+	# What check_links found at the pages' urls
+	title = 'link'
+	parameter_name = 'link'
+
+	def lookups(self, request, model_admin):
+		return (('unchecked', 'Not checked'), ('ok', 'Working'), ('broken', 'Broken'), ('moved', 'Redirected'))
+
+	def queryset(self, request, queryset):
+		if self.value() == 'unchecked':
+			return queryset.filter(checked_at__isnull=True)
+		if self.value() == 'ok':
+			return queryset.filter(link_status__gte=200, link_status__lt=400)
+		if self.value() == 'broken':
+			return queryset.filter(checked_at__isnull=False).exclude(link_status__gte=200, link_status__lt=400)
+		if self.value() == 'moved':
+			return queryset.exclude(final_url='')
+		return queryset
+
+class MovePagesForm(forms.Form):
+	category = forms.ModelChoiceField(queryset=Category.objects.all(),
+		# A lookup popup rather than a <select> of every category
+		widget=ForeignKeyRawIdWidget(Page._meta.get_field('category').remote_field, admin.site))
+
+class PageAdmin(IndexedSearchMixin, admin.ModelAdmin):
+	list_display = ('title', 'category', 'url', 'views', 'link_status')
+	list_select_related = ('category',)
+	list_filter = (LinkStatusFilter,)
+	search_fields = ('title', 'url')
+	search_kind = 'page'
+	raw_id_fields = ('category',)
+	paginator = EstimatedCountPaginator
+	# Or every filtered list also counts the whole table, for "x of y selected"
+	show_full_result_count = False
+	actions = ['reset_views', 'move_pages']
+
+	def reset_views(self, request, queryset):
+		with transaction.atomic():
+			totals = category_stats.selection_totals(queryset)
+			updated = queryset.update(views=0, updated_at=timezone.now())
+			signals.pages_rearranged(dict((category_id, (0, -views)) for category_id, (pages, views) in totals.items()))
+		self.message_user(request, 'Reset the views of {0} page(s).'.format(updated))
+	reset_views.short_description = 'Reset the views of the selected pages'
+
+	def move_pages(self, request, queryset):
+		# Asks for the category first, then posts back to this action with it
+		form = MovePagesForm(request.POST if 'apply' in request.POST else None)
+		if form.is_valid():
+			category = form.cleaned_data['category']
+			with transaction.atomic():
+				totals = category_stats.selection_totals(queryset)
+				updated = queryset.update(category=category, updated_at=timezone.now())
+				# Each category loses what it had selected, and the one they move to gains it all
+				deltas = dict((category_id, (-pages, -views)) for category_id, (pages, views) in totals.items())
+				kept_pages, kept_views = deltas.get(category.id, (0, 0))
+				deltas[category.id] = (kept_pages + sum(pages for pages, views in totals.values()),
+					kept_views + sum(views for pages, views in totals.values()))
+				signals.pages_rearranged(deltas)
+			self.message_user(request, 'Moved {0} page(s) to {1}.'.format(updated, category))
+			return None
+		context = dict(self.admin_site.each_context(request),
+			title='Move pages to another category',
+			opts=self.model._meta,
+			form=form,
+			media=self.media + form.media,
+			selected=request.POST.getlist(helpers.ACTION_CHECKBOX_NAME),
+			select_across=request.POST.get('select_across', '0'),
+			action_checkbox_name=helpers.ACTION_CHECKBOX_NAME,
+			count=queryset.count())
+		return TemplateResponse(request, 'admin/rango/page/move_pages.html', context)
+	move_pages.short_description = 'Move the selected pages to another category'
+
+class CategoryAdmin(IndexedSearchMixin, admin.ModelAdmin):
 	prepopulated_fields = {'slug':('name',)}
+	list_display = ('name', 'page_count', 'total_page_views', 'likes', 'views')
+	search_fields = ('name',)
+	search_kind = 'category'
+	paginator = EstimatedCountPaginator
+	show_full_result_count = False
 
 admin.site.register(Category, CategoryAdmin)
 admin.site.register(Page, PageAdmin)
-admin.site.register(UserProfile)
\ No newline at end of file
+admin.site.register(UserProfile)
@@ -0,0 +1,132 @@
+import time
+from collections import OrderedDict, defaultdict
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import F, Sum
+from django.utils import timezone
+from rango.models import Page, PageViewBucket
+from rango.tasks import task
+
+# Page views over time, for "trending" lists, as counts per page per minute, hour and day
+# (PageViewBucket). Only the minute buckets are written as clicks come in, by the click
+# counter as it writes them back (rango/clicks.py). The hour and day buckets are rolled up
+# from them by a background task, which also deletes the buckets older than their retention.
+# Trending pages are then read from a bounded number of buckets, whatever the traffic.
+MINUTE = PageViewBucket.MINUTE
+HOUR = PageViewBucket.HOUR
+DAY = PageViewBucket.DAY
+
+# Seconds each granularity's buckets are kept
+RETENTION = getattr(settings, 'RANGO_ANALYTICS_RETENTION',
+	{MINUTE: 24 * 60 * 60, HOUR: 30 * 24 * 60 * 60, DAY: 400 * 24 * 60 * 60})
+# Seconds between rollups, while there are clicks to roll up
+ROLLUP_INTERVAL = getattr(settings, 'RANGO_ANALYTICS_ROLLUP_INTERVAL', 5 * 60)
+TRENDING_SIZE = getattr(settings, 'RANGO_TRENDING_SIZE', 10)
+TRENDING_MAX_AGE = getattr(settings, 'RANGO_TRENDING_MAX_AGE', 60)
+
+# Trending window -> the buckets it adds up, and how far back they start: the last 60 minutes,
+# the last 24 hours, and the last 7 days, today included
+WINDOWS = OrderedDict([
+	('hour', (MINUTE, timedelta(hours=1))),
+	('day', (HOUR, timedelta(days=1))),
+	('week', (DAY, timedelta(days=6))),
+])
+
+ROLLED_UP_KEY = 'rango:analytics:rolled_up'
+
+def bucket_start(when, granularity):
+	if granularity == MINUTE:
+		return when.replace(second=0, microsecond=0)
+	if granularity == HOUR:
+		return when.replace(minute=0, second=0, microsecond=0)
+	# Days are the site's own (TIME_ZONE) days
+	local = timezone.localtime(when).replace(tzinfo=None)
+	return timezone.make_aware(local.replace(hour=0, minute=0, second=0, microsecond=0))
+
+def first_whole_bucket(cutoff, granularity):
+	# The first bucket starting at or after cutoff; the one before it lost some of its data to compaction
+	start = bucket_start(cutoff, granularity)
+	if start < cutoff:
+		start = bucket_start(start + timedelta(days=1 if granularity == DAY else 0, hours=1), granularity)
+	return start
+
+def record(counts, when=None):
+	'''Add {page_id: views} to the pages' buckets for the minute `when` is in.
+	Part of the click counter's write, and so of its transaction: if another process creates
+	one of the same buckets first, the IntegrityError fails the write and it is retried.'''
+	start = bucket_start(when or timezone.now(), MINUTE)
+	# Pages deleted since they were clicked have nowhere to count
+	page_ids = set(Page.objects.filter(id__in=list(counts)).values_list('id', flat=True))
+	if not page_ids:
+		return
+	buckets = PageViewBucket.objects.filter(granularity=MINUTE, start=start)
+	existing = set(buckets.filter(page_id__in=page_ids).values_list('page_id', flat=True))
+	PageViewBucket.objects.bulk_create([PageViewBucket(page_id=page_id, granularity=MINUTE, start=start,
+		views=counts[page_id]) for page_id in page_ids - existing])
+	groups = defaultdict(list)
+	for page_id in existing:
+		groups[counts[page_id]].append(page_id)
+	for n, ids in groups.items():
+		buckets.filter(page_id__in=ids).update(views=F('views') + n)
+
+def rebuild(granularity, source, since):
+	'''Recompute the `granularity` buckets from `since` on by adding up the `source` buckets in them.
+	They are replaced rather than added to, so rolling up the same time twice does no harm.'''
+	totals = defaultdict(int)
+	rows = PageViewBucket.objects.filter(granularity=source, start__gte=since).values_list('page_id', 'start', 'views')
+	for page_id, start, views in rows.iterator():
+		totals[(page_id, bucket_start(start, granularity))] += views
+	with transaction.atomic():
+		PageViewBucket.objects.filter(granularity=granularity, start__gte=since).delete()
+		PageViewBucket.objects.bulk_create([PageViewBucket(page_id=page_id, granularity=granularity, start=start,
+			views=views) for (page_id, start), views in totals.items()], batch_size=500)
+	return len(totals)
+
+@task()
+def rollup(full=False):
+	'''Roll minute buckets up into hours and hours into days, then delete what is past its retention.
+	Only the buckets changed since the last rollup are redone, unless `full` (or that time is unknown).'''
+	now = timezone.now()
+	last = None if full else cache.get(ROLLED_UP_KEY)
+	cutoffs = dict((granularity, now - timedelta(seconds=seconds)) for granularity, seconds in RETENTION.items())
+	built = {}
+	for granularity, source in ((HOUR, MINUTE), (DAY, HOUR)):
+		since = first_whole_bucket(cutoffs[source], granularity)
+		if last is not None:
+			# The bucket the last rollup happened in was still filling up then
+			since = max(since, bucket_start(last, granularity))
+		built[granularity] = rebuild(granularity, source, since)
+	for granularity, cutoff in cutoffs.items():
+		PageViewBucket.objects.filter(granularity=granularity, start__lt=cutoff).delete()
+	cache.set(ROLLED_UP_KEY, now, None)
+	return built
+
+last_scheduled = 0
+
+def schedule_rollup():
+	# Called whenever clicks are written back: keeps a rollup queued up to ROLLUP_INTERVAL
+	# seconds out (one for all processes, it is deduplicated), without queueing on every write
+	global last_scheduled
+	if time.time() - last_scheduled < ROLLUP_INTERVAL:
+		return
+	last_scheduled = time.time()
+	rollup.delay(dedupe=True, countdown=ROLLUP_INTERVAL)
+
+def trending(window='day', size=TRENDING_SIZE):
+	'''The `size` most viewed pages over a window in WINDOWS, as dicts with their views in it.
+	Shared through the cache for TRENDING_MAX_AGE seconds.'''
+	key = 'rango:trending:{0}:{1}'.format(window, size)
+	pages = cache.get(key)
+	if pages is None:
+		granularity, span = WINDOWS[window]
+		since = bucket_start(timezone.now() - span, granularity)
+		top = list(PageViewBucket.objects.filter(granularity=granularity, start__gte=since)
+			.values('page_id').annotate(total=Sum('views')).order_by('-total', 'page_id')[:size])
+		found = dict((page['id'], page) for page in Page.objects.filter(id__in=[row['page_id'] for row in top])
+			.values('id', 'title', 'category__name', 'category__slug'))
+		pages = [dict(found[row['page_id']], views=row['total']) for row in top if row['page_id'] in found]
+		cache.set(key, pages, TRENDING_MAX_AGE)
+	return pages
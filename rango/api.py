@@ -0,0 +1,111 @@
+import hashlib
+import json
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import HttpResponse, JsonResponse
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import quote_etag
+from rango.pagination import decode_cursor, keyset_page
+
+# The read-only JSON API under /rango/api/v1/. Rows are read with .values() - only the fields
+# asked for with ?fields=, plus what the ordering needs - and never turned into model instances.
+# Lists are cursor paginated (rango/pagination.py): ?limit= rows at a time, with the next page's
+# URL in "next" and the Link header. Responses carry an ETag of their body, so clients polling
+# with If-None-Match get an empty 304 when nothing changed, and may be cached for API_MAX_AGE seconds.
+API_VERSION = 'v1'
+API_PAGE_SIZE = getattr(settings, 'RANGO_API_PAGE_SIZE', 50)
+API_MAX_PAGE_SIZE = getattr(settings, 'RANGO_API_MAX_PAGE_SIZE', 200)
+API_MAX_AGE = getattr(settings, 'RANGO_API_MAX_AGE', 30)
+
+# Resource -> the fields clients may ask for, and those they get when they don't say
+CATEGORY_FIELDS = ('id', 'name', 'slug', 'views', 'likes', 'page_count', 'total_page_views', 'updated_at')
+CATEGORY_DEFAULT_FIELDS = ('id', 'name', 'slug', 'likes', 'page_count')
+PAGE_FIELDS = ('id', 'title', 'url', 'views', 'final_url', 'link_status', 'fetched_title', 'checked_at', 'updated_at')
+PAGE_DEFAULT_FIELDS = ('id', 'title', 'url', 'views')
+
+# ?sort= -> keyset ordering (integer fields ending in id, see rango/pagination.py)
+CATEGORY_ORDERINGS = {
+	'id': ('id',),
+	'likes': ('-likes', '-id'),
+	'views': ('-views', '-id'),
+	'pages': ('-page_count', '-id'),
+}
+PAGE_ORDERINGS = {
+	# The pages of a category by views is what the (category, views, id) index is for
+	'views': ('-views', '-id'),
+	'id': ('id',),
+}
+
+class APIError(Exception):
+
+	def __init__(self, message, status=400):
+		super(APIError, self).__init__(message)
+		self.status = status
+
+def error_response(message, status):
+	return JsonResponse({'error': message}, status=status)
+
+def requested_fields(request, allowed, default):
+	fields = request.GET.get('fields')
+	if not fields:
+		return default
+	fields = tuple(field.strip() for field in fields.split(',') if field.strip())
+	unknown = [field for field in fields if field not in allowed]
+	if unknown or not fields:
+		raise APIError('Unknown field(s) {0!r}; choose from {1}'.format(','.join(unknown), ', '.join(allowed)))
+	return fields
+
+def requested_ordering(request, orderings, default):
+	sort = request.GET.get('sort', default)
+	if sort not in orderings:
+		raise APIError('Unknown sort {0!r}; choose from {1}'.format(sort, ', '.join(sorted(orderings))))
+	return orderings[sort]
+
+def requested_limit(request):
+	try:
+		limit = int(request.GET.get('limit', API_PAGE_SIZE))
+	except ValueError:
+		raise APIError('limit must be a number')
+	if limit < 1:
+		raise APIError('limit must be at least 1')
+	return min(limit, API_MAX_PAGE_SIZE)
+
+def requested_cursor(request, ordering):
+	after = request.GET.get('after')
+	# keyset_page starts from the top on a cursor it can't read; an API client should hear about it
+	if after is not None and decode_cursor(after, len(ordering)) is None:
+		raise APIError('after is not a cursor this list gave out')
+	return after
+
+def list_page(request, queryset, allowed, default_fields, orderings, default_ordering):
+	'''One page of a list resource: (rows as dicts of the requested fields, URL of the next page or None).'''
+	fields = requested_fields(request, allowed, default_fields)
+	ordering = requested_ordering(request, orderings, default_ordering)
+	# The cursor is made from the last row's ordering values, so they are read even if not asked for
+	extra = [field.lstrip('-') for field in ordering if field.lstrip('-') not in fields]
+	rows, next_cursor = keyset_page(queryset.values(*(fields + tuple(extra))), ordering,
+		requested_cursor(request, ordering), requested_limit(request))
+	if extra:
+		rows = [dict((field, row[field]) for field in fields) for row in rows]
+	next_url = None
+	if next_cursor:
+		query = request.GET.copy()
+		query['after'] = next_cursor
+		next_url = request.build_absolute_uri('{0}?{1}'.format(request.path, query.urlencode()))
+	return rows, next_url
+
+def json_response(request, data, next_url=None):
+	'''The data as JSON with its validators, or a 304 if the client already has this body.'''
+	body = json.dumps(data, cls=DjangoJSONEncoder, sort_keys=True).encode('utf-8')
+	# Hashing the body costs far less than the query that made it, and is never out of step with it
+	etag = hashlib.md5(body).hexdigest()
+	response = HttpResponse(body, content_type='application/json')
+	if next_url:
+		response['Link'] = '<{0}>; rel="next"'.format(next_url)
+	response['X-API-Version'] = API_VERSION
+	# The data is the same for everyone, so shared caches may keep it too
+	patch_cache_control(response, public=True, max_age=API_MAX_AGE)
+	response['ETag'] = quote_etag(etag)
+	# Compared with If-None-Match as a quoted ETag; the 304 keeps the ETag and Cache-Control headers
+	return get_conditional_response(request, etag=response['ETag'], response=response) or response
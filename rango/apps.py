@@ -5,3 +5,9 @@ from django.apps import AppConfig
 
 class RangoConfig(AppConfig):
     name = 'rango'
+
+    def ready(self):
+        # Hook up the signal handlers that keep rango's caches in step with the database
+        import rango.signals
+        # and the ones that tune database connections as they are opened
+        import rango.db
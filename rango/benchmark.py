@@ -0,0 +1,234 @@
+import http.client
+import json
+import random
+import socketserver
+import threading
+import time
+from collections import defaultdict
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.servers.basehttp import WSGIServer, WSGIRequestHandler
+from django.core.wsgi import get_wsgi_application
+from django.db import connection
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.utils.http import urlencode
+from rango.importer import CatalogueImporter
+from rango.models import Category, Page, UserProfile
+
+# A repeatable load test for rango: seed a synthetic catalogue, replay a mix of requests against
+# it through the Django test client and through a real WSGI server, and report latency
+# percentiles, throughput and query counts per kind of request. Run by `manage.py benchmark`.
+
+# Kind of request -> share of the traffic
+TRAFFIC_MIX = (
+	('index', 35),
+	('show_category', 20),
+	('goto', 20),
+	('profile', 10),
+	('add_page', 5),
+	('api_categories', 5),
+	('api_pages', 5),
+)
+
+BENCHMARK_PASSWORD = 'benchmark-password'
+CSRF_TOKEN = 'benchmarkbenchmarkbenchmarkbench'
+
+def seed(categories=50, pages=5000, users=100, seed=42):
+	'''Fill the (empty, benchmark) database with a synthetic catalogue and user base.'''
+	rng = random.Random(seed)
+	importer = CatalogueImporter(batch_size=5000)
+	for c in range(categories):
+		importer.add_category('Category {0}'.format(c), rng.randint(0, 1000), rng.randint(0, 1000))
+	for p in range(pages):
+		# Skewed, so a few categories are big, like real catalogues
+		c = min(int(rng.paretovariate(1.2)) - 1, categories - 1)
+		importer.add_page('Category {0}'.format(c), 'Page {0}'.format(p),
+			'http://example.com/{0}/{1}'.format(c, p), rng.randint(0, 10000))
+	importer.finish()
+
+	User.objects.bulk_create([User(username='user{0}'.format(u)) for u in range(users)])
+	# One real password is enough, every benchmark client logs in as the same user
+	user = User.objects.get(username='user0')
+	user.set_password(BENCHMARK_PASSWORD)
+	user.save()
+	UserProfile.objects.bulk_create([UserProfile(user_id=user_id, website='http://example.com/')
+		for user_id in User.objects.values_list('id', flat=True)])
+
+class Request(object):
+
+	def __init__(self, name, method, path, data=None):
+		self.name = name
+		self.method = method
+		self.path = path
+		self.data = data
+
+def build_plan(count, seed=42):
+	'''The requests to replay, drawn from TRAFFIC_MIX with a fixed seed so every run is the same.'''
+	rng = random.Random(seed)
+	slugs = list(Category.objects.values_list('slug', flat=True))
+	page_ids = list(Page.objects.values_list('id', flat=True))
+	usernames = list(User.objects.values_list('username', flat=True)[:1000])
+	names = [name for name, weight in TRAFFIC_MIX for i in range(weight)]
+	plan = []
+	for i in range(count):
+		name = rng.choice(names)
+		if name == 'index':
+			plan.append(Request(name, 'GET', '/rango/'))
+		elif name == 'show_category':
+			plan.append(Request(name, 'GET', '/rango/category/{0}/'.format(rng.choice(slugs))))
+		elif name == 'goto':
+			plan.append(Request(name, 'GET', '/rango/goto/?page_id={0}'.format(rng.choice(page_ids))))
+		elif name == 'api_categories':
+			plan.append(Request(name, 'GET', '/rango/api/v1/categories/?sort=likes&limit=20'))
+		elif name == 'api_pages':
+			plan.append(Request(name, 'GET', '/rango/api/v1/categories/{0}/pages/?fields=id,title,views'.format(rng.choice(slugs))))
+		elif name == 'profile':
+			plan.append(Request(name, 'GET', '/rango/profile/{0}/'.format(rng.choice(usernames))))
+		else:
+			plan.append(Request(name, 'POST', '/rango/category/{0}/add_page/'.format(rng.choice(slugs)),
+				{'title': 'Benchmark page {0}'.format(i), 'url': 'http://example.com/bench/{0}'.format(i), 'views': 0}))
+	return plan
+
+def percentile(values, p):
+	# Nearest rank
+	if not values:
+		return None
+	values = sorted(values)
+	return values[max(int(round(p / 100.0 * len(values))) - 1, 0)]
+
+def summarize(samples, elapsed):
+	'''samples: [(name, seconds, status, queries)] -> {name: stats}, plus 'all' for the whole run.'''
+	by_name = defaultdict(list)
+	for sample in samples:
+		by_name[sample[0]].append(sample)
+		by_name['all'].append(sample)
+	summary = {}
+	for name, group in by_name.items():
+		latencies = [s[1] * 1000 for s in group]
+		queries = [s[3] for s in group if s[3] is not None]
+		summary[name] = {
+			'requests': len(group),
+			'errors': len([s for s in group if s[2] >= 400]),
+			'p50_ms': percentile(latencies, 50),
+			'p95_ms': percentile(latencies, 95),
+			'p99_ms': percentile(latencies, 99),
+			'throughput': len(group) / elapsed if elapsed else 0,
+			'mean_queries': float(sum(queries)) / len(queries) if queries else None,
+		}
+	return summary
+
+def run_threads(plan, concurrency, worker):
+	# Split the plan round robin over `concurrency` threads, each calling worker(requests, samples)
+	samples = []
+	lock = threading.Lock()
+
+	def run(requests):
+		results = []
+		try:
+			worker(requests, results)
+		finally:
+			# Every thread gets its own database connection, close it
+			connection.close()
+		with lock:
+			samples.extend(results)
+
+	threads = [threading.Thread(target=run, args=(plan[i::concurrency],)) for i in range(concurrency)]
+	started = time.time()
+	for thread in threads:
+		thread.start()
+	for thread in threads:
+		thread.join()
+	return summarize(samples, time.time() - started)
+
+def run_client(plan, concurrency):
+	'''Replay through the Django test client: no network, the view stack only. Counts queries.'''
+	def worker(requests, results):
+		client = Client()
+		client.login(username='user0', password=BENCHMARK_PASSWORD)
+		for request in requests:
+			with CaptureQueriesContext(connection) as queries:
+				started = time.time()
+				if request.method == 'POST':
+					response = client.post(request.path, request.data)
+				else:
+					response = client.get(request.path)
+				elapsed = time.time() - started
+			results.append((request.name, elapsed, response.status_code, len(queries)))
+	return run_threads(plan, concurrency, worker)
+
+class ThreadedWSGIServer(socketserver.ThreadingMixIn, WSGIServer):
+	daemon_threads = True
+
+class QuietRequestHandler(WSGIRequestHandler):
+
+	def log_message(self, *args):
+		pass
+
+def run_wsgi(plan, concurrency):
+	'''Replay over HTTP against a threaded WSGI server on localhost running this project.'''
+	server = ThreadedWSGIServer(('127.0.0.1', 0), QuietRequestHandler)
+	server.set_app(get_wsgi_application())
+	serving = threading.Thread(target=server.serve_forever)
+	serving.daemon = True
+	serving.start()
+	host, port = server.server_address
+
+	login = Client()
+	login.login(username='user0', password=BENCHMARK_PASSWORD)
+	cookie = '{0}={1}; {2}={3}'.format(settings.SESSION_COOKIE_NAME, login.cookies[settings.SESSION_COOKIE_NAME].value,
+		settings.CSRF_COOKIE_NAME, CSRF_TOKEN)
+
+	def worker(requests, results):
+		for request in requests:
+			# The host the test environment allows, as the test client sends
+			headers = {'Cookie': cookie, 'Host': 'testserver'}
+			body = None
+			if request.method == 'POST':
+				body = urlencode(request.data)
+				headers['Content-Type'] = 'application/x-www-form-urlencoded'
+				headers['X-CSRFToken'] = CSRF_TOKEN
+			started = time.time()
+			conn = http.client.HTTPConnection(host, port, timeout=30)
+			conn.request(request.method, request.path, body, headers)
+			response = conn.getresponse()
+			response.read()
+			conn.close()
+			results.append((request.name, time.time() - started, response.status, None))
+	try:
+		return run_threads(plan, concurrency, worker)
+	finally:
+		server.shutdown()
+		server.server_close()
+
+def compare(baseline, results, tolerance):
+	'''Regressions of results against baseline: p95 latency more than `tolerance` (a fraction)
+	slower, more errors or more queries than before. Both are {mode: {concurrency: {name: stats}}}.'''
+	regressions = []
+	for mode, levels in results.items():
+		for level, names in levels.items():
+			for name, stats in names.items():
+				before = baseline.get(mode, {}).get(level, {}).get(name)
+				if not before:
+					continue
+				# Failing fast is not getting faster
+				if stats['errors'] > before.get('errors', 0):
+					regressions.append('{0} x{1} {2}: {3} errors, was {4}'.format(
+						mode, level, name, stats['errors'], before.get('errors', 0)))
+				if before['p95_ms'] and stats['p95_ms'] > before['p95_ms'] * (1 + tolerance):
+					regressions.append('{0} x{1} {2}: p95 {3:.1f}ms, was {4:.1f}ms'.format(
+						mode, level, name, stats['p95_ms'], before['p95_ms']))
+				if before.get('mean_queries') is not None and stats.get('mean_queries') is not None \
+						and stats['mean_queries'] > before['mean_queries'] + 0.01:
+					regressions.append('{0} x{1} {2}: {3:.2f} queries per request, was {4:.2f}'.format(
+						mode, level, name, stats['mean_queries'], before['mean_queries']))
+	return regressions
+
+def load_baseline(path):
+	with open(path) as f:
+		return json.load(f)
+
+def save_baseline(path, results):
+	with open(path, 'w') as f:
+		json.dump(results, f, indent=2, sort_keys=True)
@@ -0,0 +1,105 @@
+from collections import defaultdict
+
+from django.db import connection
+from django.db.models import Count, F, Sum
+from django.utils import timezone
+from rango.models import Category, Page
+from rango import slugs
+
+# Keep IN (...) lists below SQLite's limit of 999 query parameters
+IN_CHUNK = 500
+
+# Category.page_count and Category.total_page_views are kept as running totals, so ranking or
+# showing categories by their pages never needs a GROUP BY over the page table.
+# Page saves and deletes adjust them through rango/signals.py, the click counter adds its
+# flushed views, and recompute() (manage.py recompute_category_stats) repairs any drift.
+# Whatever changes a category's pages also moves its updated_at on, as its page has changed.
+
+def page_created(page):
+	Category.objects.filter(id=page.category_id).update(
+		page_count=F('page_count') + 1, total_page_views=F('total_page_views') + page.views,
+		updated_at=timezone.now())
+	slugs.forget_categories([page.category_id])
+
+def page_deleted(page):
+	Category.objects.filter(id=page.category_id).update(
+		page_count=F('page_count') - 1, total_page_views=F('total_page_views') - page.views,
+		updated_at=timezone.now())
+	slugs.forget_categories([page.category_id])
+
+def page_changed(page, old_category_id, old_views):
+	'''Apply an edit of a page, given the category and views it had before it.'''
+	deltas = defaultdict(lambda: [0, 0])
+	deltas[old_category_id][0] -= 1
+	deltas[old_category_id][1] -= old_views
+	deltas[page.category_id][0] += 1
+	deltas[page.category_id][1] += page.views
+	apply_deltas(deltas)
+
+def selection_totals(pages):
+	'''The number of pages and their views, {category_id: (pages, views)}, of a queryset of pages.'''
+	rows = pages.order_by().values('category_id').annotate(pages=Count('id'), views=Sum('views'))
+	return dict((row['category_id'], (row['pages'], row['views'] or 0)) for row in rows)
+
+def apply_deltas(deltas):
+	'''Add {category_id: (pages, views)} to the totals of those categories, and move their
+	updated_at on (even when nothing adds up, the order of their pages may have changed).'''
+	by_delta = defaultdict(list)
+	for category_id, (pages, views) in deltas.items():
+		by_delta[pages, views].append(category_id)
+	now = timezone.now()
+	for (pages, views), category_ids in by_delta.items():
+		for i in range(0, len(category_ids), IN_CHUNK):
+			Category.objects.filter(id__in=category_ids[i:i + IN_CHUNK]).update(
+				page_count=F('page_count') + pages, total_page_views=F('total_page_views') + views, updated_at=now)
+	slugs.forget_categories(list(deltas))
+
+def add_page_views(counts):
+	'''Add flushed clicks, {page_id: clicks}, to the totals of the pages' categories.'''
+	if not counts:
+		return
+	by_category = defaultdict(int)
+	for page_id, category_id in Page.objects.filter(id__in=list(counts)).values_list('id', 'category_id'):
+		by_category[category_id] += counts[page_id]
+	# Categories that got the same number of clicks share one UPDATE statement
+	by_count = defaultdict(list)
+	for category_id, n in by_category.items():
+		by_count[n].append(category_id)
+	now = timezone.now()
+	for n, category_ids in by_count.items():
+		# More views reorder the category's pages, so its page has changed too
+		Category.objects.filter(id__in=category_ids).update(total_page_views=F('total_page_views') + n, updated_at=now)
+	slugs.forget_categories(list(by_category))
+
+def touch(category_ids):
+	now = timezone.now()
+	category_ids = list(category_ids)
+	for i in range(0, len(category_ids), IN_CHUNK):
+		Category.objects.filter(id__in=category_ids[i:i + IN_CHUNK]).update(updated_at=now)
+	slugs.forget_categories(category_ids)
+
+def recompute(category_ids=None):
+	'''Count the pages of the given categories (all of them by default) again, in one statement.
+	Returns the number of categories updated.'''
+	quote = connection.ops.quote_name
+	category = quote(Category._meta.db_table)
+	page = quote(Page._meta.db_table)
+	sql = ('UPDATE {category} SET '
+		'{page_count} = (SELECT COUNT(*) FROM {page} WHERE {page}.{fk} = {category}.{id}), '
+		'{total} = (SELECT COALESCE(SUM({page}.{views}), 0) FROM {page} WHERE {page}.{fk} = {category}.{id})').format(
+		category=category, page=page, id=quote('id'), fk=quote('category_id'), views=quote('views'),
+		page_count=quote('page_count'), total=quote('total_page_views'))
+	if category_ids is None:
+		slugs.slug_cache.clear()
+		with connection.cursor() as cursor:
+			cursor.execute(sql)
+			return cursor.rowcount
+	category_ids = list(category_ids)
+	slugs.forget_categories(category_ids)
+	updated = 0
+	with connection.cursor() as cursor:
+		for i in range(0, len(category_ids), IN_CHUNK):
+			chunk = category_ids[i:i + IN_CHUNK]
+			cursor.execute(sql + ' WHERE {0}.{1} IN ({2})'.format(category, quote('id'), ', '.join(['%s'] * len(chunk))), chunk)
+			updated += cursor.rowcount
+	return updated
@@ -0,0 +1,187 @@
+import atexit
+import logging
+import threading
+import time
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection, transaction, DatabaseError
+from django.db.models import F
+from django.utils import timezone
+from django.dispatch import Signal
+from rango.models import Page
+from rango import analytics, category_stats
+
+logger = logging.getLogger('rango.clicks')
+
+# Clicks are buffered per page and written back in batches, so the /goto/ redirect
+# never has to wait on (or fight over) the database write lock.
+FLUSH_SIZE = getattr(settings, 'RANGO_CLICK_FLUSH_SIZE', 100)
+FLUSH_INTERVAL = getattr(settings, 'RANGO_CLICK_FLUSH_INTERVAL', 10)
+URL_CACHE_TIMEOUT = getattr(settings, 'RANGO_PAGE_URL_CACHE_TIMEOUT', 60 * 60)
+
+# Every BufferedCounter, so they can all be flushed at exit
+counters = []
+
+# Sent after buffered clicks have been written back, with counts = {page_id: clicks}
+views_flushed = Signal(providing_args=['counts'])
+
+def page_url_key(page_id):
+	return 'rango:page_url:{0}'.format(page_id)
+
+def get_page_url(page_id):
+	# Return the url to send a page's visitors to, or None if there is no such page: where the
+	# page's url redirects to, when check_links has found that out, saving them the extra hop.
+	# Only a cache miss reads from the database, and it never writes.
+	key = page_url_key(page_id)
+	url = cache.get(key)
+	if url is None:
+		try:
+			url, final_url = Page.objects.values_list('url', 'final_url').get(id=page_id)
+		except Page.DoesNotExist:
+			return None
+		url = final_url or url
+		cache.set(key, url, URL_CACHE_TIMEOUT)
+	return url
+
+def forget_page_url(page_id):
+	cache.delete(page_url_key(page_id))
+
+class BufferedCounter(object):
+	'''Accumulates increments per id in memory and writes them back in batches, in one transaction.
+	A flush happens once flush_size increments are pending, and a flusher thread writes back
+	whatever is left at most flush_interval seconds after the last flush, even if no more come in.
+	Subclasses say how to write: write(pending) with {id: n}, then flushed(pending) once committed.'''
+
+	def __init__(self, flush_size=FLUSH_SIZE, flush_interval=FLUSH_INTERVAL):
+		self.flush_size = flush_size
+		self.flush_interval = flush_interval
+		self.lock = threading.Lock()
+		self.pending = defaultdict(int)
+		self.pending_total = 0
+		self.last_flush = time.time()
+		self.flushing = False
+		self.flusher = None
+		counters.append(self)
+
+	def record(self, key, n=1):
+		with self.lock:
+			self.pending[key] += n
+			self.pending_total += abs(n)
+			due = not self.flushing and self.pending_total >= self.flush_size
+			if due:
+				self.flushing = True
+			# Started on first use, and again in a process forked from this one (threads don't survive a fork)
+			if self.flusher is None or not self.flusher.is_alive():
+				self.flusher = threading.Thread(target=self.flush_periodically,
+					name='rango-flush-{0}'.format(self.__class__.__name__))
+				self.flusher.daemon = True
+				self.flusher.start()
+		if due:
+			# Write back from a worker thread so the request itself never touches the database
+			threading.Thread(target=self.background_flush).start()
+
+	def flush_periodically(self):
+		# The flusher thread: flush_interval seconds after the last flush, write back what is pending
+		while True:
+			time.sleep(max(self.last_flush + self.flush_interval - time.time(), 0.01))
+			with self.lock:
+				due = (not self.flushing and self.pending_total and
+					time.time() - self.last_flush >= self.flush_interval)
+				if due:
+					self.flushing = True
+				elif not self.pending_total:
+					# Nothing to write, so the next check is a whole interval from now
+					self.last_flush = time.time()
+			if due:
+				try:
+					self.background_flush()
+				except Exception:
+					# Put back by flush(), so tried again next time round
+					logger.exception('Could not write back buffered counts')
+
+	def background_flush(self):
+		try:
+			self.flush()
+		finally:
+			self.flushing = False
+			# The worker thread got its own connection, don't leave it lying around
+			connection.close()
+
+	def take(self):
+		# Swap the buffer out under the lock so increments keep coming in while we write
+		with self.lock:
+			pending = self.pending
+			self.pending = defaultdict(int)
+			self.pending_total = 0
+			self.last_flush = time.time()
+		return pending
+
+	def peek(self, key):
+		with self.lock:
+			return self.pending.get(key, 0)
+
+	def flush(self):
+		# Increments that cancelled out (a like and an unlike) need no write at all
+		pending = dict((key, n) for key, n in self.take().items() if n)
+		if not pending:
+			return {}
+		try:
+			with transaction.atomic():
+				self.write(pending)
+		except Exception:
+			# Put them back so they are retried on the next flush rather than lost
+			with self.lock:
+				for key, n in pending.items():
+					self.pending[key] += n
+					self.pending_total += abs(n)
+			raise
+		self.flushed(pending)
+		return pending
+
+	def write(self, pending):
+		raise NotImplementedError
+
+	def flushed(self, pending):
+		pass
+
+def by_count(pending):
+	# Rows that got the same increment share one UPDATE statement: {n: [ids]}
+	groups = defaultdict(list)
+	for key, n in pending.items():
+		groups[n].append(key)
+	return groups
+
+class ClickCounter(BufferedCounter):
+	'''Page clicks, flushed as atomic F('views') + n updates.'''
+
+	def write(self, pending):
+		now = timezone.now()
+		for n, page_ids in by_count(pending).items():
+			Page.objects.filter(id__in=page_ids).update(views=F('views') + n, updated_at=now)
+		# In the same transaction, so a category's total_page_views always matches its pages,
+		# and the pages' view counts over time match their totals
+		category_stats.add_page_views(pending)
+		analytics.record(pending, now)
+
+	def flushed(self, pending):
+		views_flushed.send(sender=self.__class__, counts=pending)
+
+click_counter = ClickCounter()
+
+def record_click(page_id):
+	click_counter.record(page_id)
+
+def flush_all():
+	for counter in counters:
+		counter.flush()
+
+def flush_on_exit():
+	try:
+		flush_all()
+	except DatabaseError:
+		logger.exception('Could not write back buffered counts at exit')
+
+# Whatever is still buffered when the process exits gets written back
+atexit.register(flush_on_exit)
@@ -0,0 +1,56 @@
+import calendar
+import hashlib
+
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date, quote_etag
+from rango.versions import get_version, changed_at
+
+# Validators for conditional GETs. They are worked out from what a view has to look up anyway
+# (a category row, the in-memory leaderboards) and the version of the sidebar's category list,
+# so a request whose If-None-Match/If-Modified-Since still matches gets a 304 without any
+# template rendering. Pages differ per user, so the user is part of every ETag, and only
+# anonymous responses, which are the same for everybody, get a Last-Modified.
+
+def make_etag(*parts):
+	return hashlib.md5(repr(parts).encode('utf-8')).hexdigest()
+
+def user_key(request):
+	return request.user.pk if request.user.is_authenticated() else None
+
+def timestamp(dt):
+	return calendar.timegm(dt.utctimetuple())
+
+def category_validators(request, category):
+	'''(etag, last_modified) of show_category for `category` (None if there is no such category).'''
+	if category is None:
+		return make_etag('category', None, get_version('category'), user_key(request)), None
+	etag = make_etag('category', category.id, category.updated_at.isoformat(), get_version('category'),
+		request.GET.get('after', ''), user_key(request))
+	last_modified = None
+	if not request.user.is_authenticated():
+		# The category and its pages, and the sidebar list of categories
+		last_modified = max(timestamp(category.updated_at), changed_at('category'))
+	return etag, last_modified
+
+def index_validators(request, categories, pages, visits=None):
+	'''(etag, last_modified) of the index for the given leaderboard rows.'''
+	etag = make_etag('index', [(c['name'], c['slug']) for c in categories], [(p['title'], p['url']) for p in pages],
+		get_version('category'), user_key(request), visits)
+	# The leaderboards can change without anything getting newer (a row is deleted and an older
+	# one takes its place), so there is no safe Last-Modified here: the ETag does it all
+	return etag, None
+
+def not_modified(request, etag, last_modified=None):
+	'''A 304 response if the request's validators still match, else None.'''
+	# If-None-Match is compared with quoted ETags, the way set_validators sends them
+	return get_conditional_response(request, etag=quote_etag(etag), last_modified=last_modified)
+
+def set_validators(request, response, etag, last_modified=None):
+	response['ETag'] = quote_etag(etag)
+	if last_modified:
+		response['Last-Modified'] = http_date(last_modified)
+	# Browsers may keep the page, but have to check it is still current every time
+	patch_cache_control(response, no_cache=True)
+	if request.user.is_authenticated():
+		patch_cache_control(response, private=True)
+	return response
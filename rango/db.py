@@ -0,0 +1,66 @@
+import threading
+
+from django.conf import settings
+from django.core.signals import request_started
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+
+# Database connection tuning and routing, set up from the database profile in settings.py.
+
+# PRAGMAs run on every new SQLite connection: by default WAL, so readers no longer wait for
+# writers, with synchronous=NORMAL (safe in WAL mode), a busy timeout instead of an instant
+# "database is locked", and memory mapped reads
+SQLITE_PRAGMAS = getattr(settings, 'RANGO_SQLITE_PRAGMAS', {})
+# Check persistent connections still work before a request uses them
+DB_HEALTH_CHECKS = getattr(settings, 'RANGO_DB_HEALTH_CHECKS', False)
+REPLICA = 'replica'
+
+@receiver(connection_created)
+def configure_sqlite(sender, connection, **kwargs):
+	if connection.vendor != 'sqlite' or not SQLITE_PRAGMAS:
+		return
+	# On the raw sqlite3 connection, so they aren't counted as queries of whatever request opened it
+	for pragma, value in SQLITE_PRAGMAS.items():
+		connection.connection.execute('PRAGMA {0} = {1}'.format(pragma, value))
+
+@receiver(request_started)
+def check_connections(sender, **kwargs):
+	# A connection kept open between requests (CONN_MAX_AGE) can have been dropped by the
+	# server or a pooler in the meantime; find out now rather than with the request's first query
+	if not DB_HEALTH_CHECKS:
+		return
+	for connection in connections.all():
+		if connection.connection is not None and not connection.is_usable():
+			connection.close()
+
+# Requests that have written stick to the primary for the rest of the request, so they read
+# their own writes rather than a replica that may not have caught up yet
+pinned = threading.local()
+
+@receiver(request_started)
+def unpin(sender, **kwargs):
+	pinned.primary = False
+
+class PrimaryReplicaRouter(object):
+	'''Sends reads of rango's tables to the 'replica' database, when there is one, and
+	everything else - writes, and the auth and session tables - to 'default'.'''
+
+	def db_for_read(self, model, **hints):
+		if REPLICA not in settings.DATABASES or getattr(pinned, 'primary', False):
+			return 'default'
+		if model._meta.app_label != 'rango':
+			# Logins and sessions have to see what the previous request wrote
+			return 'default'
+		return REPLICA
+
+	def db_for_write(self, model, **hints):
+		pinned.primary = True
+		return 'default'
+
+	def allow_relation(self, obj1, obj2, **hints):
+		# Both databases hold the same data
+		return True
+
+	def allow_migrate(self, db, app_label, model_name=None, **hints):
+		return db == 'default'
@@ -0,0 +1,74 @@
+import csv
+import io
+import json
+import zlib
+
+from rango.models import Category, Page
+
+# Dumps categories and pages in the format manage.py import_catalogue reads (JSONL or CSV,
+# optionally gzipped), a chunk at a time, so a catalogue of any size is exported in constant
+# memory and the first bytes go out before the last rows have been read.
+# Rows are read in keyset chunks (id > the last id seen) rather than with iterator(): on SQLite
+# that reads the whole result up front, and elsewhere it holds one cursor open for the whole export.
+CHUNK_SIZE = 2000
+
+FORMATS = ('csv', 'jsonl')
+CSV_FIELDS = ('category', 'title', 'url', 'views', 'likes')
+CONTENT_TYPES = {'csv': 'text/csv; charset=utf-8', 'jsonl': 'application/x-ndjson; charset=utf-8'}
+
+def keyset_chunks(queryset, fields, chunk_size=CHUNK_SIZE):
+	'''Lists of value tuples of `fields` (the first must be 'id'), in id order, chunk_size at a time.'''
+	last_id = 0
+	while True:
+		chunk = list(queryset.filter(id__gt=last_id).order_by('id').values_list(*fields)[:chunk_size])
+		if not chunk:
+			return
+		yield chunk
+		last_id = chunk[-1][0]
+
+def record_chunks(categories=True, pages=True, chunk_size=CHUNK_SIZE):
+	# Categories first, so a file loaded back in order has every page's category before its pages
+	if categories:
+		for chunk in keyset_chunks(Category.objects.all(), ('id', 'name', 'views', 'likes'), chunk_size):
+			yield [{'category': name, 'views': views, 'likes': likes} for _, name, views, likes in chunk]
+	if pages:
+		for chunk in keyset_chunks(Page.objects.all(), ('id', 'category__name', 'title', 'url', 'views'), chunk_size):
+			yield [{'category': category, 'title': title, 'url': url, 'views': views}
+				for _, category, title, url, views in chunk]
+
+def encode_csv(chunks):
+	out = io.StringIO()
+	writer = csv.DictWriter(out, CSV_FIELDS)
+	writer.writeheader()
+	for records in chunks:
+		writer.writerows(records)
+		yield out.getvalue().encode('utf-8')
+		out.seek(0)
+		out.truncate()
+	# Nothing to export is still a valid (header only) file
+	if out.tell():
+		yield out.getvalue().encode('utf-8')
+
+def encode_jsonl(chunks):
+	for records in chunks:
+		yield ''.join(json.dumps(record, sort_keys=True) + '\n' for record in records).encode('utf-8')
+
+def gzipped(blocks):
+	# A gzip stream compressed as it goes (wbits 16 + MAX_WBITS writes the gzip header and trailer)
+	compressor = zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+	for block in blocks:
+		data = compressor.compress(block)
+		if data:
+			yield data
+	yield compressor.flush()
+
+def export(fmt='jsonl', categories=True, pages=True, gzip=False, chunk_size=CHUNK_SIZE):
+	'''The export as an iterator of bytes, e.g. for a StreamingHttpResponse or a file.'''
+	if fmt not in FORMATS:
+		raise ValueError('Unknown export format {0!r}'.format(fmt))
+	chunks = record_chunks(categories, pages, chunk_size)
+	blocks = encode_csv(chunks) if fmt == 'csv' else encode_jsonl(chunks)
+	return gzipped(blocks) if gzip else blocks
+
+def filename(fmt, gzip=False):
+	return 'rango-catalogue.{0}{1}'.format(fmt, '.gz' if gzip else '')
@@ -0,0 +1,215 @@
+import time
+from collections import defaultdict
+
+from django.db import transaction
+from django.db.models import Case, F, Value, When
+from django.template.defaultfilters import slugify
+from django.utils import timezone
+from rango.models import Category, Page
+from rango import category_stats, signals
+
+# Loads categories and pages in batches: every batch is a handful of queries inside one
+# transaction, instead of a get_or_create and a save for every row.
+# Rows are matched to what is already in the database the way populate_rango always did it,
+# categories by name and pages by (category, title); a row seen twice is only loaded once.
+
+# Keep IN (...) lists below SQLite's limit of 999 query parameters
+IN_CHUNK = 500
+
+def chunks(items, size=IN_CHUNK):
+	items = list(items)
+	for i in range(0, len(items), size):
+		yield items[i:i + size]
+
+def update_rows(model, values_by_id, **common):
+	'''Write {id: {field: value}} back with one UPDATE per chunk of rows, each field set by a
+	CASE over the ids (a row with no value for a field keeps its own). `common` is set on every row.'''
+	fields = sorted(set(field for values in values_by_id.values() for field in values))
+	# An id and a value per field per row, and the id again in the IN (...): keep under 999
+	size = max(1, (IN_CHUNK * 2 - 100) // (1 + 2 * len(fields)))
+	for chunk in chunks(values_by_id, size):
+		updates = dict(common)
+		for field in fields:
+			whens = [When(id=row_id, then=Value(values_by_id[row_id][field])) for row_id in chunk
+				if field in values_by_id[row_id]]
+			if whens:
+				updates[field] = Case(*whens, default=F(field), output_field=model._meta.get_field(field))
+		model.objects.filter(id__in=chunk).update(**updates)
+
+class CatalogueImporter(object):
+
+	def __init__(self, batch_size=1000, progress=None):
+		self.batch_size = batch_size
+		# Called with the stats after every batch, e.g. to report throughput
+		self.progress = progress
+		self.category_ids = {}
+		self.seen_categories = set()
+		self.seen_pages = set()
+		self.skipped_categories = set()
+		self.categories = {}
+		self.pages = {}
+		self.updated_page_ids = []
+		self.page_category_ids = set()
+		self.started = time.time()
+		self.stats = {
+			'rows': 0,
+			'categories_created': 0,
+			'categories_updated': 0,
+			'pages_created': 0,
+			'pages_updated': 0,
+			'duplicates': 0,
+			'skipped': 0,
+		}
+
+	def add_category(self, name, views=None, likes=None):
+		self.stats['rows'] += 1
+		if name in self.seen_categories:
+			self.stats['duplicates'] += 1
+			return
+		self.seen_categories.add(name)
+		self.categories[name] = (views, likes)
+		self.maybe_flush()
+
+	def add_page(self, category, title, url, views=0):
+		self.stats['rows'] += 1
+		key = (category, title)
+		if key in self.seen_pages:
+			self.stats['duplicates'] += 1
+			return
+		self.seen_pages.add(key)
+		self.pages[key] = (url, views or 0)
+		self.maybe_flush()
+
+	def add(self, record):
+		# A record with a title is a page, anything else describes a category
+		if record.get('title'):
+			self.add_page(record['category'], record['title'], record['url'], int(record.get('views') or 0))
+		else:
+			views, likes = record.get('views'), record.get('likes')
+			self.add_category(record['category'],
+				int(views) if views not in (None, '') else None,
+				int(likes) if likes not in (None, '') else None)
+
+	def maybe_flush(self):
+		if len(self.categories) + len(self.pages) >= self.batch_size:
+			self.flush()
+
+	def flush(self):
+		if not self.categories and not self.pages:
+			return
+		with transaction.atomic():
+			self.write_categories(self.categories)
+			self.write_pages(self.pages)
+		self.categories = {}
+		self.pages = {}
+		if self.progress:
+			self.progress(self.report())
+
+	def write_categories(self, records):
+		names = [name for name in records if name not in self.category_ids]
+		for chunk in chunks(names):
+			self.category_ids.update(Category.objects.filter(name__in=chunk).values_list('name', 'id'))
+
+		new = []
+		updates = {}
+		for name, (views, likes) in records.items():
+			if name not in self.category_ids:
+				# bulk_create skips Category.save, so set the slug the way it would
+				new.append(Category(name=name, slug=slugify(name), views=views or 0, likes=likes or 0))
+				continue
+			values = {}
+			if views is not None:
+				values['views'] = views
+			if likes is not None:
+				values['likes'] = likes
+			if values:
+				updates[self.category_ids[name]] = values
+		if updates:
+			update_rows(Category, updates, updated_at=timezone.now())
+			self.stats['categories_updated'] += len(updates)
+		new = self.without_taken_slugs(new)
+		if new:
+			Category.objects.bulk_create(new)
+			# SQLite doesn't hand back the ids of bulk created rows, so read them back
+			for chunk in chunks([c.name for c in new]):
+				self.category_ids.update(Category.objects.filter(name__in=chunk).values_list('name', 'id'))
+			self.stats['categories_created'] += len(new)
+
+	def without_taken_slugs(self, categories):
+		# Different names can slugify the same way ('C++' and 'C'), but slugs are unique.
+		# Rather than fail the whole batch, skip the later name (and its pages).
+		taken = set()
+		for chunk in chunks([c.slug for c in categories]):
+			taken.update(Category.objects.filter(slug__in=chunk).values_list('slug', flat=True))
+		kept = []
+		for category in categories:
+			if category.slug in taken:
+				self.skipped_categories.add(category.name)
+				self.stats['skipped'] += 1
+			else:
+				taken.add(category.slug)
+				kept.append(category)
+		return kept
+
+	def write_pages(self, records):
+		# Pages may name categories that were never described, those get created with no views or likes
+		missing = set(category for category, title in records
+			if category not in self.category_ids and category not in self.skipped_categories)
+		if missing:
+			self.write_categories(dict((name, (None, None)) for name in missing))
+
+		keys = {}
+		for (category, title), (url, views) in records.items():
+			if category in self.skipped_categories:
+				self.stats['skipped'] += 1
+			else:
+				keys[(self.category_ids[category], title)] = (url, views)
+		titles_by_category = defaultdict(set)
+		for category_id, title in keys:
+			titles_by_category[category_id].add(title)
+		self.page_category_ids.update(titles_by_category)
+		existing = {}
+		for category_chunk in chunks(titles_by_category, IN_CHUNK // 2):
+			titles = set().union(*(titles_by_category[category_id] for category_id in category_chunk))
+			for title_chunk in chunks(titles, IN_CHUNK // 2):
+				rows = Page.objects.filter(category_id__in=category_chunk, title__in=title_chunk).values_list('category_id', 'title', 'id', 'url')
+				for category_id, title, page_id, old_url in rows:
+					existing[(category_id, title)] = (page_id, old_url)
+
+		new = []
+		updates = {}
+		moved = []
+		for (category_id, title), (url, views) in keys.items():
+			if (category_id, title) in existing:
+				page_id, old_url = existing[(category_id, title)]
+				updates[page_id] = {'url': url, 'views': views}
+				if url != old_url:
+					moved.append(page_id)
+			else:
+				new.append(Page(category_id=category_id, title=title, url=url, views=views))
+		if updates:
+			update_rows(Page, updates, updated_at=timezone.now())
+			self.updated_page_ids.extend(updates)
+			self.stats['pages_updated'] += len(updates)
+		for chunk in chunks(moved):
+			# What check_links found out was about the old url
+			Page.objects.filter(id__in=chunk).update(final_url='', link_status=None, link_etag='',
+				link_last_modified='', checked_at=None)
+		if new:
+			Page.objects.bulk_create(new)
+			self.stats['pages_created'] += len(new)
+
+	def report(self):
+		stats = dict(self.stats)
+		stats['seconds'] = time.time() - self.started
+		stats['rows_per_second'] = stats['rows'] / stats['seconds'] if stats['seconds'] else 0
+		return stats
+
+	def finish(self):
+		self.flush()
+		# bulk_create and update() bypass the model signals, so count the pages of the categories
+		# that got some again, and bring rango's caches back in step
+		category_stats.recompute(self.page_category_ids)
+		category_stats.touch(self.page_category_ids)
+		signals.catalogue_rewritten(self.updated_page_ids)
+		return self.report()
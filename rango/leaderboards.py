@@ -0,0 +1,93 @@
+import threading
+import time
+
+from django.conf import settings
+from rango.models import Category, Page
+
+LEADERBOARD_SIZE = getattr(settings, 'RANGO_LEADERBOARD_SIZE', 5)
+LEADERBOARD_MAX_AGE = getattr(settings, 'RANGO_LEADERBOARD_MAX_AGE', 60)
+
+class Leaderboard(object):
+	'''The top `size` rows of a model by one score column, kept in memory.
+	It is updated in place as scores change and rebuilt from the (indexed) table when it is
+	older than max_age seconds, or when a change means it can no longer tell who belongs in it.'''
+
+	def __init__(self, model, score, fields, size=LEADERBOARD_SIZE, max_age=LEADERBOARD_MAX_AGE):
+		self.model = model
+		self.score = score
+		self.fields = ('id', score) + tuple(f for f in fields if f not in ('id', score))
+		self.size = size
+		self.max_age = max_age
+		self.lock = threading.Lock()
+		self.entries = None
+		self.built_at = 0
+
+	def sort_key(self, row):
+		return (-row[self.score], row['id'])
+
+	def rebuild(self):
+		rows = list(self.model.objects.order_by('-' + self.score, 'id').values(*self.fields)[:self.size])
+		with self.lock:
+			self.entries = rows
+			self.built_at = time.time()
+
+	def invalidate(self):
+		with self.lock:
+			self.entries = None
+
+	def top(self):
+		with self.lock:
+			entries = self.entries
+			fresh = entries is not None and time.time() - self.built_at < self.max_age
+		if not fresh:
+			self.rebuild()
+			entries = self.entries
+		return list(entries)
+
+	def update(self, row):
+		# row is a dict with at least every field in self.fields, e.g. from .values()
+		row = dict((f, row[f]) for f in self.fields)
+		with self.lock:
+			if self.entries is None:
+				return
+			entries = [e for e in self.entries if e['id'] != row['id']]
+			old = [e for e in self.entries if e['id'] == row['id']]
+			if old and row[self.score] < old[0][self.score] and len(self.entries) >= self.size:
+				# A row in a full board lost score, someone outside the board may now outrank it
+				self.entries = None
+				return
+			entries.append(row)
+			entries.sort(key=self.sort_key)
+			self.entries = entries[:self.size]
+
+	def update_instance(self, instance):
+		self.update(dict((f, getattr(instance, f)) for f in self.fields))
+
+	def discard(self, pk):
+		with self.lock:
+			if self.entries is not None and any(e['id'] == pk for e in self.entries):
+				# Whoever takes the free spot has to come from the table
+				self.entries = None
+
+category_board = Leaderboard(Category, 'likes', ('name', 'slug'))
+page_board = Leaderboard(Page, 'views', ('title', 'url'))
+
+def top_categories():
+	return category_board.top()
+
+def top_pages():
+	return page_board.top()
+
+def refresh_pages(page_ids):
+	# Clicks are flushed as F() updates, so read the new totals back for the boards
+	if page_board.entries is None:
+		return
+	for row in Page.objects.filter(id__in=page_ids).values(*page_board.fields):
+		page_board.update(row)
+
+def refresh_categories(category_ids):
+	# Likes are flushed as F() updates too
+	if category_board.entries is None:
+		return
+	for row in Category.objects.filter(id__in=category_ids).values(*category_board.fields):
+		category_board.update(row)
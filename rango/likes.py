@@ -0,0 +1,55 @@
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.dispatch import Signal
+from rango.clicks import BufferedCounter, by_count
+from rango.models import Category, CategoryLike
+from rango.ratelimit import RateLimiter
+from rango import slugs
+
+# Users' likes of categories. Who liked what is a CategoryLike row (one per user and category,
+# the unique constraint makes a double like a no-op), while the totals in Category.likes are
+# buffered and written back in batches like page clicks, so a category everybody is liking
+# at once costs one UPDATE per flush instead of a fight over its row.
+FLUSH_SIZE = getattr(settings, 'RANGO_LIKE_FLUSH_SIZE', 50)
+FLUSH_INTERVAL = getattr(settings, 'RANGO_LIKE_FLUSH_INTERVAL', 5)
+# Likes and unlikes per user, and per IP address, in a sliding window of this many seconds
+RATE_LIMIT = getattr(settings, 'RANGO_LIKE_RATE_LIMIT', (10, 60))
+
+# Sent after buffered likes have been written back, with counts = {category_id: change in likes}
+likes_flushed = Signal(providing_args=['counts'])
+
+class LikeCounter(BufferedCounter):
+
+	def write(self, pending):
+		for n, category_ids in by_count(pending).items():
+			Category.objects.filter(id__in=category_ids).update(likes=F('likes') + n)
+		slugs.forget_categories(list(pending))
+
+	def flushed(self, pending):
+		likes_flushed.send(sender=self.__class__, counts=pending)
+
+like_counter = LikeCounter(FLUSH_SIZE, FLUSH_INTERVAL)
+rate_limiter = RateLimiter(*RATE_LIMIT)
+
+def like(user, category_id):
+	'''Returns whether this was a new like. The total goes up through rango/signals.py.'''
+	try:
+		with transaction.atomic():
+			CategoryLike.objects.create(user=user, category_id=category_id)
+	except IntegrityError:
+		return False
+	return True
+
+def unlike(user, category_id):
+	# Deleting row by row sends post_delete, which takes the like off the total
+	deleted = CategoryLike.objects.filter(user=user, category_id=category_id).delete()[0]
+	return bool(deleted)
+
+def liked(user, category_id):
+	return CategoryLike.objects.filter(user=user, category_id=category_id).exists()
+
+def likes(category_id):
+	# What is in the table plus what is still buffered
+	stored = Category.objects.filter(id=category_id).values_list('likes', flat=True).first() or 0
+	return stored + like_counter.peek(category_id)
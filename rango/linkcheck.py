@@ -0,0 +1,256 @@
+import asyncio
+import html
+import ipaddress
+import re
+import socket
+import ssl
+import time
+from urllib.parse import urljoin, urlsplit
+
+from django.conf import settings
+from django.db.models import Q
+from django.utils import timezone
+from rango import clicks
+from rango.models import Page
+from rango.tasks import task
+
+# Checks that pages' urls still work, and notes where they redirect to and what their titles are.
+# It is a small HTTP/1.1 client on asyncio streams: many urls are checked at once (CONCURRENCY),
+# but only a few at a time per host (PER_HOST), no faster than one every HOST_DELAY seconds,
+# and a url that sent an ETag or Last-Modified last time is asked for with If-None-Match /
+# If-Modified-Since. Run by `manage.py check_links`, and as a background task for new pages.
+# Anyone can add a page, so the urls are untrusted: hosts are resolved first, and only public
+# addresses are connected to (never localhost, the private network or cloud metadata services),
+# the same for every url a redirect leads to.
+CONCURRENCY = getattr(settings, 'RANGO_LINK_CHECK_CONCURRENCY', 20)
+PER_HOST = getattr(settings, 'RANGO_LINK_CHECK_PER_HOST', 2)
+HOST_DELAY = getattr(settings, 'RANGO_LINK_CHECK_HOST_DELAY', 0.5)
+TIMEOUT = getattr(settings, 'RANGO_LINK_CHECK_TIMEOUT', 10)
+MAX_REDIRECTS = 5
+# Enough of the body to find the <title> in
+MAX_BODY = 64 * 1024
+USER_AGENT = 'rango-linkcheck/1.0'
+
+REDIRECTS = (301, 302, 303, 307, 308)
+TITLE_RE = re.compile(rb'<title[^>]*>(.*?)</title', re.IGNORECASE | re.DOTALL)
+CHARSET_RE = re.compile(r'charset=["\']?([\w-]+)', re.IGNORECASE)
+
+class LinkError(Exception):
+	pass
+
+class Result(object):
+
+	def __init__(self, status=None, final_url='', title=None, etag='', last_modified='', error=''):
+		self.status = status
+		self.final_url = final_url
+		# None when the body wasn't fetched (a 304, an error), so the stored title is kept
+		self.title = title
+		self.etag = etag
+		self.last_modified = last_modified
+		self.error = error
+
+	@property
+	def ok(self):
+		return self.status is not None and (200 <= self.status < 300 or self.status == 304)
+
+class HostLimiter(object):
+	'''At most per_host requests in flight to any one host, started at least delay seconds apart.'''
+
+	def __init__(self, per_host=PER_HOST, delay=HOST_DELAY):
+		self.per_host = per_host
+		self.delay = delay
+		self.semaphores = {}
+		self.next_start = {}
+
+	async def acquire(self, host):
+		semaphore = self.semaphores.setdefault(host, asyncio.Semaphore(self.per_host))
+		await semaphore.acquire()
+		now = time.monotonic()
+		start = max(now, self.next_start.get(host, now))
+		self.next_start[host] = start + self.delay
+		if start > now:
+			await asyncio.sleep(start - now)
+
+	def release(self, host):
+		self.semaphores[host].release()
+
+def is_public(address):
+	address = ipaddress.ip_address(address)
+	return address.is_global and not (address.is_multicast or address.is_reserved or address.is_unspecified)
+
+async def resolve(host, port):
+	'''The address to connect to for host. Raises LinkError if any address it has isn't public.'''
+	infos = await asyncio.get_event_loop().getaddrinfo(host, port, type=socket.SOCK_STREAM)
+	if not infos:
+		raise LinkError('{0} has no address'.format(host))
+	# Read when used rather than at import, so tests can check against a server on localhost
+	if not getattr(settings, 'RANGO_LINK_CHECK_ALLOW_PRIVATE', False):
+		for info in infos:
+			# An IPv6 address may have a %scope on the end
+			address = info[4][0].split('%')[0]
+			if not is_public(address):
+				raise LinkError('{0} is not a public address ({1})'.format(host, address))
+	return infos[0][4][0]
+
+async def fetch(url, headers, timeout=TIMEOUT):
+	'''One GET, no redirects followed: (status, {header: value}, first MAX_BODY bytes of the body).'''
+	parts = urlsplit(url)
+	if parts.scheme not in ('http', 'https') or not parts.hostname:
+		raise LinkError('not an http(s) url')
+	port = parts.port or (443 if parts.scheme == 'https' else 80)
+	context = ssl.create_default_context() if parts.scheme == 'https' else None
+	# Connecting to the address that was checked, not the name, which could resolve differently the second time
+	address = await asyncio.wait_for(resolve(parts.hostname, port), timeout)
+	reader, writer = await asyncio.wait_for(
+		asyncio.open_connection(address, port, ssl=context,
+			server_hostname=parts.hostname if context else None), timeout)
+	try:
+		path = parts.path or '/'
+		if parts.query:
+			path += '?' + parts.query
+		host = parts.hostname if not parts.port else '{0}:{1}'.format(parts.hostname, parts.port)
+		lines = ['GET {0} HTTP/1.1'.format(path), 'Host: {0}'.format(host), 'User-Agent: {0}'.format(USER_AGENT),
+			'Accept: text/html,*/*;q=0.8', 'Accept-Encoding: identity', 'Connection: close']
+		lines += ['{0}: {1}'.format(name, value) for name, value in headers.items()]
+		writer.write(('\r\n'.join(lines) + '\r\n\r\n').encode('latin-1'))
+		return await asyncio.wait_for(read_response(reader), timeout)
+	finally:
+		writer.close()
+
+async def read_response(reader):
+	status_line = (await reader.readline()).decode('latin-1')
+	try:
+		status = int(status_line.split()[1])
+	except (IndexError, ValueError):
+		raise LinkError('bad status line {0!r}'.format(status_line[:80]))
+	response_headers = {}
+	while True:
+		line = (await reader.readline()).decode('latin-1').strip()
+		if not line:
+			break
+		name, _, value = line.partition(':')
+		response_headers[name.strip().lower()] = value.strip()
+	body = b''
+	if status not in REDIRECTS and status != 304 and 'html' in response_headers.get('content-type', 'text/html'):
+		if response_headers.get('transfer-encoding', '').lower() == 'chunked':
+			while len(body) < MAX_BODY:
+				size = int((await reader.readline()).split(b';')[0].strip() or b'0', 16)
+				if not size:
+					break
+				body += await reader.readexactly(size)
+				await reader.readline()
+		else:
+			# read() returns whatever has arrived so far, the title may be in a later packet
+			while len(body) < MAX_BODY:
+				data = await reader.read(MAX_BODY - len(body))
+				if not data:
+					break
+				body += data
+	return status, response_headers, body[:MAX_BODY]
+
+def parse_title(body, content_type):
+	match = TITLE_RE.search(body)
+	if not match:
+		return ''
+	charset = CHARSET_RE.search(content_type or '')
+	try:
+		title = match.group(1).decode(charset.group(1) if charset else 'utf-8', 'replace')
+	except LookupError:
+		title = match.group(1).decode('utf-8', 'replace')
+	return ' '.join(html.unescape(title).split())[:128]
+
+async def check(url, validators, limiter, timeout=TIMEOUT):
+	'''Follow url's redirects and return a Result. validators are (final_url, etag, last_modified)
+	from the last check; the conditional headers are only sent to the url they came from.'''
+	old_final_url, etag, last_modified = validators
+	try:
+		for hop in range(MAX_REDIRECTS + 1):
+			headers = {}
+			if url == (old_final_url or url):
+				if etag:
+					headers['If-None-Match'] = etag
+				if last_modified:
+					headers['If-Modified-Since'] = last_modified
+			host = urlsplit(url).hostname
+			await limiter.acquire(host)
+			try:
+				status, response_headers, body = await fetch(url, headers, timeout)
+			finally:
+				limiter.release(host)
+			if status in REDIRECTS and response_headers.get('location'):
+				url = urljoin(url, response_headers['location'])
+				continue
+			if status == 304:
+				return Result(status, url, None, etag, last_modified)
+			title = parse_title(body, response_headers.get('content-type')) if 200 <= status < 300 else None
+			return Result(status, url, title, response_headers.get('etag', '')[:128],
+				response_headers.get('last-modified', '')[:64])
+		return Result(error='too many redirects')
+	except asyncio.TimeoutError:
+		return Result(error='timed out')
+	except (OSError, LinkError, ValueError, asyncio.IncompleteReadError) as e:
+		return Result(error=str(e) or e.__class__.__name__)
+
+async def check_all(pages, concurrency=CONCURRENCY, limiter=None, timeout=TIMEOUT):
+	'''pages: [(id, url, (final_url, etag, last_modified))] -> {id: Result}'''
+	limiter = limiter or HostLimiter()
+	semaphore = asyncio.Semaphore(concurrency)
+
+	async def one(page_id, url, validators):
+		async with semaphore:
+			return page_id, await check(url, validators, limiter, timeout)
+
+	results = await asyncio.gather(*[one(*page) for page in pages])
+	return dict(results)
+
+def pages_to_check(checked_before=None, category=None):
+	pages = Page.objects.all()
+	if checked_before is not None:
+		pages = pages.filter(Q(checked_at__isnull=True) | Q(checked_at__lt=checked_before))
+	if category is not None:
+		pages = pages.filter(category__slug=category)
+	return pages
+
+def save_results(results):
+	'''Store what check_all found. Returns the ids of pages whose final url changed.'''
+	now = timezone.now()
+	fields = ('final_url', 'fetched_title', 'link_etag', 'link_last_modified')
+	old = dict((row[0], row[1:]) for row in
+		Page.objects.filter(id__in=list(results)).values_list('id', 'url', *fields))
+	moved = []
+	for page_id, result in results.items():
+		if page_id not in old:
+			continue
+		url, final_url, title, etag, last_modified = old[page_id]
+		values = {'link_status': result.status, 'checked_at': now}
+		if result.ok:
+			# Only a redirect that ended up somewhere working is worth sending visitors to
+			values['final_url'] = result.final_url if result.final_url != url else ''
+			values['link_etag'] = result.etag
+			values['link_last_modified'] = result.last_modified
+			if result.title is not None:
+				values['fetched_title'] = result.title
+		else:
+			values.update(final_url='', link_etag='', link_last_modified='')
+		if values.get('final_url', '') != final_url:
+			moved.append(page_id)
+		# Not a change anyone sees on the site, so updated_at stays as it is
+		Page.objects.filter(id=page_id).update(**values)
+	for page_id in moved:
+		clicks.forget_page_url(page_id)
+	return moved
+
+def run(pages, concurrency=CONCURRENCY, per_host=PER_HOST, host_delay=HOST_DELAY, timeout=TIMEOUT):
+	'''Check [(id, url, validators)] on a fresh event loop, for callers without one (management commands).'''
+	loop = asyncio.new_event_loop()
+	try:
+		return loop.run_until_complete(check_all(pages, concurrency, HostLimiter(per_host, host_delay), timeout))
+	finally:
+		loop.close()
+
+@task()
+def check_page(page_id):
+	'''Check one page's url, as a background task (add_page queues one for every new page).'''
+	pages = list(Page.objects.filter(id=page_id).values_list('id', 'url', 'final_url', 'link_etag', 'link_last_modified'))
+	if pages:
+		save_results(run([(row[0], row[1], row[2:]) for row in pages]))
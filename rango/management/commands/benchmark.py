@@ -0,0 +1,84 @@
+import os
+import tempfile
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import override_settings, setup_test_environment, teardown_test_environment
+from rango import benchmark, clicks
+
+class Command(BaseCommand):
+	help = '''Load test rango against a fresh, synthetic database (your own data is never touched).
+Seeds categories, pages, users and profiles, replays a fixed mix of index, show_category, goto,
+profile, add_page and JSON API requests through the test client and a local WSGI server at each
+concurrency level, and prints p50/p95/p99 latency, throughput and queries per request. With --baseline, exits
+with an error if anything got slower than --tolerance allows, or started running more queries.'''
+
+	def add_arguments(self, parser):
+		parser.add_argument('--categories', type=int, default=50)
+		parser.add_argument('--pages', type=int, default=5000)
+		parser.add_argument('--users', type=int, default=100)
+		parser.add_argument('--requests', type=int, default=500, help='Requests per run')
+		parser.add_argument('--concurrency', default='1,4,16', help='Comma separated thread counts')
+		parser.add_argument('--modes', default='client,wsgi', help='client, wsgi or both')
+		parser.add_argument('--seed', type=int, default=42)
+		parser.add_argument('--baseline', help='JSON results of an earlier run to compare against')
+		parser.add_argument('--tolerance', type=float, default=0.25,
+			help='How much slower (as a fraction) p95 may get before it counts as a regression')
+		parser.add_argument('--save-baseline', help='Write the results as JSON to this file')
+
+	def handle(self, *args, **options):
+		try:
+			levels = [int(level) for level in options['concurrency'].split(',')]
+		except ValueError:
+			raise CommandError('--concurrency takes numbers, e.g. 1,4,16')
+		modes = [mode.strip() for mode in options['modes'].split(',')]
+		for mode in modes:
+			if mode not in ('client', 'wsgi'):
+				raise CommandError('Unknown mode {0!r}'.format(mode))
+		baseline = benchmark.load_baseline(options['baseline']) if options['baseline'] else None
+		# A throwaway database in a file, so the threads and the WSGI server all see the same data
+		workdir = tempfile.mkdtemp(prefix='rango-benchmark-')
+		connection.settings_dict.setdefault('TEST', {})['NAME'] = os.path.join(workdir, 'benchmark.sqlite3')
+		setup_test_environment()
+		old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+		# What is measured is the requests; the tasks they queue (checking the links of the pages
+		# add_page makes up) are left in the throwaway database rather than sent out to the internet
+		no_workers = override_settings(RANGO_TASK_INLINE_WORKERS=0)
+		no_workers.enable()
+		try:
+			self.stdout.write('Seeding {categories} categories, {pages} pages, {users} users...'.format(**options))
+			benchmark.seed(options['categories'], options['pages'], options['users'], options['seed'])
+			plan = benchmark.build_plan(options['requests'], options['seed'])
+			results = {}
+			for mode in modes:
+				run = benchmark.run_client if mode == 'client' else benchmark.run_wsgi
+				for level in levels:
+					summary = run(plan, level)
+					results.setdefault(mode, {})[str(level)] = summary
+					self.report(mode, level, summary)
+		finally:
+			# Write back the buffered clicks (and likes) while their database is still there
+			clicks.flush_all()
+			no_workers.disable()
+			connection.creation.destroy_test_db(old_name, verbosity=0)
+			teardown_test_environment()
+
+		if options['save_baseline']:
+			benchmark.save_baseline(options['save_baseline'], results)
+			self.stdout.write('Saved results to {0}'.format(options['save_baseline']))
+		if baseline:
+			regressions = benchmark.compare(baseline, results, options['tolerance'])
+			if regressions:
+				raise CommandError('Regressions against {0}:\n  {1}'.format(options['baseline'], '\n  '.join(regressions)))
+			self.stdout.write(self.style.SUCCESS('No regressions against {0}'.format(options['baseline'])))
+
+	def report(self, mode, level, summary):
+		self.stdout.write('\n{0}, {1} thread(s)'.format(mode, level))
+		self.stdout.write('  {0:<15}{1:>8}{2:>8}{3:>10}{4:>10}{5:>10}{6:>10}{7:>9}'.format(
+			'request', 'count', 'errors', 'p50 ms', 'p95 ms', 'p99 ms', 'req/s', 'queries'))
+		for name in sorted(summary, key=lambda name: (name == 'all', name)):
+			stats = summary[name]
+			queries = '{0:.1f}'.format(stats['mean_queries']) if stats['mean_queries'] is not None else '-'
+			self.stdout.write('  {0:<15}{1:>8}{2:>8}{3:>10.1f}{4:>10.1f}{5:>10.1f}{6:>10.1f}{7:>9}'.format(
+				name, stats['requests'], stats['errors'], stats['p50_ms'], stats['p95_ms'], stats['p99_ms'],
+				stats['throughput'], queries))
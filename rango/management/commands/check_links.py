@@ -0,0 +1,49 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from rango import linkcheck
+
+class Command(BaseCommand):
+	help = '''Check every page's url: whether it works, where its redirects end up and what its title is.
+Goto links then send visitors straight to the end of the redirects.'''
+
+	def add_arguments(self, parser):
+		parser.add_argument('--older-than', type=float, metavar='HOURS',
+			help='Only pages not checked in this many hours')
+		parser.add_argument('--category', metavar='SLUG', help='Only the pages of this category')
+		parser.add_argument('--concurrency', type=int, default=linkcheck.CONCURRENCY, help='Requests in flight at once')
+		parser.add_argument('--per-host', type=int, default=linkcheck.PER_HOST, help='Requests in flight to any one host')
+		parser.add_argument('--host-delay', type=float, default=linkcheck.HOST_DELAY,
+			help='Seconds between requests to the same host')
+		parser.add_argument('--timeout', type=float, default=linkcheck.TIMEOUT, help='Seconds per request')
+		parser.add_argument('--batch-size', type=int, default=500, help='Pages checked (and saved) per batch')
+
+	def handle(self, *args, **options):
+		checked_before = None
+		if options['older_than'] is not None:
+			checked_before = timezone.now() - timedelta(hours=options['older_than'])
+		pages = linkcheck.pages_to_check(checked_before, options['category']).order_by('id')
+		totals = {'checked': 0, 'ok': 0, 'broken': 0, 'moved': 0}
+		last_id = 0
+		while True:
+			# In batches by id, so neither the pages nor the results all have to be in memory at once
+			batch = list(pages.filter(id__gt=last_id).values_list(
+				'id', 'url', 'final_url', 'link_etag', 'link_last_modified')[:options['batch_size']])
+			if not batch:
+				break
+			last_id = batch[-1][0]
+			results = linkcheck.run([(row[0], row[1], row[2:]) for row in batch], options['concurrency'],
+				options['per_host'], options['host_delay'], options['timeout'])
+			totals['moved'] += len(linkcheck.save_results(results))
+			for page_id, result in results.items():
+				totals['checked'] += 1
+				if result.ok:
+					totals['ok'] += 1
+				else:
+					totals['broken'] += 1
+					if options['verbosity'] > 1:
+						self.stdout.write('{0}: {1}'.format(page_id, result.error or result.status))
+			self.stdout.write('{checked} checked, {ok} ok, {broken} broken'.format(**totals))
+		self.stdout.write(self.style.SUCCESS(
+			'Checked {checked} pages: {ok} ok, {broken} broken, {moved} with a new final url'.format(**totals)))
@@ -0,0 +1,43 @@
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+from rango import exporter
+
+class Command(BaseCommand):
+	help = '''Write every category and page to a JSONL or CSV file ("-" writes to stdout), in the format
+import_catalogue loads. Rows are read and written a chunk at a time, in constant memory.'''
+
+	def add_arguments(self, parser):
+		parser.add_argument('path')
+		parser.add_argument('--format', choices=exporter.FORMATS,
+			help='File format, by default taken from the file extension')
+		parser.add_argument('--only', choices=('categories', 'pages'), help='Export just one of them')
+		parser.add_argument('--gzip', action='store_true', help='Compress the output (implied by a .gz path)')
+		parser.add_argument('--chunk-size', type=int, default=exporter.CHUNK_SIZE, help='Rows read per query')
+
+	def handle(self, *args, **options):
+		path = options['path']
+		gzip = options['gzip'] or path.endswith('.gz')
+		name = path[:-3] if path.endswith('.gz') else path
+		fmt = options['format'] or ('csv' if name.endswith('.csv') else 'jsonl')
+		only = options['only']
+		blocks = exporter.export(fmt, only != 'pages', only != 'categories', gzip, options['chunk_size'])
+		if path == '-':
+			out = sys.stdout.buffer
+		else:
+			try:
+				out = open(path, 'wb')
+			except IOError as e:
+				raise CommandError(str(e))
+		size = 0
+		try:
+			for block in blocks:
+				out.write(block)
+				size += len(block)
+		finally:
+			if path != '-':
+				out.close()
+			else:
+				out.flush()
+		if path != '-':
+			self.stdout.write(self.style.SUCCESS('Wrote {0} bytes to {1}'.format(size, path)))
@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand
+from rango.models import UserProfile
+from rango import thumbnails
+
+class Command(BaseCommand):
+	help = 'Make the thumbnails of every profile picture that has none yet (or of all of them with --all).'
+
+	def add_arguments(self, parser):
+		parser.add_argument('--all', action='store_true', help='Remake thumbnails that already exist, e.g. after changing RANGO_THUMBNAIL_QUALITY')
+
+	def handle(self, *args, **options):
+		profiles = UserProfile.objects.exclude(picture='')
+		if not options['all']:
+			profiles = profiles.filter(picture_thumbnail='')
+		count = 0
+		failed = 0
+		for profile_id in profiles.values_list('id', flat=True).iterator():
+			try:
+				thumbnails.generate(profile_id, options['all'])
+				count += 1
+			except Exception as e:
+				failed += 1
+				self.stderr.write('Profile {0}: {1}'.format(profile_id, e))
+		self.stdout.write(self.style.SUCCESS('Made thumbnails for {0} profile(s), {1} failed'.format(count, failed)))
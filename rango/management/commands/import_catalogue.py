@@ -0,0 +1,81 @@
+import csv
+import gzip
+import io
+import json
+import logging
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+from rango.importer import CatalogueImporter
+
+logger = logging.getLogger('rango.importer')
+
+class Command(BaseCommand):
+	help = '''Bulk load categories and pages from a JSONL or CSV file, gzipped or not ("-" reads stdin).
+Every record has a category; records with a title and url are pages of it, e.g.
+  {"category": "Python", "views": 128, "likes": 64}
+  {"category": "Python", "title": "Official Python Tutorial", "url": "http://docs.python.org/2/tutorial/", "views": 32}
+CSV files use the same names as column headings: category,title,url,views,likes'''
+
+	def add_arguments(self, parser):
+		parser.add_argument('path')
+		parser.add_argument('--format', choices=('jsonl', 'csv'),
+			help='File format, by default taken from the file extension')
+		parser.add_argument('--batch-size', type=int, default=1000,
+			help='Rows written per transaction')
+
+	def handle(self, *args, **options):
+		path = options['path']
+		name = path[:-3] if path.endswith('.gz') else path
+		fmt = options['format'] or ('csv' if name.endswith('.csv') else 'jsonl')
+		if path == '-':
+			stream = io.TextIOWrapper(sys.stdin.buffer, encoding='utf-8')
+		else:
+			try:
+				if path.endswith('.gz'):
+					stream = gzip.open(path, 'rt', encoding='utf-8', newline='')
+				else:
+					stream = io.open(path, encoding='utf-8', newline='')
+			except IOError as e:
+				raise CommandError(str(e))
+
+		importer = CatalogueImporter(options['batch_size'], progress=self.report_progress)
+		try:
+			with stream:
+				for line_no, record in enumerate(self.records(stream, fmt), 1):
+					try:
+						importer.add(record)
+					except (KeyError, TypeError, ValueError) as e:
+						raise CommandError('Bad record {0}: {1!r} ({2})'.format(line_no, record, e))
+		except Exception:
+			# Even when a bad record stops the load, the batches written before it have to have
+			# their categories' totals counted, be indexed for search and have the caches reset.
+			# The error to report is the one that stopped it, not anything finishing up raises.
+			try:
+				importer.finish()
+			except Exception:
+				logger.exception('Could not finish the stopped import')
+			raise
+		stats = importer.finish()
+		self.stdout.write(self.style.SUCCESS(
+			'Loaded {rows} rows in {seconds:.1f}s ({rows_per_second:.0f} rows/s): '
+			'{categories_created} categories created, {categories_updated} updated, '
+			'{pages_created} pages created, {pages_updated} updated, '
+			'{duplicates} duplicates and {skipped} clashing rows skipped'.format(**stats)))
+
+	def records(self, stream, fmt):
+		# Stream the file, only the current batch is ever held in memory
+		if fmt == 'csv':
+			for row in csv.DictReader(stream):
+				yield row
+		else:
+			for line in stream:
+				line = line.strip()
+				if line:
+					try:
+						yield json.loads(line)
+					except ValueError as e:
+						raise CommandError('Bad JSON line {0!r}: {1}'.format(line, e))
+
+	def report_progress(self, stats):
+		self.stdout.write('{rows} rows, {rows_per_second:.0f} rows/s'.format(**stats))
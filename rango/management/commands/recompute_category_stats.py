@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from rango.models import Category
+from rango import category_stats
+from rango.versions import bump_version
+
+class Command(BaseCommand):
+	help = 'Count the pages and page views of every category (or of the given slugs) again, repairing drift in page_count and total_page_views.'
+
+	def add_arguments(self, parser):
+		parser.add_argument('slugs', nargs='*', help='Only these categories')
+
+	def handle(self, *args, **options):
+		category_ids = None
+		if options['slugs']:
+			category_ids = list(Category.objects.filter(slug__in=options['slugs']).values_list('id', flat=True))
+		with transaction.atomic():
+			count = category_stats.recompute(category_ids)
+		# The totals were rewritten behind the model signals
+		bump_version('category')
+		self.stdout.write(self.style.SUCCESS('Recounted the pages of {0} categories'.format(count)))
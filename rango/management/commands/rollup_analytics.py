@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+from rango import analytics
+
+class Command(BaseCommand):
+	help = '''Roll page views per minute up into hours and days, and delete buckets past their retention.
+This also runs as a background task while clicks come in; --full redoes every bucket still kept.'''
+
+	def add_arguments(self, parser):
+		parser.add_argument('--full', action='store_true', help='Rebuild every hour and day bucket, not just recent ones')
+
+	def handle(self, *args, **options):
+		built = analytics.rollup(full=options['full'])
+		self.stdout.write(self.style.SUCCESS('Rolled up {0} hour and {1} day bucket(s)'.format(
+			built[analytics.HOUR], built[analytics.DAY])))
@@ -0,0 +1,48 @@
+import threading
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from rango import tasks
+from rango.models import Task
+
+class Command(BaseCommand):
+	help = '''Run background tasks (thumbnails, link checks) as they are queued, until interrupted.
+Start as many of these as needed; each task is only run by one of them.'''
+
+	def add_arguments(self, parser):
+		parser.add_argument('--threads', type=int, default=1, help='Worker threads in this process')
+		parser.add_argument('--poll-interval', type=float, default=tasks.POLL_INTERVAL,
+			help='Seconds between looks for new tasks')
+		parser.add_argument('--once', action='store_true', help='Run the tasks that are due, then stop')
+		parser.add_argument('--retry-failed', action='store_true',
+			help='Queue the tasks that ran out of attempts again first')
+
+	def handle(self, *args, **options):
+		if options['retry_failed']:
+			count = Task.objects.filter(status=Task.FAILED).update(
+				status=Task.PENDING, attempts=0, run_after=timezone.now())
+			self.stdout.write('Queued {0} failed task(s) again'.format(count))
+		if options['once']:
+			count = tasks.run_pending()
+			self.stdout.write(self.style.SUCCESS('Ran {0} task(s)'.format(count)))
+			return
+		threads = []
+		for i in range(options['threads']):
+			thread = threading.Thread(target=tasks.work, args=(tasks.stopping, options['poll_interval']),
+				name='run-tasks-{0}'.format(i))
+			thread.daemon = True
+			thread.start()
+			threads.append(thread)
+		# Tasks queued by tasks are for these threads, not for more started in this process
+		tasks.workers.extend(threads)
+		self.stdout.write('Running tasks with {0} thread(s), Ctrl-C to stop'.format(len(threads)))
+		try:
+			while any(thread.is_alive() for thread in threads):
+				for thread in threads:
+					thread.join(1)
+		except KeyboardInterrupt:
+			# Let the tasks being run finish
+			tasks.stopping.set()
+			tasks.wakeup.set()
+			for thread in threads:
+				thread.join()
@@ -0,0 +1,183 @@
+import logging
+import mimetypes
+import os
+import re
+import threading
+import time
+from bisect import bisect_left
+from collections import Counter
+
+from django.conf import settings
+from django.contrib.staticfiles.storage import staticfiles_storage
+from django.core.exceptions import MiddlewareNotUsed
+from django.http import FileResponse
+from django.db import connections
+
+logger = logging.getLogger('rango.profiling')
+
+PROFILING = getattr(settings, 'RANGO_PROFILING', settings.DEBUG)
+# Views (by url name) and the most queries a request to them should need
+QUERY_BUDGETS = getattr(settings, 'RANGO_QUERY_BUDGETS', {})
+# Going over budget raises QueryBudgetExceeded rather than just logging a warning, for tests
+QUERY_BUDGETS_STRICT = getattr(settings, 'RANGO_QUERY_BUDGETS_STRICT', False)
+# The same query, give or take its parameters, this many times in one request looks like an N+1
+DUPLICATE_QUERY_THRESHOLD = getattr(settings, 'RANGO_DUPLICATE_QUERY_THRESHOLD', 3)
+
+# Upper bounds of the histogram buckets; the last bucket takes everything above
+TIME_BUCKETS_MS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500)
+QUERY_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+
+LITERAL_RE = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+
+class QueryBudgetExceeded(Exception):
+	pass
+
+def query_shape(sql):
+	# The query with its literal values taken out, so the N+1 rows of a loop all look alike
+	return LITERAL_RE.sub('?', sql)
+
+class ViewStats(object):
+
+	def __init__(self):
+		self.requests = 0
+		self.wall_ms = 0.0
+		self.sql_ms = 0.0
+		self.queries = 0
+		self.max_queries = 0
+		self.time_histogram = [0] * (len(TIME_BUCKETS_MS) + 1)
+		self.query_histogram = [0] * (len(QUERY_BUCKETS) + 1)
+
+	def add(self, wall_ms, sql_ms, queries):
+		self.requests += 1
+		self.wall_ms += wall_ms
+		self.sql_ms += sql_ms
+		self.queries += queries
+		self.max_queries = max(self.max_queries, queries)
+		self.time_histogram[bisect_left(TIME_BUCKETS_MS, wall_ms)] += 1
+		self.query_histogram[bisect_left(QUERY_BUCKETS, queries)] += 1
+
+	def as_dict(self):
+		return {
+			'requests': self.requests,
+			'mean_ms': self.wall_ms / self.requests,
+			'mean_sql_ms': self.sql_ms / self.requests,
+			'mean_queries': float(self.queries) / self.requests,
+			'max_queries': self.max_queries,
+			'time_histogram_ms': histogram(TIME_BUCKETS_MS, self.time_histogram),
+			'query_histogram': histogram(QUERY_BUCKETS, self.query_histogram),
+		}
+
+def histogram(bounds, counts):
+	labels = ['<={0}'.format(bound) for bound in bounds] + ['>{0}'.format(bounds[-1])]
+	return dict((label, count) for label, count in zip(labels, counts) if count)
+
+stats_lock = threading.Lock()
+view_stats = {}
+
+def profiling_report():
+	with stats_lock:
+		return dict((view, stats.as_dict()) for view, stats in view_stats.items())
+
+def reset_profiling():
+	with stats_lock:
+		view_stats.clear()
+
+class QueryProfilingMiddleware(object):
+	'''Times every request and counts its database queries, per view.
+	Warns about requests that repeat a query (likely N+1) or go over their view's query budget,
+	and keeps per-view histograms for profiling_report() and the /rango/profiling/ page.'''
+
+	def __init__(self, get_response):
+		if not PROFILING:
+			raise MiddlewareNotUsed
+		self.get_response = get_response
+
+	def __call__(self, request):
+		# Make every connection log queries even with DEBUG off, like CaptureQueriesContext does
+		databases = connections.all()
+		force_debug_cursor = [db.force_debug_cursor for db in databases]
+		# Count from where the logs are now rather than clearing them, so anything else
+		# capturing queries around this request (tests, the benchmark) still sees them all
+		logged = [len(db.queries_log) for db in databases]
+		for db in databases:
+			db.force_debug_cursor = True
+		started = time.time()
+		try:
+			response = self.get_response(request)
+			queries = [q for db, start in zip(databases, logged) for q in list(db.queries_log)[start:]]
+		finally:
+			for db, force in zip(databases, force_debug_cursor):
+				db.force_debug_cursor = force
+		wall_ms = (time.time() - started) * 1000
+
+		match = getattr(request, 'resolver_match', None)
+		view = (match.url_name or match.view_name) if match else 'unresolved'
+		sql_ms = sum(float(q['time']) for q in queries) * 1000
+		with stats_lock:
+			view_stats.setdefault(view, ViewStats()).add(wall_ms, sql_ms, len(queries))
+
+		logger.debug('%s %s view=%s %.1fms queries=%d sql=%.1fms',
+			request.method, request.path, view, wall_ms, len(queries), sql_ms)
+		self.check_duplicates(request, view, queries)
+		self.check_budget(request, view, len(queries))
+		return response
+
+	def check_duplicates(self, request, view, queries):
+		shapes = Counter(query_shape(q['sql']) for q in queries)
+		for sql, count in shapes.items():
+			if count >= DUPLICATE_QUERY_THRESHOLD:
+				logger.warning('%s (%s) ran the same query %d times, N+1? %s', request.path, view, count, sql)
+
+	def check_budget(self, request, view, count):
+		budget = QUERY_BUDGETS.get(view)
+		if budget is None or count <= budget:
+			return
+		message = '{0} ({1}) ran {2} queries, its budget is {3}'.format(request.path, view, count, budget)
+		if QUERY_BUDGETS_STRICT:
+			raise QueryBudgetExceeded(message)
+		logger.warning(message)
+
+SERVE_STATIC = getattr(settings, 'RANGO_SERVE_STATIC', not settings.DEBUG)
+# Hashed file names change whenever their content does, so they can be cached for good
+IMMUTABLE_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+STATIC_CACHE_CONTROL = 'public, max-age=60'
+ENCODINGS = (('br', '.br'), ('gzip', '.gz'))
+
+class StaticAssetsMiddleware(object):
+	'''Serves collected static files from STATIC_ROOT without going through the rest of the stack.
+	Picks the precompressed .br/.gz copy the client accepts, and marks content hashed files
+	(the ones in the staticfiles manifest) as immutable so browsers never ask for them again.'''
+
+	def __init__(self, get_response):
+		if not SERVE_STATIC or not settings.STATIC_ROOT:
+			raise MiddlewareNotUsed
+		self.get_response = get_response
+		self.root = os.path.realpath(settings.STATIC_ROOT)
+		hashed_names = getattr(staticfiles_storage, 'hashed_names', None)
+		self.immutable = hashed_names() if hashed_names else set()
+
+	def __call__(self, request):
+		if request.method in ('GET', 'HEAD') and request.path.startswith(settings.STATIC_URL):
+			response = self.serve(request, request.path[len(settings.STATIC_URL):])
+			if response is not None:
+				return response
+		return self.get_response(request)
+
+	def serve(self, request, name):
+		path = os.path.realpath(os.path.join(self.root, name))
+		if not path.startswith(self.root + os.sep) or not os.path.isfile(path):
+			return None
+		accepted = request.META.get('HTTP_ACCEPT_ENCODING', '')
+		encoding = None
+		for candidate, suffix in ENCODINGS:
+			if candidate in accepted and os.path.isfile(path + suffix):
+				encoding, path = candidate, path + suffix
+				break
+		content_type = mimetypes.guess_type(name)[0] or 'application/octet-stream'
+		response = FileResponse(open(path, 'rb'), content_type=content_type)
+		response['Content-Length'] = os.path.getsize(path)
+		if encoding:
+			response['Content-Encoding'] = encoding
+		response['Vary'] = 'Accept-Encoding'
+		response['Cache-Control'] = IMMUTABLE_CACHE_CONTROL if name in self.immutable else STATIC_CACHE_CONTROL
+		return response
@@ -0,0 +1,47 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations
+from django.db.utils import OperationalError
+
+# The full text index used by rango/search.py. It is an SQLite FTS5 virtual table, so on other
+# databases (or an SQLite built without FTS5) nothing is created and search falls back to its
+# in-memory index.
+
+def create_search_index(apps, schema_editor):
+    connection = schema_editor.connection
+    if connection.vendor != 'sqlite':
+        return
+    with connection.cursor() as cursor:
+        try:
+            cursor.execute(
+                "CREATE VIRTUAL TABLE rango_search USING fts5("
+                "kind UNINDEXED, obj_id UNINDEXED, title, url, prefix='2 3')")
+        except OperationalError:
+            return
+        # Rows are keyed obj_id * 2 + (0 for categories, 1 for pages), see rango.search.doc_rowid
+        cursor.execute(
+            "INSERT INTO rango_search (rowid, kind, obj_id, title, url) "
+            "SELECT id * 2, 'category', id, name, '' FROM rango_category")
+        cursor.execute(
+            "INSERT INTO rango_search (rowid, kind, obj_id, title, url) "
+            "SELECT id * 2 + 1, 'page', id, title, url FROM rango_page")
+
+
+def drop_search_index(apps, schema_editor):
+    connection = schema_editor.connection
+    if connection.vendor != 'sqlite':
+        return
+    with connection.cursor() as cursor:
+        cursor.execute("DROP TABLE IF EXISTS rango_search")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rango', '0006_leaderboard_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
@@ -0,0 +1,19 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.10.8 on 2026-10-18 08:41
+from __future__ import unicode_literals
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rango', '0007_search_index'),
+    ]
+
+    operations = [
+        migrations.AlterIndexTogether(
+            name='page',
+            index_together=set([('category', 'views', 'id')]),
+        ),
+    ]
@@ -0,0 +1,35 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.10.8 on 2026-10-18 08:51
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+def count_pages(apps, schema_editor):
+    # Start the running totals off from the pages already there
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute(
+            "UPDATE rango_category SET "
+            "page_count = (SELECT COUNT(*) FROM rango_page WHERE rango_page.category_id = rango_category.id), "
+            "total_page_views = (SELECT COALESCE(SUM(views), 0) FROM rango_page WHERE rango_page.category_id = rango_category.id)")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rango', '0009_userprofile_picture_thumbnail'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='category',
+            name='page_count',
+            field=models.IntegerField(db_index=True, default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='category',
+            name='total_page_views',
+            field=models.IntegerField(db_index=True, default=0, editable=False),
+        ),
+        migrations.RunPython(count_pages, migrations.RunPython.noop),
+    ]
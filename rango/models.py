@@ -3,13 +3,20 @@ from __future__ import unicode_literals
 from django.template.defaultfilters import slugify
 from django.db import models
 from django.contrib.auth.models import User
+from django.utils import timezone
 
 # Create your models here.
 class Category(models.Model):
 	name = models.CharField(max_length=128, unique=True)
 	views = models.IntegerField(default=0)
-	likes = models.IntegerField(default=0)
+	likes = models.IntegerField(default=0, db_index=True)
 	slug = models.SlugField(unique=True)
+	# Running totals over this category's pages, kept up to date by rango/category_stats.py
+	page_count = models.IntegerField(default=0, db_index=True, editable=False)
+	total_page_views = models.IntegerField(default=0, db_index=True, editable=False)
+	# When this category or any of its pages last changed, for conditional GETs of its page.
+	# Bulk updates bypass auto_now, so they set it themselves.
+	updated_at = models.DateTimeField(auto_now=True)
 
 	def save(self, *args, **kwargs):
 		self.slug = slugify(self.name)
@@ -25,20 +32,96 @@ class Page(models.Model):
 	category = models.ForeignKey(Category)
 	title = models.CharField(max_length=128)
 	url =models.URLField()
-	views = models.IntegerField(default=0)
+	views = models.IntegerField(default=0, db_index=True)
+	updated_at = models.DateTimeField(auto_now=True)
+	# What `manage.py check_links` (rango/linkcheck.py) last found at the url: the HTTP status
+	# (None if it couldn't be reached), where its redirects ended up if that worked, and its <title>.
+	# The validators make the next check a conditional request.
+	link_status = models.PositiveSmallIntegerField(null=True, blank=True, editable=False)
+	final_url = models.URLField(blank=True, editable=False)
+	fetched_title = models.CharField(max_length=128, blank=True, editable=False)
+	link_etag = models.CharField(max_length=128, blank=True, editable=False)
+	link_last_modified = models.CharField(max_length=64, blank=True, editable=False)
+	checked_at = models.DateTimeField(null=True, blank=True, editable=False, db_index=True)
+
+	class Meta:
+		# Covers show_category's keyset pagination: the pages of a category by views, then id
+		index_together = [('category', 'views', 'id')]
 
 	def __str__(self):
 		return self.title
 
+class CategoryLike(models.Model):
+	# One user liking one category; Category.likes holds the totals (see rango/likes.py)
+	user = models.ForeignKey(User)
+	category = models.ForeignKey(Category)
+	created_at = models.DateTimeField(auto_now_add=True)
+
+	class Meta:
+		unique_together = [('user', 'category')]
+
+	def __str__(self):
+		return '{0} likes {1}'.format(self.user_id, self.category_id)
+
 class UserProfile(models.Model):
 	# This line links User Profile to a User Model Instance
 	user = models.OneToOneField(User)
 	# These lines are the additional attributes we wish to include
 	website = models.URLField(blank=True)
 	picture = models.ImageField(upload_to='profile_images', blank=True)
+	# Name of the picture's thumbnails, set by rango/thumbnails.py once they have been made
+	picture_thumbnail = models.CharField(max_length=64, blank=True, editable=False)
 
 	def __str__(self):
 		return self.user.username
 
 	def __unicode__(self):
-		return self.user.username
\ No newline at end of file
+		return self.user.username
+
+class Task(models.Model):
+	# A queued call of a background task, see rango/tasks.py
+	PENDING = 'pending'
+	RUNNING = 'running'
+	FAILED = 'failed'
+	STATUSES = ((PENDING, 'Pending'), (RUNNING, 'Running'), (FAILED, 'Failed'))
+
+	name = models.CharField(max_length=128)
+	# The arguments, a JSON list
+	args = models.TextField(default='[]')
+	status = models.CharField(max_length=8, choices=STATUSES, default=PENDING)
+	# Set on tasks queued with dedupe=True while they wait, so the same call can't be queued twice
+	dedupe_key = models.CharField(max_length=40, null=True, blank=True, unique=True)
+	attempts = models.PositiveSmallIntegerField(default=0)
+	max_attempts = models.PositiveSmallIntegerField(default=3)
+	run_after = models.DateTimeField(default=timezone.now)
+	# When the worker running it loses it, if it hasn't finished by then
+	locked_until = models.DateTimeField(null=True, blank=True)
+	last_error = models.TextField(blank=True)
+	created_at = models.DateTimeField(auto_now_add=True)
+
+	class Meta:
+		# Workers look for the tasks that are due, oldest first
+		index_together = [('status', 'run_after')]
+
+	def __str__(self):
+		return '{0} {1}'.format(self.name, self.args)
+
+class PageViewBucket(models.Model):
+	# A page's views within one minute, hour or day, see rango/analytics.py
+	MINUTE = 'minute'
+	HOUR = 'hour'
+	DAY = 'day'
+	GRANULARITIES = ((MINUTE, 'Minute'), (HOUR, 'Hour'), (DAY, 'Day'))
+
+	page = models.ForeignKey(Page)
+	granularity = models.CharField(max_length=6, choices=GRANULARITIES)
+	start = models.DateTimeField()
+	views = models.PositiveIntegerField(default=0)
+
+	class Meta:
+		# One row per page per bucket; the index also serves the trending queries, which read
+		# every bucket of one granularity since some time
+		unique_together = [('granularity', 'start', 'page')]
+
+	def __str__(self):
+		return '{0} {1} {2}: {3}'.format(self.page_id, self.granularity, self.start, self.views)
@@ -0,0 +1,98 @@
+from django.conf import settings
+from django.core.paginator import Paginator
+from django.db import DatabaseError, connections
+from django.db.models import Q
+from django.db.models.query import QuerySet
+from django.utils.functional import cached_property
+
+# Keyset ("cursor") pagination. Rather than OFFSET, which has to walk past every earlier row,
+# each page starts right after the last row of the previous one. The cursor holds that row's
+# ordering values, so any page costs one index range scan however deep into the list it is.
+# Ordering fields must be integers and end in a unique one (usually id) so the order is total.
+
+def encode_cursor(values):
+	return '.'.join(str(value) for value in values)
+
+def decode_cursor(cursor, length):
+	# A cursor that doesn't parse just starts from the beginning
+	try:
+		values = [int(value) for value in cursor.split('.')]
+	except (AttributeError, ValueError):
+		return None
+	if len(values) != length:
+		return None
+	return values
+
+def field_value(item, field):
+	if isinstance(item, dict):
+		return item[field]
+	return getattr(item, field)
+
+def after_filter(ordering, values):
+	# Rows that come after `values` in `ordering`, e.g. for ('-views', '-id'):
+	#   views < v  OR  (views = v AND id < i)
+	condition = None
+	equal = Q()
+	for field, value in zip(ordering, values):
+		name = field.lstrip('-')
+		lookup = '{0}__lt'.format(name) if field.startswith('-') else '{0}__gt'.format(name)
+		step = equal & Q(**{lookup: value})
+		condition = step if condition is None else condition | step
+		equal = equal & Q(**{name: value})
+	return condition
+
+def keyset_page(queryset, ordering, after=None, size=50):
+	'''Return (items, next_cursor) for the `size` rows of queryset that follow cursor `after`.
+	next_cursor is None on the last page.'''
+	queryset = queryset.order_by(*ordering)
+	values = decode_cursor(after, len(ordering)) if after else None
+	if values is not None:
+		queryset = queryset.filter(after_filter(ordering, values))
+	# Fetch one extra row to find out whether there is a next page
+	items = list(queryset[:size + 1])
+	next_cursor = None
+	if len(items) > size:
+		items = items[:size]
+		last = items[-1]
+		next_cursor = encode_cursor([field_value(last, field.lstrip('-')) for field in ordering])
+	return items, next_cursor
+
+# Numbered pages (the admin's changelists) need a total, and COUNT(*) reads the whole table.
+# For a table this big, unfiltered, the database's own statistics give a close enough count.
+ESTIMATED_COUNT_THRESHOLD = getattr(settings, 'RANGO_ESTIMATED_COUNT_THRESHOLD', 100000)
+
+def estimated_count(model, using='default'):
+	'''The number of rows in model's table according to the database's statistics (on PostgreSQL
+	kept up by autovacuum, on SQLite written by ANALYZE), or None when it has none.'''
+	connection = connections[using]
+	table = model._meta.db_table
+	try:
+		with connection.cursor() as cursor:
+			if connection.vendor == 'postgresql':
+				cursor.execute('SELECT reltuples FROM pg_class WHERE oid = %s::regclass', [table])
+			elif connection.vendor == 'sqlite':
+				# The first number of any of the table's rows in sqlite_stat1 is its row count
+				cursor.execute('SELECT stat FROM sqlite_stat1 WHERE tbl = %s LIMIT 1', [table])
+			else:
+				return None
+			row = cursor.fetchone()
+	except DatabaseError:
+		# No statistics table: SQLite only creates sqlite_stat1 the first time ANALYZE runs
+		return None
+	if not row or row[0] is None:
+		return None
+	count = int(str(row[0]).split()[0].split('.')[0])
+	return count if count > 0 else None
+
+class EstimatedCountPaginator(Paginator):
+	'''Paginator taking the count of an unfiltered queryset over a big table from estimated_count().
+	Filtered querysets, and small tables, are still counted exactly.'''
+
+	@cached_property
+	def count(self):
+		queryset = self.object_list
+		if isinstance(queryset, QuerySet) and not queryset.query.where:
+			estimate = estimated_count(queryset.model, queryset.db)
+			if estimate is not None and estimate >= ESTIMATED_COUNT_THRESHOLD:
+				return estimate
+		return super(EstimatedCountPaginator, self).count
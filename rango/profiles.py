@@ -0,0 +1,55 @@
+from django.conf import settings
+from django.core.cache import cache
+from django.core.paginator import Paginator, EmptyPage
+from rango.models import UserProfile
+from rango.versions import get_version
+
+# The profile directory shown by list_profiles, a page at a time. Each page is fetched with
+# the user joined in (one query, plus one COUNT) and cached under the profile version, which
+# the UserProfile/User signals bump, so a warm directory page costs no queries at all.
+PROFILES_PAGE_SIZE = getattr(settings, 'RANGO_PROFILES_PAGE_SIZE', 50)
+# Seconds a version's pages are kept, and so how stale another process's copy can get
+# without a shared RANGO_VERSION_CACHE (see rango/versions.py)
+PROFILES_CACHE_TIMEOUT = getattr(settings, 'RANGO_PROFILES_CACHE_TIMEOUT', 60)
+
+def num_pages(version):
+	key = 'rango:profiles:{0}:pages'.format(version)
+	count = cache.get(key)
+	if count is None:
+		# At least one page, if empty, as the Paginator has
+		count = max(1, -(-UserProfile.objects.count() // PROFILES_PAGE_SIZE))
+		cache.set(key, count, PROFILES_CACHE_TIMEOUT)
+	return count
+
+def page_number(number, version):
+	# ?page= as the page it shows: 1 for anything that isn't a number, the last page past the end.
+	# Pages are cached under this, so any value a client sends maps to one of num_pages entries.
+	try:
+		number = int(number)
+	except (TypeError, ValueError):
+		return 1
+	return max(1, min(number, num_pages(version)))
+
+def directory_page(number):
+	version = get_version('profile')
+	number = page_number(number, version)
+	key = 'rango:profiles:{0}:{1}'.format(version, number)
+	page = cache.get(key)
+	if page is None:
+		profiles = UserProfile.objects.select_related('user').order_by('user__username').values('user__username', 'picture', 'picture_thumbnail')
+		paginator = Paginator(profiles, PROFILES_PAGE_SIZE)
+		try:
+			current = paginator.page(number)
+		except EmptyPage:
+			# Profiles deleted since num_pages was counted, and the version hasn't caught up yet
+			current = paginator.page(paginator.num_pages)
+		page = {
+			'profiles': [{'username': p['user__username'], 'picture': p['picture'], 'picture_thumbnail': p['picture_thumbnail']}
+				for p in current],
+			'number': current.number,
+			'num_pages': paginator.num_pages,
+			'previous': current.previous_page_number() if current.has_previous() else None,
+			'next': current.next_page_number() if current.has_next() else None,
+		}
+		cache.set(key, page, PROFILES_CACHE_TIMEOUT)
+	return page
@@ -0,0 +1,38 @@
+import threading
+import time
+from collections import deque
+
+class RateLimiter(object):
+	'''At most `limit` actions per `period` seconds for any one key (a user, an IP address),
+	counted over a sliding window, in this process's memory.'''
+
+	# Past this many keys, the ones with nothing in their window are dropped
+	MAX_KEYS = 10000
+
+	def __init__(self, limit, period):
+		self.limit = limit
+		self.period = period
+		self.lock = threading.Lock()
+		self.windows = {}
+
+	def allow(self, *keys):
+		'''Count one action against every key, unless one of them is over its limit.
+		Returns 0 if allowed, else the seconds until it would be.'''
+		now = time.time()
+		with self.lock:
+			if len(self.windows) > self.MAX_KEYS:
+				self.prune(now)
+			windows = [self.windows.setdefault(key, deque()) for key in keys]
+			for window in windows:
+				while window and window[0] <= now - self.period:
+					window.popleft()
+			wait = max([window[0] + self.period - now for window in windows if len(window) >= self.limit] or [0])
+			if wait:
+				return wait
+			for window in windows:
+				window.append(now)
+			return 0
+
+	def prune(self, now):
+		for key in [key for key, window in self.windows.items() if not window or window[-1] <= now - self.period]:
+			del self.windows[key]
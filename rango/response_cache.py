@@ -0,0 +1,127 @@
+import hashlib
+import time
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import caches
+from django.utils.cache import get_conditional_response
+from django.utils.http import parse_http_date_safe
+
+# Whole responses of pages that are the same for every anonymous visitor, kept in the CACHES
+# alias RANGO_RESPONSE_CACHE_ALIAS (local memory, files or Redis, see settings.py).
+# Every entry is stored with the versions of the tags it depends on ('categories' for the
+# sidebar, 'category:<slug>' for one category's page, ...). rango/signals.py bumps a tag when the
+# data behind it changes, and entries stored under an older version count as stale.
+# A stale entry is regenerated by one request, which takes a short lock, while the requests
+# that come in meanwhile are still served the old copy, so a popular page never makes
+# every worker render it at once.
+RESPONSE_CACHE = getattr(settings, 'RANGO_RESPONSE_CACHE', False)
+RESPONSE_CACHE_ALIAS = getattr(settings, 'RANGO_RESPONSE_CACHE_ALIAS', 'default')
+RESPONSE_CACHE_TIMEOUT = getattr(settings, 'RANGO_RESPONSE_CACHE_TIMEOUT', 60)
+# How long past its timeout (or its tags changing) an entry can still be served while it is regenerated
+RESPONSE_CACHE_GRACE = getattr(settings, 'RANGO_RESPONSE_CACHE_GRACE', 5 * 60)
+# Longest a regeneration can keep the lock, if the request holding it dies
+REGENERATE_LOCK_TIMEOUT = 30
+
+def get_cache():
+	return caches[RESPONSE_CACHE_ALIAS]
+
+def tag_key(tag):
+	return 'rango:response_tag:{0}'.format(tag)
+
+def tag_versions(tags):
+	cache = get_cache()
+	keys = dict((tag_key(tag), tag) for tag in tags)
+	found = cache.get_many(list(keys))
+	versions = {}
+	for key, tag in keys.items():
+		if key in found:
+			versions[tag] = found[key]
+		else:
+			# Seeded from the clock, like rango.versions, so a tag that was evicted from the
+			# cache can never come back as a version stale entries were stored under
+			version = int(time.time() * 1000)
+			if not cache.add(key, version, None):
+				version = cache.get(key, version)
+			versions[tag] = version
+	return versions
+
+def invalidate(*tags):
+	'''Mark every response that depends on one of these tags as stale.'''
+	if not RESPONSE_CACHE:
+		return
+	cache = get_cache()
+	for tag in tags:
+		try:
+			cache.incr(tag_key(tag))
+		except ValueError:
+			# No version yet, so no entry was stored under one either
+			pass
+
+def invalidate_categories(category_ids):
+	# The pages of categories are tagged by slug, which is what their URLs have
+	if not RESPONSE_CACHE or not category_ids:
+		return
+	from rango.models import Category
+	slugs = Category.objects.filter(id__in=list(category_ids)).values_list('slug', flat=True)
+	invalidate(*['category:{0}'.format(slug) for slug in slugs])
+
+def entry_key(request):
+	# Keyed by URL, query string included, and by who is asking; only anonymous
+	# responses are stored, but the key says so in case that ever changes
+	# (hashed, as memcached keys can't be longer than 250 characters)
+	auth = 'user' if request.user.is_authenticated() else 'anon'
+	path = hashlib.md5(request.get_full_path().encode('utf-8')).hexdigest()
+	return 'rango:response:{0}:{1}'.format(auth, path)
+
+def lock_key(key):
+	return key + ':lock'
+
+def cacheable(response, request):
+	# Anything that sets a cookie (a session, a new CSRF token) is someone's own, not everybody's
+	return (response.status_code == 200 and not response.cookies and not response.streaming
+		and not request.META.get('CSRF_COOKIE_USED'))
+
+def not_modified(request, response):
+	# A cached response still answers conditional GETs with the validators it was stored with
+	# The stored ETag header is already quoted, which is how get_conditional_response compares them
+	last_modified = response.get('Last-Modified')
+	return get_conditional_response(request,
+		etag=response.get('ETag'),
+		last_modified=parse_http_date_safe(last_modified) if last_modified else None,
+		response=response)
+
+def cache_anonymous(tags, timeout=None):
+	'''Decorator caching a view's responses to anonymous GETs. `tags` is a function of the view's
+	arguments, (request, *args, **kwargs), giving the tags the response depends on.'''
+	def decorator(view):
+		@wraps(view)
+		def wrapper(request, *args, **kwargs):
+			if not RESPONSE_CACHE or request.method not in ('GET', 'HEAD') or request.user.is_authenticated():
+				return view(request, *args, **kwargs)
+			cache = get_cache()
+			key = entry_key(request)
+			entry = cache.get(key)
+			if entry is not None:
+				current = tag_versions(entry['tags'])
+				if current == entry['tags'] and time.time() < entry['expires']:
+					return not_modified(request, entry['response']) or entry['response']
+				# Stale: only the request that gets the lock renders it again, the rest make do with the old copy
+				if not cache.add(lock_key(key), 1, REGENERATE_LOCK_TIMEOUT):
+					return not_modified(request, entry['response']) or entry['response']
+			try:
+				# Versions are read before rendering, so a change made while rendering leaves the entry stale
+				versions = tag_versions(tags(request, *args, **kwargs))
+				response = view(request, *args, **kwargs)
+				if cacheable(response, request):
+					if hasattr(response, 'render') and callable(response.render):
+						response.render()
+					lifetime = timeout if timeout is not None else RESPONSE_CACHE_TIMEOUT
+					cache.set(key, {'response': response, 'tags': versions, 'expires': time.time() + lifetime},
+						lifetime + RESPONSE_CACHE_GRACE)
+			finally:
+				if entry is not None:
+					cache.delete(lock_key(key))
+			return response
+		return wrapper
+	return decorator
@@ -0,0 +1,260 @@
+import math
+import re
+import threading
+from bisect import bisect_left, insort
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.urlresolvers import reverse
+from django.db import connection
+from django.template.defaultfilters import slugify
+from rango.models import Category, Page
+
+# Full text search over category names and page titles/urls.
+# On SQLite the index is the rango_search FTS5 table (created by migration 0007), anywhere
+# else - or if SQLite was built without FTS5 - an inverted index kept in memory is used instead.
+# Either way the index is kept up to date by the Category/Page signals in rango/signals.py.
+SEARCH_BACKEND = getattr(settings, 'RANGO_SEARCH_BACKEND', 'auto')
+SEARCH_PAGE_SIZE = getattr(settings, 'RANGO_SEARCH_PAGE_SIZE', 20)
+
+FTS_TABLE = 'rango_search'
+TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+
+# Matches in a title (or category name) count for more than matches in a url
+TITLE_WEIGHT = 10.0
+URL_WEIGHT = 1.0
+
+KINDS = ('category', 'page')
+
+def tokenize(text):
+	return TOKEN_RE.findall(text.lower())
+
+def category_document(category):
+	return {'kind': 'category', 'obj_id': category.id, 'title': category.name, 'url': ''}
+
+def page_document(page):
+	return {'kind': 'page', 'obj_id': page.id, 'title': page.title, 'url': page.url}
+
+def doc_rowid(kind, obj_id):
+	# Categories and pages share the index, so fold the kind into the row id
+	return obj_id * len(KINDS) + KINDS.index(kind)
+
+class FTSBackend(object):
+	'''Search using the SQLite FTS5 table. Ranking is FTS5's bm25().'''
+
+	@classmethod
+	def available(cls):
+		return connection.vendor == 'sqlite' and FTS_TABLE in connection.introspection.table_names()
+
+	def index(self, doc):
+		with connection.cursor() as cursor:
+			cursor.execute(
+				'INSERT OR REPLACE INTO {0} (rowid, kind, obj_id, title, url) VALUES (%s, %s, %s, %s, %s)'.format(FTS_TABLE),
+				[doc_rowid(doc['kind'], doc['obj_id']), doc['kind'], doc['obj_id'], doc['title'], doc['url']])
+
+	def remove(self, kind, obj_id):
+		with connection.cursor() as cursor:
+			cursor.execute('DELETE FROM {0} WHERE rowid = %s'.format(FTS_TABLE), [doc_rowid(kind, obj_id)])
+
+	def rebuild(self):
+		with connection.cursor() as cursor:
+			cursor.execute('DELETE FROM {0}'.format(FTS_TABLE))
+			cursor.execute(
+				"INSERT INTO {0} (rowid, kind, obj_id, title, url) SELECT id * {1} + {2}, 'category', id, name, '' FROM {3}".format(
+					FTS_TABLE, len(KINDS), KINDS.index('category'), Category._meta.db_table))
+			cursor.execute(
+				"INSERT INTO {0} (rowid, kind, obj_id, title, url) SELECT id * {1} + {2}, 'page', id, title, url FROM {3}".format(
+					FTS_TABLE, len(KINDS), KINDS.index('page'), Page._meta.db_table))
+
+	def match_expression(self, tokens):
+		# Every token has to match, as a prefix so partially typed words find something
+		return ' '.join('"{0}"*'.format(token) for token in tokens)
+
+	def count(self, tokens):
+		with connection.cursor() as cursor:
+			cursor.execute('SELECT count(*) FROM {0} WHERE {0} MATCH %s'.format(FTS_TABLE), [self.match_expression(tokens)])
+			return cursor.fetchone()[0]
+
+	def search(self, tokens, offset, limit):
+		rank = 'bm25({0}, 0, 0, {1}, {2})'.format(FTS_TABLE, TITLE_WEIGHT, URL_WEIGHT)
+		with connection.cursor() as cursor:
+			cursor.execute(
+				'SELECT kind, obj_id, title, url FROM {0} WHERE {0} MATCH %s ORDER BY {1} LIMIT %s OFFSET %s'.format(FTS_TABLE, rank),
+				[self.match_expression(tokens), limit, offset])
+			return [dict(zip(('kind', 'obj_id', 'title', 'url'), row)) for row in cursor.fetchall()]
+
+	def filter(self, queryset, kind, tokens):
+		# A subquery on the index, so the matches never have to come back to Python
+		return queryset.extra(
+			where=['{0}.{1} IN (SELECT obj_id FROM {2} WHERE {2} MATCH %s AND kind = %s)'.format(
+				connection.ops.quote_name(queryset.model._meta.db_table), connection.ops.quote_name('id'), FTS_TABLE)],
+			params=[self.match_expression(tokens), kind])
+
+class MemoryBackend(object):
+	'''Search using an inverted index held in memory, built from the database on first use.
+	The index terms are kept sorted so prefix lookups are a bisect rather than a scan.'''
+
+	def __init__(self):
+		self.lock = threading.RLock()
+		self.built = False
+		self.docs = {}
+		self.doc_terms = {}
+		self.postings = defaultdict(dict)
+		self.terms = []
+
+	def build(self):
+		with self.lock:
+			if self.built:
+				return
+			for category in Category.objects.only('id', 'name').iterator():
+				self.add(category_document(category))
+			for page in Page.objects.only('id', 'title', 'url').iterator():
+				self.add(page_document(page))
+			self.built = True
+
+	def add(self, doc):
+		key = (doc['kind'], doc['obj_id'])
+		self.discard(key)
+		weights = defaultdict(float)
+		for token in tokenize(doc['title']):
+			weights[token] += TITLE_WEIGHT
+		for token in tokenize(doc['url']):
+			weights[token] += URL_WEIGHT
+		for token, weight in weights.items():
+			if token not in self.postings:
+				insort(self.terms, token)
+			self.postings[token][key] = weight
+		self.docs[key] = doc
+		self.doc_terms[key] = list(weights)
+
+	def discard(self, key):
+		for token in self.doc_terms.pop(key, ()):
+			postings = self.postings[token]
+			postings.pop(key, None)
+			if not postings:
+				del self.postings[token]
+				del self.terms[bisect_left(self.terms, token)]
+		self.docs.pop(key, None)
+
+	def rebuild(self):
+		# Start over from the database the next time it is searched
+		with self.lock:
+			self.built = False
+			self.docs = {}
+			self.doc_terms = {}
+			self.postings = defaultdict(dict)
+			self.terms = []
+
+	def index(self, doc):
+		with self.lock:
+			if self.built:
+				self.add(doc)
+
+	def remove(self, kind, obj_id):
+		with self.lock:
+			if self.built:
+				self.discard((kind, obj_id))
+
+	def prefix_terms(self, prefix):
+		i = bisect_left(self.terms, prefix)
+		while i < len(self.terms) and self.terms[i].startswith(prefix):
+			yield self.terms[i]
+			i += 1
+
+	def ranked(self, tokens):
+		self.build()
+		with self.lock:
+			scores = None
+			total_docs = len(self.docs) or 1
+			for token in tokens:
+				token_scores = defaultdict(float)
+				for term in self.prefix_terms(token):
+					postings = self.postings[term]
+					idf = math.log(1 + total_docs / float(len(postings)))
+					for key, weight in postings.items():
+						token_scores[key] += weight * idf
+				if scores is None:
+					scores = token_scores
+				else:
+					# Every token has to match
+					scores = dict((key, score + token_scores[key]) for key, score in scores.items() if key in token_scores)
+			ranked = sorted((scores or {}).items(), key=lambda item: (-item[1], item[0]))
+			return [self.docs[key] for key, score in ranked]
+
+	def count(self, tokens):
+		return len(self.ranked(tokens))
+
+	def search(self, tokens, offset, limit):
+		return self.ranked(tokens)[offset:offset + limit]
+
+	def filter(self, queryset, kind, tokens):
+		return queryset.filter(id__in=[doc['obj_id'] for doc in self.ranked(tokens) if doc['kind'] == kind])
+
+backend = None
+backend_lock = threading.Lock()
+
+def get_backend():
+	global backend
+	with backend_lock:
+		if backend is None:
+			use_fts = SEARCH_BACKEND == 'fts5' or (SEARCH_BACKEND == 'auto' and FTSBackend.available())
+			backend = FTSBackend() if use_fts else MemoryBackend()
+	return backend
+
+def index_category(category):
+	get_backend().index(category_document(category))
+
+def index_page(page):
+	get_backend().index(page_document(page))
+
+def remove_category(category_id):
+	get_backend().remove('category', category_id)
+
+def remove_page(page_id):
+	get_backend().remove('page', page_id)
+
+def rebuild_index():
+	# For bulk loads, which don't send the signals that normally keep the index up to date
+	get_backend().rebuild()
+
+def result_for(doc):
+	# What search.html shows for each hit
+	if doc['kind'] == 'category':
+		# Category.save always derives the slug from the name
+		return {'title': doc['title'], 'link': reverse('show_category', args=[slugify(doc['title'])]), 'summary': 'Category'}
+	return {'title': doc['title'], 'link': '{0}?page_id={1}'.format(reverse('goto'), doc['obj_id']), 'summary': doc['url']}
+
+class SearchResults(object):
+	'''The results of a query as a lazy sequence, so a Paginator only fetches the page it shows.'''
+
+	def __init__(self, query):
+		self.query = query
+		self.tokens = tokenize(query)
+		self.total = None
+
+	def count(self):
+		if self.total is None:
+			self.total = get_backend().count(self.tokens) if self.tokens else 0
+		return self.total
+
+	def __len__(self):
+		return self.count()
+
+	def __getitem__(self, index):
+		if not isinstance(index, slice):
+			return self[index:index + 1][0]
+		if not self.tokens:
+			return []
+		start = index.start or 0
+		stop = self.count() if index.stop is None else index.stop
+		return [result_for(doc) for doc in get_backend().search(self.tokens, start, max(stop - start, 0))]
+
+def search(query):
+	return SearchResults(query)
+
+def filter_queryset(queryset, kind, query):
+	'''Narrow a queryset of categories or pages (kind) to those matching query, using the index.'''
+	tokens = tokenize(query)
+	if not tokens:
+		return queryset
+	return get_backend().filter(queryset, kind, tokens)
@@ -0,0 +1,138 @@
+from django.db.models.signals import pre_save, post_save, post_delete
+from django.dispatch import receiver
+from django.contrib.auth.models import User
+from rango.models import Category, CategoryLike, Page, UserProfile
+from rango import analytics, category_stats, clicks, leaderboards, likes, response_cache, search, slugs, suggestions
+from rango.versions import bump_version
+
+# Keep the cached page_id -> url map used by track_url in step with the Page table
+@receiver(post_save, sender=Page)
+@receiver(post_delete, sender=Page)
+def page_changed(sender, instance, **kwargs):
+	clicks.forget_page_url(instance.id)
+
+@receiver(pre_save, sender=Page)
+def page_saving(sender, instance, raw=False, **kwargs):
+	# Remember which category an existing page was in and its views, so page_saved can move
+	# the categories' totals on by just the difference
+	if instance.pk and not raw:
+		old = Page.objects.filter(pk=instance.pk).values_list('category_id', 'views', 'url').first()
+		if old:
+			instance._old_category_id, instance._old_views = old[0], old[1]
+			if old[2] != instance.url:
+				# What check_links found out was about the old url
+				instance.final_url = instance.link_etag = instance.link_last_modified = ''
+				instance.link_status = instance.checked_at = None
+
+# Cached responses showing a page: the index's leaderboard and its category's page
+@receiver(post_save, sender=Page)
+@receiver(post_delete, sender=Page)
+def page_response_changed(sender, instance, **kwargs):
+	response_cache.invalidate('pages')
+	response_cache.invalidate_categories(set([instance.category_id, getattr(instance, '_old_category_id', None)]) - set([None]))
+
+@receiver(post_save, sender=Page)
+def page_saved(sender, instance, created, raw=False, **kwargs):
+	leaderboards.page_board.update_instance(instance)
+	search.index_page(instance)
+	if raw:
+		# Loaded from a fixture, which brings its categories' totals along
+		return
+	if created:
+		category_stats.page_created(instance)
+	elif hasattr(instance, '_old_views'):
+		category_stats.page_changed(instance, instance._old_category_id, instance._old_views)
+	else:
+		# The row turned up between page_saving's look and the save: count its category again
+		category_stats.recompute([instance.category_id])
+		category_stats.touch([instance.category_id])
+
+@receiver(post_delete, sender=Page)
+def page_deleted(sender, instance, **kwargs):
+	category_stats.page_deleted(instance)
+	leaderboards.page_board.discard(instance.id)
+	search.remove_page(instance.id)
+
+@receiver(clicks.views_flushed)
+def views_flushed(sender, counts, **kwargs):
+	leaderboards.refresh_pages(list(counts))
+	analytics.schedule_rollup()
+	# More views can reorder the index's pages and those of the pages' categories
+	response_cache.invalidate('pages')
+	if response_cache.RESPONSE_CACHE:
+		response_cache.invalidate_categories(set(Page.objects.filter(id__in=list(counts)).values_list('category_id', flat=True)))
+
+# Any change to a category invalidates the cached sidebar list, and so every cached response
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+def category_changed(sender, instance, **kwargs):
+	bump_version('category')
+	response_cache.invalidate('categories')
+	# By id for the slug it had, and by the slug it has now, which may have been cached as missing
+	slugs.slug_cache.forget(category_ids=[instance.id], slugs=[instance.slug])
+
+@receiver(post_save, sender=Category)
+def category_saved(sender, instance, **kwargs):
+	leaderboards.category_board.update_instance(instance)
+	search.index_category(instance)
+	suggestions.category_changed(instance)
+
+@receiver(post_delete, sender=Category)
+def category_deleted(sender, instance, **kwargs):
+	leaderboards.category_board.discard(instance.id)
+	search.remove_category(instance.id)
+	suggestions.category_deleted(instance.id)
+
+# Likes go into Category.likes through the buffered like counter, whether they are added or
+# taken away by unlike, or by the user or category being deleted
+@receiver(post_save, sender=CategoryLike)
+def like_saved(sender, instance, created, raw=False, **kwargs):
+	if created and not raw:
+		likes.like_counter.record(instance.category_id, 1)
+
+@receiver(post_delete, sender=CategoryLike)
+def like_deleted(sender, instance, **kwargs):
+	likes.like_counter.record(instance.category_id, -1)
+
+@receiver(likes.likes_flushed)
+def likes_flushed(sender, counts, **kwargs):
+	leaderboards.refresh_categories(list(counts))
+	for category in Category.objects.filter(id__in=list(counts)).values('id', 'name', 'slug', 'likes'):
+		suggestions.suggester.update(category)
+	# Only the index shows likes, as the order of its most liked categories
+	response_cache.invalidate('likes')
+
+# The cached profile directory lists usernames and pictures
+@receiver(post_save, sender=UserProfile)
+@receiver(post_delete, sender=UserProfile)
+@receiver(post_delete, sender=User)
+def profile_changed(sender, instance, **kwargs):
+	bump_version('profile')
+
+@receiver(post_save, sender=User)
+def user_saved(sender, instance, update_fields=None, **kwargs):
+	# Logging in saves last_login and nothing else, which doesn't change the directory
+	if update_fields is None or set(update_fields) - set(['last_login']):
+		bump_version('profile')
+
+def catalogue_rewritten(page_ids=()):
+	# Bulk writes (bulk_create, queryset.update) don't send the signals above, so whatever
+	# does them calls this afterwards. page_ids are existing pages whose url may have changed.
+	bump_version('category')
+	response_cache.invalidate('categories')
+	slugs.slug_cache.clear()
+	leaderboards.category_board.invalidate()
+	leaderboards.page_board.invalidate()
+	search.rebuild_index()
+	suggestions.suggester.reset()
+	for page_id in page_ids:
+		clicks.forget_page_url(page_id)
+
+def pages_rearranged(deltas):
+	# Bulk updates of pages' views or categories (the admin's actions), which leave titles and
+	# urls, and so the search index and the goto urls, as they were. deltas are what each
+	# category that gained or lost pages or views got, {category_id: (pages, views)}.
+	category_stats.apply_deltas(deltas)
+	leaderboards.page_board.invalidate()
+	response_cache.invalidate('pages')
+	response_cache.invalidate_categories(list(deltas))
@@ -0,0 +1,76 @@
+import copy
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from rango.models import Category
+
+# Category slug -> category, for the views under /rango/category/<slug>/, kept in a bounded LRU
+# in this process. Slugs that don't exist are remembered too (for a shorter while), so bots
+# trying made up slugs don't reach the database either.
+# Category saves and deletes (rango/signals.py), and the bulk updates of a category's row (page
+# totals, likes, the importer) forget the entries concerned. Changes made by other processes
+# can't reach this one, which is why entries also expire.
+SLUG_CACHE_SIZE = getattr(settings, 'RANGO_SLUG_CACHE_SIZE', 1000)
+SLUG_CACHE_TIMEOUT = getattr(settings, 'RANGO_SLUG_CACHE_TIMEOUT', 60)
+SLUG_CACHE_NEGATIVE_TIMEOUT = getattr(settings, 'RANGO_SLUG_CACHE_NEGATIVE_TIMEOUT', 10)
+
+class SlugCache(object):
+
+	def __init__(self, size=SLUG_CACHE_SIZE, timeout=SLUG_CACHE_TIMEOUT, negative_timeout=SLUG_CACHE_NEGATIVE_TIMEOUT):
+		self.size = size
+		self.timeout = timeout
+		self.negative_timeout = negative_timeout
+		self.lock = threading.Lock()
+		# slug -> (expires, category or None), least recently used first
+		self.entries = OrderedDict()
+		# category id -> slug, to forget categories by id
+		self.slugs = {}
+
+	def get(self, slug):
+		'''The category with this slug, or None if there is none.'''
+		now = time.time()
+		with self.lock:
+			entry = self.entries.get(slug)
+			if entry is not None and entry[0] > now:
+				self.entries.move_to_end(slug)
+				# A copy, so nobody can change (or save) the one in the cache
+				return copy.copy(entry[1])
+		category = Category.objects.filter(slug=slug).first()
+		with self.lock:
+			self.discard(slug)
+			timeout = self.timeout if category is not None else self.negative_timeout
+			self.entries[slug] = (now + timeout, category)
+			if category is not None:
+				self.slugs[category.id] = slug
+			while len(self.entries) > self.size:
+				self.discard(next(iter(self.entries)))
+		return copy.copy(category)
+
+	def discard(self, slug):
+		entry = self.entries.pop(slug, None)
+		if entry is not None and entry[1] is not None:
+			self.slugs.pop(entry[1].id, None)
+
+	def forget(self, category_ids=(), slugs=()):
+		with self.lock:
+			for category_id in category_ids:
+				slug = self.slugs.get(category_id)
+				if slug is not None:
+					self.discard(slug)
+			for slug in slugs:
+				self.discard(slug)
+
+	def clear(self):
+		with self.lock:
+			self.entries.clear()
+			self.slugs.clear()
+
+slug_cache = SlugCache()
+
+def get_category(slug):
+	return slug_cache.get(slug)
+
+def forget_categories(category_ids):
+	slug_cache.forget(category_ids=category_ids)
@@ -0,0 +1,85 @@
+import gzip
+import io
+
+from django.conf import settings
+from django.contrib.staticfiles.storage import ManifestStaticFilesStorage
+from django.core.files.base import ContentFile
+
+try:
+	import brotli
+except ImportError:
+	brotli = None
+
+# Bundles to build at collectstatic time: bundle name -> the static files it is made of, in order.
+ASSET_BUNDLES = getattr(settings, 'RANGO_ASSET_BUNDLES', {})
+COMPRESSED_EXTENSIONS = ('.css', '.js', '.map', '.svg', '.txt', '.json', '.html', '.eot', '.ttf', '.ico')
+# Below this, compressing isn't worth the extra file
+MIN_COMPRESS_SIZE = 256
+
+class BundledManifestStaticFilesStorage(ManifestStaticFilesStorage):
+	'''ManifestStaticFilesStorage that, during collectstatic, also concatenates RANGO_ASSET_BUNDLES
+	and writes a .gz (and, with the brotli package, a .br) copy of every compressible file.
+	The bundles are built before hashing, so they get content hashed names like everything else.'''
+
+	def post_process(self, paths, dry_run=False, **options):
+		if dry_run:
+			return
+		for bundle, sources in ASSET_BUNDLES.items():
+			self.build_bundle(bundle, sources)
+			paths[bundle] = (self, bundle)
+
+		written = set()
+		for name, hashed_name, processed in super(BundledManifestStaticFilesStorage, self).post_process(paths, dry_run, **options):
+			written.add(name)
+			if hashed_name:
+				written.add(hashed_name)
+			yield name, hashed_name, processed
+		for name in sorted(written):
+			self.compress(name)
+
+	def build_bundle(self, bundle, sources):
+		parts = []
+		for source in sources:
+			with self.open(source) as f:
+				parts.append(f.read())
+		# A newline (and for scripts, a semicolon) between files so one can't run into the next
+		separator = b'\n;\n' if bundle.endswith('.js') else b'\n'
+		if self.exists(bundle):
+			self.delete(bundle)
+		self._save(bundle, ContentFile(separator.join(parts)))
+
+	def compress(self, name):
+		if not name.endswith(COMPRESSED_EXTENSIONS) or not self.exists(name):
+			return
+		with self.open(name) as f:
+			content = f.read()
+		if len(content) < MIN_COMPRESS_SIZE:
+			return
+		out = io.BytesIO()
+		with gzip.GzipFile(filename='', mode='wb', fileobj=out, compresslevel=9, mtime=0) as gz:
+			gz.write(content)
+		self.save_compressed(name + '.gz', out.getvalue(), len(content))
+		if brotli is not None:
+			self.save_compressed(name + '.br', brotli.compress(content), len(content))
+
+	def save_compressed(self, name, content, original_size):
+		# Only keep it if it is actually smaller
+		if len(content) >= original_size:
+			return
+		if self.exists(name):
+			self.delete(name)
+		self._save(name, ContentFile(content))
+
+	def stored_name(self, name):
+		# Without a collectstatic (tests, a fresh checkout with DEBUG off) fall back to the plain
+		# name instead of failing to render the page
+		try:
+			return super(BundledManifestStaticFilesStorage, self).stored_name(name)
+		except ValueError:
+			return name
+
+	def hashed_names(self):
+		return set(self.hashed_files.values())
+
+def bundle_sources(bundle):
+	return ASSET_BUNDLES.get(bundle, [bundle])
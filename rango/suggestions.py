@@ -0,0 +1,79 @@
+import heapq
+import threading
+from bisect import bisect_left, insort
+
+from django.conf import settings
+from rango.models import Category
+
+# Category name suggestions for the sidebar type-ahead, answered from memory.
+# Names are kept in a sorted list so every name with a given prefix is one bisect away.
+SUGGESTION_LIMIT = getattr(settings, 'RANGO_SUGGESTION_LIMIT', 8)
+
+class CategorySuggester(object):
+
+	def __init__(self):
+		self.lock = threading.Lock()
+		self.built = False
+		self.names = []
+		self.categories = {}
+
+	def build(self):
+		categories = Category.objects.values('id', 'name', 'slug', 'likes')
+		with self.lock:
+			if self.built:
+				return
+			for category in categories:
+				self.add(category)
+			self.built = True
+
+	def add(self, category):
+		self.discard(category['id'])
+		self.categories[category['id']] = category
+		insort(self.names, (category['name'].lower(), category['id']))
+
+	def discard(self, category_id):
+		old = self.categories.pop(category_id, None)
+		if old is not None:
+			del self.names[bisect_left(self.names, (old['name'].lower(), category_id))]
+
+	def update(self, category):
+		# category is a dict with id, name, slug and likes
+		with self.lock:
+			if self.built:
+				self.add(category)
+
+	def remove(self, category_id):
+		with self.lock:
+			if self.built:
+				self.discard(category_id)
+
+	def reset(self):
+		with self.lock:
+			self.built = False
+			self.names = []
+			self.categories = {}
+
+	def suggest(self, prefix, limit=SUGGESTION_LIMIT):
+		# The `limit` most liked categories whose name starts with prefix
+		if not self.built:
+			self.build()
+		prefix = prefix.lower()
+		with self.lock:
+			start = bisect_left(self.names, (prefix,))
+			matches = []
+			for name, category_id in self.names[start:]:
+				if not name.startswith(prefix):
+					break
+				matches.append(self.categories[category_id])
+		return heapq.nsmallest(limit, matches, key=lambda c: (-c['likes'], c['name']))
+
+suggester = CategorySuggester()
+
+def category_changed(category):
+	suggester.update({'id': category.id, 'name': category.name, 'slug': category.slug, 'likes': category.likes})
+
+def category_deleted(category_id):
+	suggester.remove(category_id)
+
+def suggest_categories(prefix, limit=SUGGESTION_LIMIT):
+	return suggester.suggest(prefix, limit)
@@ -0,0 +1,146 @@
+import hashlib
+import json
+import logging
+import threading
+import traceback
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, connection, transaction
+from django.db.models import F, Q
+from django.utils import timezone
+from django.utils.module_loading import import_string
+from rango.models import Task
+
+# A small task queue for work that shouldn't hold up a request (thumbnails, link checks).
+# Tasks are rows in the rango_task table: a request adds one, inside its own transaction, and
+# a worker claims it with a conditional UPDATE, runs it and deletes it. A task that raises is
+# tried again later, up to max_attempts times, then left as 'failed' for someone to look at.
+# Workers run as threads in the web process (RANGO_TASK_INLINE_WORKERS of them, started on
+# first use), or in their own processes with `manage.py run_tasks`.
+logger = logging.getLogger('rango.tasks')
+
+# Seconds a worker has to finish a task before another may take it over
+LEASE = getattr(settings, 'RANGO_TASK_LEASE', 5 * 60)
+# Seconds before the first retry, doubled for each one after
+RETRY_DELAY = getattr(settings, 'RANGO_TASK_RETRY_DELAY', 30)
+POLL_INTERVAL = getattr(settings, 'RANGO_TASK_POLL_INTERVAL', 5)
+
+registry = {}
+
+def task(max_attempts=3):
+	'''Decorator making a function a task: f.delay(*args) queues a call to it.
+	Arguments have to be JSON serialisable. With f.delay(*args, dedupe=True), a call that is
+	already queued with the same arguments isn't queued again; with countdown=n, it runs in n seconds at the earliest.'''
+	def decorator(func):
+		name = '{0}.{1}'.format(func.__module__, func.__name__)
+		registry[name] = func
+		func.max_attempts = max_attempts
+		func.delay = lambda *args, **kwargs: enqueue(name, args, max_attempts, **kwargs)
+		return func
+	return decorator
+
+def enqueue(name, args=(), max_attempts=3, dedupe=False, countdown=0):
+	'''Queue a call of the task `name`. Returns False if an identical one was already waiting.'''
+	encoded = json.dumps(list(args), sort_keys=True)
+	dedupe_key = hashlib.sha1((name + encoded).encode('utf-8')).hexdigest() if dedupe else None
+	run_after = timezone.now() + timedelta(seconds=countdown)
+	if dedupe_key is None:
+		Task.objects.create(name=name, args=encoded, max_attempts=max_attempts, run_after=run_after)
+	else:
+		try:
+			# In a savepoint, so a duplicate doesn't break the caller's transaction
+			with transaction.atomic():
+				Task.objects.create(name=name, args=encoded, dedupe_key=dedupe_key, max_attempts=max_attempts,
+					run_after=run_after)
+		except IntegrityError:
+			return False
+	# Workers can only see the task once whatever transaction we are in has committed
+	transaction.on_commit(wake_workers)
+	return True
+
+def claim(now):
+	'''Take the next task that is due: pending, or running on a lease that ran out.'''
+	due = Task.objects.filter(Q(status=Task.PENDING) | Q(status=Task.RUNNING, locked_until__lt=now),
+		run_after__lte=now).order_by('run_after', 'id')
+	for task_id, status, locked_until in due.values_list('id', 'status', 'locked_until')[:10]:
+		# Only one worker's UPDATE can match, whoever gets 0 rows lost the race and tries the next.
+		# Dropping the dedupe key lets the same work be queued again while this runs.
+		claimed = Task.objects.filter(id=task_id, status=status, locked_until=locked_until).update(
+			status=Task.RUNNING, locked_until=now + timedelta(seconds=LEASE), attempts=F('attempts') + 1,
+			dedupe_key=None)
+		if claimed:
+			return Task.objects.get(id=task_id)
+	return None
+
+def run_one():
+	'''Claim and run one task. Returns False when nothing was due.'''
+	task = claim(timezone.now())
+	if task is None:
+		return False
+	# The row as long as it is still ours: if this run outlasts its lease, claim() may hand the task
+	# to another worker, and then the outcome is that worker's to record, not ours
+	held = Task.objects.filter(id=task.id, locked_until=task.locked_until)
+	try:
+		func = registry.get(task.name)
+		if func is None:
+			# Importing the module registers its tasks
+			import_string(task.name)
+			func = registry[task.name]
+		func(*json.loads(task.args))
+	except Exception:
+		error = traceback.format_exc()
+		if task.attempts < task.max_attempts:
+			delay = RETRY_DELAY * 2 ** (task.attempts - 1)
+			logger.warning('Task %s %s failed (attempt %d), retrying in %ds', task.id, task.name, task.attempts, delay)
+			held_on = held.update(status=Task.PENDING, last_error=error,
+				run_after=timezone.now() + timedelta(seconds=delay), locked_until=None)
+		else:
+			logger.error('Task %s %s failed for good:\n%s', task.id, task.name, error)
+			held_on = held.update(status=Task.FAILED, last_error=error, locked_until=None)
+	else:
+		held_on = held.delete()[0]
+	if not held_on:
+		logger.warning('Task %s %s outlasted its lease, its outcome is left to the worker that took it over',
+			task.id, task.name)
+	return True
+
+def run_pending(limit=None):
+	'''Run due tasks until there are none left (or `limit` have run). Returns how many ran.'''
+	count = 0
+	while (limit is None or count < limit) and run_one():
+		count += 1
+	return count
+
+def work(stop, poll_interval=POLL_INTERVAL):
+	# A worker: run whatever is due, then sleep until woken by a new task or the poll interval passes
+	while not stop.is_set():
+		try:
+			run_pending()
+		except Exception:
+			logger.exception('Task worker error')
+		finally:
+			connection.close()
+		wakeup.wait(poll_interval)
+		wakeup.clear()
+
+wakeup = threading.Event()
+workers_lock = threading.Lock()
+workers = []
+stopping = threading.Event()
+
+def wake_workers():
+	start_inline_workers()
+	wakeup.set()
+
+def start_inline_workers():
+	# Read when the first task is queued rather than at import, so it can be overridden (e.g. by `manage.py benchmark`)
+	count = getattr(settings, 'RANGO_TASK_INLINE_WORKERS', 1)
+	with workers_lock:
+		if workers or not count:
+			return
+		for i in range(count):
+			thread = threading.Thread(target=work, args=(stopping,), name='rango-tasks-{0}'.format(i))
+			thread.daemon = True
+			thread.start()
+			workers.append(thread)
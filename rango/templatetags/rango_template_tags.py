@@ -1,8 +1,58 @@
 from django import template
+from django.conf import settings
+from django.contrib.staticfiles.storage import staticfiles_storage
+from django.core.cache import cache
+from django.utils.html import format_html_join
+from django.template.loader import render_to_string
+from django.utils.safestring import mark_safe
 from rango.models import Category
+from rango.versions import get_version
+from rango import thumbnails
+from rango.storage import bundle_sources
 
 register = template.Library()
 
-@register.inclusion_tag('rango/cats.html')
+# Seconds a version's sidebar is kept; also how long another process (without a shared
+# RANGO_VERSION_CACHE, see rango/versions.py) may go on showing an older one
+SIDEBAR_CACHE_TIMEOUT = getattr(settings, 'RANGO_SIDEBAR_CACHE_TIMEOUT', 60)
+
+def category_item(cat, active):
+	# One <li> of the list, as rango/cats.html renders it
+	return render_to_string('rango/cat_item.html', {'c': cat, 'active': active})
+
+@register.simple_tag
 def get_category_list(cat=None):
-	return {'cats': Category.objects.all(), 'act_cat':cat}
\ No newline at end of file
+	'''Renders rango/cats.html for the sidebar. The list is rendered and cached once per category
+	table version, with no category highlighted; the active one, if any, is swapped in afterwards.
+	So a warm sidebar costs no queries, and the cache holds one copy of it, not one per category.'''
+	version = get_version('category')
+	key = 'rango:cats_html:{0}'.format(version)
+	html = cache.get(key)
+	if html is None:
+		html = render_to_string('rango/cats.html', {'cats': list(Category.objects.all())})
+		cache.set(key, html, SIDEBAR_CACHE_TIMEOUT)
+	if isinstance(cat, Category):
+		html = html.replace(category_item(cat, False), category_item(cat, True), 1)
+	return mark_safe(html)
+
+@register.filter
+def thumbnail(profile, size):
+	'''{{ profile|thumbnail:64 }} - URL of a profile's 64x64 picture thumbnail (or the picture itself
+	until the thumbnail has been made). Takes a UserProfile or a profile directory entry.'''
+	if isinstance(profile, dict):
+		picture, name = profile.get('picture'), profile.get('picture_thumbnail')
+	else:
+		picture, name = profile.picture, profile.picture_thumbnail
+	return thumbnails.thumbnail_url(picture, name, int(size))
+
+@register.simple_tag
+def asset_bundle(bundle):
+	'''{% asset_bundle 'js/rango.bundle.js' %} - the tag(s) loading a RANGO_ASSET_BUNDLES bundle.
+	With DEBUG on, each source file is loaded on its own (no collectstatic needed); otherwise it is
+	the one bundle file that collectstatic built, under its content hashed name.'''
+	names = bundle_sources(bundle) if settings.DEBUG else [bundle]
+	if bundle.endswith('.css'):
+		html = '<link href="{0}" rel="stylesheet">\n'
+	else:
+		html = '<script src="{0}"></script>\n'
+	return format_html_join('', html, ((staticfiles_storage.url(name),) for name in names))
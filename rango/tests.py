@@ -1,3 +1,1189 @@
-from django.test import TestCase
+import gzip
+import io
+import json
+import os
+import re
+import shutil
+import socketserver
+import tempfile
+import threading
+import time
+from datetime import date, datetime, timedelta
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from unittest import mock
+
+from django.conf import settings
+from django.contrib.auth.models import AnonymousUser, User
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.management import CommandError, call_command
+from django.db import connection
+from django.http import HttpResponse
+from django.test import RequestFactory, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import resolve
+from django.utils import timezone
+from django.utils.six import StringIO
+
+from rango import (analytics, benchmark, clicks, db, exporter, leaderboards, likes, linkcheck, middleware, pagination,
+	profiles, response_cache, search, slugs, suggestions, tasks, thumbnails, views, visitors)
+from rango.importer import CatalogueImporter
+from rango.pagination import EstimatedCountPaginator, decode_cursor, keyset_page
+from rango.ratelimit import RateLimiter
+from rango.templatetags.rango_template_tags import get_category_list
+from rango.models import Category, Page, PageViewBucket, Task, UserProfile
 
 # Create your tests here.
+
+class RangoTestCase(TestCase):
+	# Each test's rows are rolled back, so nothing cached about them in this process may outlive it
+
+	def setUp(self):
+		cache.clear()
+		slugs.slug_cache.clear()
+		leaderboards.category_board.invalidate()
+		leaderboards.page_board.invalidate()
+		# Buffered clicks and likes are for rows that are rolled back too, the flusher threads mustn't write them
+		self.discard_buffered()
+		self.addCleanup(self.discard_buffered)
+
+	def discard_buffered(self):
+		for counter in clicks.counters:
+			counter.take()
+
+class ConditionalGetTests(RangoTestCase):
+
+	def setUp(self):
+		super(ConditionalGetTests, self).setUp()
+		self.category = Category.objects.create(name='Python')
+		Page.objects.create(category=self.category, title='Tutorial', url='http://docs.python.org/', views=3)
+
+	def assertNotModifiedOnRepeat(self, url):
+		response = self.client.get(url)
+		self.assertEqual(response.status_code, 200)
+		self.assertTrue(response['ETag'].startswith('"'))
+		repeat = self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+		self.assertEqual(repeat.status_code, 304)
+		self.assertEqual(repeat.content, b'')
+
+	def test_index_not_modified(self):
+		self.assertNotModifiedOnRepeat('/rango/')
+
+	def test_category_not_modified(self):
+		self.assertNotModifiedOnRepeat('/rango/category/python/')
+
+	def test_category_modified_after_change(self):
+		response = self.client.get('/rango/category/python/')
+		Page.objects.create(category=self.category, title='Another', url='http://python.org/')
+		repeat = self.client.get('/rango/category/python/', HTTP_IF_NONE_MATCH=response['ETag'])
+		self.assertEqual(repeat.status_code, 200)
+		self.assertNotEqual(repeat['ETag'], response['ETag'])
+
+	def test_stale_etag_gets_full_response(self):
+		response = self.client.get('/rango/category/python/', HTTP_IF_NONE_MATCH='"not-the-etag"')
+		self.assertEqual(response.status_code, 200)
+
+class APITests(RangoTestCase):
+
+	def setUp(self):
+		super(APITests, self).setUp()
+		self.python = Category.objects.create(name='Python', likes=10)
+		Category.objects.create(name='Django', likes=20)
+		Category.objects.create(name='Flask', likes=5)
+		for i in range(5):
+			Page.objects.create(category=self.python, title='Page {0}'.format(i), url='http://p{0}.com/'.format(i), views=i)
+
+	def get_json(self, url, **headers):
+		response = self.client.get(url, **headers)
+		return response, json.loads(response.content.decode('utf-8'))
+
+	def test_sparse_fields(self):
+		response, data = self.get_json('/rango/api/v1/categories/?fields=name,slug')
+		self.assertEqual(response.status_code, 200)
+		self.assertEqual(data['categories'][0], {'name': 'Python', 'slug': 'python'})
+
+	def test_cursor_pagination(self):
+		response, data = self.get_json('/rango/api/v1/categories/?sort=likes&limit=2&fields=name')
+		self.assertEqual([c['name'] for c in data['categories']], ['Django', 'Python'])
+		self.assertIn('rel="next"', response['Link'])
+		response, data = self.get_json(data['next'])
+		self.assertEqual([c['name'] for c in data['categories']], ['Flask'])
+		self.assertIsNone(data['next'])
+
+	def test_category_pages_by_views(self):
+		response, data = self.get_json('/rango/api/v1/categories/python/pages/?fields=title,views&limit=3')
+		self.assertEqual([p['views'] for p in data['pages']], [4, 3, 2])
+		response, data = self.get_json(data['next'])
+		self.assertEqual([p['views'] for p in data['pages']], [1, 0])
+
+	def test_unversioned_alias(self):
+		response, data = self.get_json('/rango/api/categories/python/pages/?limit=1')
+		self.assertEqual(response.status_code, 200)
+		self.assertEqual(data['category'], 'python')
+
+	def test_not_modified(self):
+		response = self.client.get('/rango/api/v1/categories/')
+		self.assertIn('max-age', response['Cache-Control'])
+		repeat = self.client.get('/rango/api/v1/categories/', HTTP_IF_NONE_MATCH=response['ETag'])
+		self.assertEqual(repeat.status_code, 304)
+		self.assertEqual(repeat['ETag'], response['ETag'])
+		Category.objects.create(name='Bottle')
+		changed = self.client.get('/rango/api/v1/categories/', HTTP_IF_NONE_MATCH=response['ETag'])
+		self.assertEqual(changed.status_code, 200)
+
+	def test_bad_parameters(self):
+		for query in ('fields=name,password', 'fields=,', 'sort=name', 'limit=x', 'limit=0', 'limit=-5',
+				'after=nonsense', 'after=1.2.3'):
+			response, data = self.get_json('/rango/api/v1/categories/?' + query)
+			self.assertEqual(response.status_code, 400, query)
+			self.assertIn('error', data)
+
+	def test_limit_capped(self):
+		response, data = self.get_json('/rango/api/v1/categories/?limit=100000')
+		self.assertEqual(response.status_code, 200)
+		self.assertEqual(len(data['categories']), 3)
+
+	def test_unknown_category(self):
+		response, data = self.get_json('/rango/api/v1/categories/nope/pages/')
+		self.assertEqual(response.status_code, 404)
+
+	def test_read_only(self):
+		self.assertEqual(self.client.post('/rango/api/v1/categories/').status_code, 405)
+
+class ImporterTests(RangoTestCase):
+
+	def setUp(self):
+		super(ImporterTests, self).setUp()
+		self.category = Category.objects.create(name='Python', views=1, likes=1)
+		self.pages = [Page.objects.create(category=self.category, title='Page {0}'.format(i),
+			url='http://example.com/{0}'.format(i), views=i) for i in range(20)]
+
+	def load(self, lines):
+		handle, path = tempfile.mkstemp(suffix='.jsonl')
+		with os.fdopen(handle, 'w') as f:
+			f.write(''.join(json.dumps(line) + '\n' for line in lines))
+		self.addCleanup(os.remove, path)
+		call_command('import_catalogue', path, batch_size=2, stdout=StringIO())
+
+	def test_existing_rows_updated_in_one_statement(self):
+		importer = CatalogueImporter(batch_size=100)
+		importer.add({'category': 'Python', 'views': 10, 'likes': 5})
+		for i in range(20):
+			importer.add({'category': 'Python', 'title': 'Page {0}'.format(i),
+				'url': 'http://example.com/{0}'.format(i + (i % 2)), 'views': 100 + i})
+		with CaptureQueriesContext(connection) as queries:
+			importer.flush()
+		updates = [query['sql'] for query in queries if query['sql'].startswith('UPDATE')]
+		# The category, the pages, and the link fields of the pages whose url changed
+		self.assertEqual(len(updates), 3)
+		stats = importer.finish()
+		self.assertEqual((stats['categories_updated'], stats['pages_updated']), (1, 20))
+		self.assertEqual(Category.objects.values_list('views', 'likes').get(), (10, 5))
+		for page in Page.objects.order_by('id'):
+			i = int(page.title.split()[1])
+			self.assertEqual((page.url, page.views), ('http://example.com/{0}'.format(i + (i % 2)), 100 + i))
+
+	def test_bad_record_still_finishes_loaded_batches(self):
+		with self.assertRaises(CommandError):
+			self.load([
+				{'category': 'Django', 'likes': 3},
+				{'category': 'Django', 'title': 'Docs', 'url': 'http://djangoproject.com/', 'views': 7},
+				{'category': 'Django', 'title': 'Tutorial', 'url': 'http://tutorial.djangoproject.com/'},
+				{'category': 'Django', 'title': 'Broken', 'url': 'http://example.com/', 'views': 'lots'},
+			])
+		django = Category.objects.get(name='Django')
+		# Counted like any finished import, so lists and search see what was loaded
+		self.assertEqual(django.page_count, 2)
+		self.assertEqual(django.total_page_views, 7)
+		response = self.client.get('/rango/search/', {'query': 'tutorial'})
+		self.assertContains(response, 'tutorial.djangoproject.com')
+
+	def test_bad_record_reported_when_finishing_fails(self):
+		with mock.patch.object(CatalogueImporter, 'finish', side_effect=RuntimeError('finish failed')):
+			with self.assertLogs('rango.importer', 'ERROR'):
+				with self.assertRaisesRegex(CommandError, 'Bad record 2'):
+					self.load([
+						{'category': 'Django', 'likes': 3},
+						{'category': 'Django', 'title': 'Broken', 'url': 'http://example.com/', 'views': 'lots'},
+					])
+
+class BenchmarkCompareTests(TestCase):
+
+	def results(self, **stats):
+		summary = dict({'requests': 10, 'errors': 0, 'p95_ms': 10.0, 'mean_queries': 3.0}, **stats)
+		return {'client': {'1': {'index': summary}}}
+
+	def test_unchanged(self):
+		self.assertEqual(benchmark.compare(self.results(), self.results(), 0.25), [])
+
+	def test_more_errors_is_a_regression(self):
+		# Even when the failures make it faster
+		regressions = benchmark.compare(self.results(), self.results(errors=3, p95_ms=1.0), 0.25)
+		self.assertEqual(regressions, ['client x1 index: 3 errors, was 0'])
+
+	def test_slower_or_more_queries(self):
+		self.assertEqual(len(benchmark.compare(self.results(), self.results(p95_ms=20.0, mean_queries=4.0), 0.25)), 2)
+
+class LinkCheckAddressTests(TestCase):
+
+	def check(self, url):
+		return linkcheck.run([(1, url, ('', '', ''))], timeout=2)[1]
+
+	def test_private_addresses_refused(self):
+		for url in ('http://127.0.0.1/', 'http://localhost:8000/admin/', 'http://10.0.0.1/', 'http://192.168.1.1/',
+				'http://169.254.169.254/latest/meta-data/', 'http://[::1]/', 'http://0.0.0.0/', 'http://224.0.0.1/'):
+			result = self.check(url)
+			self.assertIsNone(result.status, url)
+			self.assertIn('is not a public address', result.error)
+
+	def test_public_addresses(self):
+		self.assertTrue(linkcheck.is_public('93.184.216.34'))
+		self.assertTrue(linkcheck.is_public('2606:2800:220:1:248:1893:25c8:1946'))
+		self.assertFalse(linkcheck.is_public('::ffff:127.0.0.1'))
+		self.assertFalse(linkcheck.is_public('100.64.0.1'))
+
+class StubHandler(BaseHTTPRequestHandler):
+	# A site for the link checker: /old/ redirects to /new/, which has an ETag and a title that
+	# arrives in a second packet, /chunked/ sends its title in chunks, anything else is a 404
+
+	def do_GET(self):
+		self.server.requests.append((self.path, self.headers.get('If-None-Match')))
+		if self.path == '/old/':
+			self.send_response(301)
+			self.send_header('Location', '/new/')
+			self.send_header('Content-Length', '0')
+			self.end_headers()
+		elif self.path == '/new/' and self.headers.get('If-None-Match') == '"v1"':
+			self.send_response(304)
+			self.send_header('ETag', '"v1"')
+			self.end_headers()
+		elif self.path == '/new/':
+			self.send_response(200)
+			self.send_header('Content-Type', 'text/html; charset=utf-8')
+			self.send_header('ETag', '"v1"')
+			self.end_headers()
+			self.wfile.write(b'<html><head>' + b' ' * 2000)
+			self.wfile.flush()
+			time.sleep(0.05)
+			self.wfile.write('<title>\n  Rango &amp; Django \u2013 tutorial </title></head></html>'.encode('utf-8'))
+		elif self.path == '/chunked/':
+			self.send_response(200)
+			self.send_header('Content-Type', 'text/html')
+			self.send_header('Transfer-Encoding', 'chunked')
+			self.end_headers()
+			for chunk in (b'<html><title>Chunked', b' page</title>', b''):
+				self.wfile.write('{0:x}\r\n'.format(len(chunk)).encode('ascii') + chunk + b'\r\n')
+		else:
+			self.send_error(404)
+
+	def log_message(self, *args):
+		pass
+
+class StubServer(socketserver.ThreadingMixIn, HTTPServer):
+	daemon_threads = True
+
+@override_settings(RANGO_LINK_CHECK_ALLOW_PRIVATE=True)
+class LinkCheckTests(RangoTestCase):
+
+	def setUp(self):
+		super(LinkCheckTests, self).setUp()
+		self.server = StubServer(('127.0.0.1', 0), StubHandler)
+		self.server.requests = []
+		thread = threading.Thread(target=self.server.serve_forever)
+		thread.daemon = True
+		thread.start()
+		self.addCleanup(self.server.server_close)
+		self.addCleanup(self.server.shutdown)
+		self.base = 'http://127.0.0.1:{0}'.format(self.server.server_address[1])
+		self.category = Category.objects.create(name='Python')
+
+	def check_links(self):
+		call_command('check_links', host_delay=0, timeout=5, stdout=StringIO())
+
+	def add_page(self, path):
+		return Page.objects.create(category=self.category, title=path, url=self.base + path)
+
+	def test_redirect_title_and_not_modified(self):
+		page = self.add_page('/old/')
+		self.check_links()
+		page.refresh_from_db()
+		self.assertEqual((page.link_status, page.final_url), (200, self.base + '/new/'))
+		self.assertEqual(page.fetched_title, 'Rango & Django \u2013 tutorial')
+		self.assertEqual(page.link_etag, '"v1"')
+		# Visitors go straight to where the redirect ends up
+		response = self.client.get('/rango/goto/', {'page_id': page.id})
+		self.assertEqual(response['Location'], self.base + '/new/')
+
+		self.server.requests = []
+		self.check_links()
+		# The ETag is only sent to the url it came from
+		self.assertEqual(self.server.requests, [('/old/', None), ('/new/', '"v1"')])
+		page.refresh_from_db()
+		self.assertEqual((page.link_status, page.final_url), (304, self.base + '/new/'))
+		self.assertEqual(page.fetched_title, 'Rango & Django \u2013 tutorial')
+
+	def test_chunked_title(self):
+		page = self.add_page('/chunked/')
+		self.check_links()
+		page.refresh_from_db()
+		self.assertEqual((page.link_status, page.final_url, page.fetched_title), (200, '', 'Chunked page'))
+
+	def test_broken_link(self):
+		page = self.add_page('/missing/')
+		self.check_links()
+		page.refresh_from_db()
+		self.assertEqual((page.link_status, page.final_url, page.link_etag), (404, '', ''))
+
+class FailingCounter(clicks.BufferedCounter):
+
+	def write(self, pending):
+		raise RuntimeError('database down')
+
+class ListCounter(clicks.BufferedCounter):
+
+	def __init__(self, *args, **kwargs):
+		super(ListCounter, self).__init__(*args, **kwargs)
+		self.written = []
+
+	def write(self, pending):
+		self.written.append(pending)
+
+class ClickTests(RangoTestCase):
+
+	def setUp(self):
+		super(ClickTests, self).setUp()
+		self.category = Category.objects.create(name='Python')
+		self.page = Page.objects.create(category=self.category, title='Tutorial', url='http://docs.python.org/')
+
+	def goto(self, page_id):
+		return self.client.get('/rango/goto/', {'page_id': page_id})
+
+	def test_goto_does_not_write(self):
+		self.goto(self.page.id)
+		# Once the url is cached, a click touches neither the database nor the page's row
+		with self.assertNumQueries(0):
+			response = self.goto(self.page.id)
+		self.assertEqual((response.status_code, response['Location']), (302, 'http://docs.python.org/'))
+		self.assertEqual(Page.objects.get().views, 0)
+		self.assertEqual(clicks.click_counter.peek(self.page.id), 2)
+
+		clicks.flush_all()
+		self.assertEqual(Page.objects.get().views, 2)
+		self.assertEqual(Category.objects.get().total_page_views, 2)
+		self.assertEqual(clicks.click_counter.peek(self.page.id), 0)
+
+	def test_unknown_page(self):
+		response = self.goto(self.page.id + 1)
+		self.assertContains(response, 'not found')
+		self.assertEqual(clicks.click_counter.peek(self.page.id + 1), 0)
+
+	def test_pages_with_same_count_share_an_update(self):
+		pages = [self.page] + [Page.objects.create(category=self.category, title=str(i), url='http://example.com/')
+			for i in range(3)]
+		for page, n in zip(pages, (3, 3, 3, 1)):
+			clicks.click_counter.record(page.id, n)
+		with CaptureQueriesContext(connection) as queries:
+			clicks.click_counter.flush()
+		updates = [query['sql'] for query in queries if query['sql'].startswith('UPDATE "rango_page"')]
+		self.assertEqual(len(updates), 2)
+		self.assertEqual([page.views for page in Page.objects.order_by('id')], [3, 3, 3, 1])
+
+	def test_flushed_within_interval_without_more_clicks(self):
+		counter = ListCounter(flush_size=1000, flush_interval=0.2)
+		self.addCleanup(clicks.counters.remove, counter)
+		counter.record(1)
+		counter.record(2, 3)
+		deadline = time.time() + 2
+		while not counter.written and time.time() < deadline:
+			time.sleep(0.05)
+		self.assertEqual(counter.written, [{1: 1, 2: 3}])
+		self.assertEqual(counter.peek(1), 0)
+
+	def test_flushed_when_size_reached(self):
+		counter = ListCounter(flush_size=3, flush_interval=1000)
+		self.addCleanup(clicks.counters.remove, counter)
+		for i in range(3):
+			counter.record(i)
+		deadline = time.time() + 2
+		while not counter.written and time.time() < deadline:
+			time.sleep(0.05)
+		self.assertEqual(counter.written, [{0: 1, 1: 1, 2: 1}])
+
+	def test_failed_flush_keeps_clicks(self):
+		counter = FailingCounter(flush_size=1000, flush_interval=1000)
+		self.addCleanup(clicks.counters.remove, counter)
+		counter.record(1, 2)
+		with self.assertRaises(RuntimeError):
+			counter.flush()
+		self.assertEqual(counter.peek(1), 2)
+
+class SearchTests(RangoTestCase):
+	# Run against the FTS5 index here, and the in-memory one by MemorySearchTests
+
+	def make_backend(self):
+		if not search.FTSBackend.available():
+			self.skipTest('SQLite has no FTS5')
+		return search.FTSBackend()
+
+	def setUp(self):
+		super(SearchTests, self).setUp()
+		old = search.backend
+		search.backend = self.make_backend()
+		self.addCleanup(setattr, search, 'backend', old)
+		self.python = Category.objects.create(name='Python')
+		Page.objects.create(category=self.python, title='Official Python Tutorial', url='http://docs.python.org/tutorial/')
+		Page.objects.create(category=self.python, title='Learn to code', url='http://python.example.com/')
+		Page.objects.create(category=self.python, title='How to Think like a Computer Scientist',
+			url='http://www.greenteapress.com/thinkpython/')
+
+	def titles(self, query):
+		return [result['title'] for result in search.search(query)[:20]]
+
+	def test_title_ranks_above_url(self):
+		# Python is only in the url of the last one
+		titles = self.titles('python')
+		self.assertEqual(sorted(titles[:2]), ['Official Python Tutorial', 'Python'])
+		self.assertEqual(titles[2:], ['Learn to code'])
+
+	def test_prefix_and_every_word(self):
+		self.assertEqual(self.titles('tut pyth'), ['Official Python Tutorial'])
+		self.assertEqual(self.titles('python scientist'), [])
+
+	def test_index_follows_changes(self):
+		page = Page.objects.get(title='Learn to code')
+		page.title = 'Learn Rust'
+		page.url = 'http://rust.example.com/'
+		page.save()
+		Page.objects.filter(title__startswith='Official').delete()
+		self.assertEqual(self.titles('python'), ['Python'])
+		self.assertEqual(self.titles('rust'), ['Learn Rust'])
+
+	def test_view_paginates(self):
+		for i in range(search.SEARCH_PAGE_SIZE + 5):
+			Page.objects.create(category=self.python, title='Django {0}'.format(i), url='http://example.com/')
+		response = self.client.get('/rango/search/', {'query': 'django', 'page': 2})
+		self.assertEqual(len(response.context['result_list']), 5)
+		self.assertContains(response, 'Page 2 of 2')
+		# Past the end shows the last page
+		response = self.client.get('/rango/search/', {'query': 'django', 'page': 9})
+		self.assertEqual(response.context['result_list'].number, 2)
+		self.assertContains(self.client.get('/rango/search/', {'query': 'nothing'}), 'No results')
+
+class MemorySearchTests(SearchTests):
+
+	def make_backend(self):
+		return search.MemoryBackend()
+
+class CategoryPaginationTests(RangoTestCase):
+
+	def setUp(self):
+		super(CategoryPaginationTests, self).setUp()
+		# Read once at import, like the view's other settings
+		self.addCleanup(setattr, views, 'CATEGORY_PAGE_SIZE', views.CATEGORY_PAGE_SIZE)
+		views.CATEGORY_PAGE_SIZE = 4
+		self.category = Category.objects.create(name='Python')
+		# Plenty of ties in views, so pages have to be told apart by id where a page ends
+		Page.objects.bulk_create([Page(category=self.category, title=str(i), url='http://example.com/', views=i // 3)
+			for i in range(10)])
+		Page.objects.create(category=Category.objects.create(name='Other'), title='other', url='http://example.com/')
+		self.expected = list(Page.objects.filter(category=self.category).order_by('-views', '-id').values_list('id', flat=True))
+
+	def test_keyset_pages_cover_every_row_once(self):
+		seen = []
+		after = None
+		while True:
+			pages, after = keyset_page(Page.objects.filter(category=self.category), ('-views', '-id'), after, 4)
+			seen += [page.id for page in pages]
+			if after is None:
+				break
+			self.assertEqual(decode_cursor(after, 2), [pages[-1].views, pages[-1].id])
+		self.assertEqual(seen, self.expected)
+
+	def test_bad_cursor_starts_over(self):
+		pages, after = keyset_page(Page.objects.filter(category=self.category), ('-views', '-id'), 'x.y', 4)
+		self.assertEqual([page.id for page in pages], self.expected[:4])
+
+	def test_show_category_follows_link_header(self):
+		seen = []
+		url = '/rango/category/python/'
+		while url:
+			response = self.client.get(url)
+			self.assertEqual(response.status_code, 200)
+			self.assertLessEqual(len(response.context['pages']), 4)
+			seen += [page.id for page in response.context['pages']]
+			link = response.get('Link')
+			url = link[1:link.index('>')] if link else None
+		self.assertEqual(seen, self.expected)
+
+class LikeTests(RangoTestCase):
+
+	def setUp(self):
+		super(LikeTests, self).setUp()
+		self.addCleanup(setattr, likes, 'rate_limiter', likes.rate_limiter)
+		likes.rate_limiter = RateLimiter(*likes.RATE_LIMIT)
+		self.python = Category.objects.create(name='Python', likes=1)
+		self.django = Category.objects.create(name='Django')
+		self.user = User.objects.create_user('leo', password='secret')
+		self.client.login(username='leo', password='secret')
+		self.url = '/rango/category/django/like/'
+
+	def test_like_and_unlike(self):
+		self.assertEqual(self.client.get(self.url).json(), {'liked': False, 'likes': 0})
+		self.assertEqual(self.client.post(self.url).json(), {'liked': True, 'likes': 1})
+		# Liking twice is still one like
+		self.assertEqual(self.client.post(self.url).json(), {'liked': True, 'likes': 1})
+		self.assertEqual(self.client.delete(self.url).json(), {'liked': False, 'likes': 0})
+		likes.like_counter.flush()
+		self.assertEqual(Category.objects.get(id=self.django.id).likes, 0)
+
+	def test_flushed_likes_reorder_index(self):
+		other = User.objects.create_user('mia')
+		likes.like(self.user, self.django.id)
+		likes.like(other, self.django.id)
+		# Buffered until the counter is flushed
+		self.assertEqual(Category.objects.get(id=self.django.id).likes, 0)
+		likes.like_counter.flush()
+		self.assertEqual(Category.objects.get(id=self.django.id).likes, 2)
+		self.client.logout()
+		response = self.client.get('/rango/')
+		self.assertEqual([category['name'] for category in response.context['categories']], ['Django', 'Python'])
+
+	def test_rate_limited(self):
+		limit = likes.RATE_LIMIT[0]
+		for i in range(limit):
+			self.assertEqual(self.client.post(self.url).status_code, 200)
+		response = self.client.post(self.url)
+		self.assertEqual(response.status_code, 429)
+		self.assertTrue(int(response['Retry-After']) > 0)
+		# Reading doesn't count
+		self.assertEqual(self.client.get(self.url).status_code, 200)
+
+	def test_anonymous_and_unknown(self):
+		self.assertEqual(self.client.post('/rango/category/nothing/like/').status_code, 404)
+		self.client.logout()
+		self.assertEqual(self.client.post(self.url).status_code, 403)
+
+class ThumbnailTests(RangoTestCase):
+
+	def setUp(self):
+		super(ThumbnailTests, self).setUp()
+		try:
+			from PIL import Image
+		except ImportError:
+			self.skipTest('Pillow is not installed')
+		media = tempfile.mkdtemp()
+		self.addCleanup(shutil.rmtree, media)
+		media_root = override_settings(MEDIA_ROOT=media)
+		media_root.enable()
+		self.addCleanup(media_root.disable)
+		out = io.BytesIO()
+		Image.new('RGB', (300, 200), 'red').save(out, 'PNG')
+		self.profile = UserProfile.objects.create(user=User.objects.create_user('leo'))
+		self.profile.picture.save('leo.png', ContentFile(out.getvalue()))
+
+	def thumbnail(self, size):
+		with default_storage.open(thumbnails.thumbnail_path(self.profile.picture_thumbnail, size)) as f:
+			return f.read()
+
+	def test_generate_and_remake(self):
+		call_command('generate_thumbnails', stdout=StringIO())
+		self.profile.refresh_from_db()
+		self.assertTrue(self.profile.picture_thumbnail)
+		made = self.thumbnail(64)
+		path = thumbnails.thumbnail_path(self.profile.picture_thumbnail, 64)
+		default_storage.delete(path)
+		default_storage.save(path, ContentFile(b'broken'))
+
+		# Without --all a profile that has thumbnails is left alone
+		call_command('generate_thumbnails', stdout=StringIO())
+		self.assertEqual(self.thumbnail(64), b'broken')
+		call_command('generate_thumbnails', all=True, stdout=StringIO())
+		self.assertEqual(self.thumbnail(64), made)
+		self.assertEqual(sorted(os.listdir(os.path.dirname(default_storage.path(path)))),
+			[self.profile.picture_thumbnail])
+
+class SidebarTests(RangoTestCase):
+
+	def setUp(self):
+		super(SidebarTests, self).setUp()
+		self.python = Category.objects.create(name='Python')
+		self.django = Category.objects.create(name='Django')
+
+	def test_active_category_highlighted(self):
+		html = get_category_list(self.django)
+		self.assertInHTML('<li><strong><a href="/rango/category/django/">Django</a></strong></li>', html)
+		self.assertInHTML('<li><a href="/rango/category/python/">Python</a></li>', html)
+		self.assertNotIn('<strong>', get_category_list())
+
+	def test_one_cached_copy(self):
+		get_category_list()
+		# Warm, no category makes it query or store anything more
+		with self.assertNumQueries(0):
+			for category in (self.python, self.django, None):
+				get_category_list(category)
+		self.assertEqual(len([key for key in cache._cache if 'rango:cats_html:' in key]), 1)
+
+	def test_rerendered_after_change(self):
+		get_category_list(self.python)
+		self.django.name = 'Flask'
+		self.django.save()
+		self.assertIn('Flask', get_category_list(self.python))
+
+class ProfileDirectoryTests(RangoTestCase):
+
+	def setUp(self):
+		super(ProfileDirectoryTests, self).setUp()
+		self.addCleanup(setattr, profiles, 'PROFILES_PAGE_SIZE', profiles.PROFILES_PAGE_SIZE)
+		profiles.PROFILES_PAGE_SIZE = 2
+		for name in ('ann', 'bob', 'cat'):
+			UserProfile.objects.create(user=User.objects.create_user(name))
+
+	def test_page_numbers_normalised(self):
+		for number, expected in (('1', 1), (2, 2), ('0', 1), ('-4', 1), ('two', 1), (None, 1), ('99', 2)):
+			self.assertEqual(profiles.directory_page(number)['number'], expected, number)
+		self.assertEqual([p['username'] for p in profiles.directory_page('99')['profiles']], ['cat'])
+		# Whatever was asked for, only the real pages (and their count) were cached
+		keys = [key for key in cache._cache if 'rango:profiles:' in key]
+		self.assertEqual(len(keys), 3)
+
+	def test_new_profile_shows(self):
+		profiles.directory_page(2)
+		UserProfile.objects.create(user=User.objects.create_user('dan'))
+		self.assertEqual([p['username'] for p in profiles.directory_page(2)['profiles']], ['cat', 'dan'])
+
+class SelfHostedAssetsTests(RangoTestCase):
+
+	def test_no_third_party_assets(self):
+		html = self.client.get('/rango/about/').content.decode('utf-8')
+		tags = re.findall(r'<(?:script|link)\b[^>]*>', html)
+		self.assertTrue(any('rango.bundle' in tag or 'bootstrap-4' in tag for tag in tags))
+		self.assertEqual([tag for tag in tags if re.search(r'(?:src|href)="(?:https?:)?//', tag)], [])
+
+	def test_no_third_party_images_or_styles(self):
+		user = User.objects.create_user('ann', password='secret')
+		UserProfile.objects.create(user=user)
+		pages = [self.client.get('/accounts/login/'), self.client.get('/accounts/register/')]
+		self.client.login(username='ann', password='secret')
+		pages += [self.client.get('/rango/profiles/'), self.client.get('/rango/profile/ann/')]
+		for response in pages:
+			self.assertEqual(response.status_code, 200)
+			html = response.content.decode('utf-8')
+			tags = re.findall(r'<(?:script|link|img)\b[^>]*>', html)
+			self.assertEqual([tag for tag in tags if re.search(r'(?:src|href)="(?:https?:)?//', tag)], [])
+		self.assertIn('images/profile', pages[-1].content.decode('utf-8'))
+
+class LeaderboardTests(RangoTestCase):
+
+	def setUp(self):
+		super(LeaderboardTests, self).setUp()
+		category = Category.objects.create(name='Python')
+		self.first = Page.objects.create(category=category, title='First', url='http://example.com/1', views=5)
+		self.second = Page.objects.create(category=category, title='Second', url='http://example.com/2', views=3)
+
+	def titles(self):
+		return [page['title'] for page in leaderboards.top_pages()]
+
+	def test_stale_for_at_most_max_age(self):
+		self.assertEqual(self.titles(), ['First', 'Second'])
+		# A bulk update sends no signals, so the board only sees it once it is rebuilt
+		Page.objects.filter(id=self.second.id).update(views=10)
+		with self.assertNumQueries(0):
+			self.assertEqual(self.titles(), ['First', 'Second'])
+		leaderboards.page_board.built_at -= leaderboards.page_board.max_age
+		self.assertEqual(self.titles(), ['Second', 'First'])
+
+	def test_refreshed_when_clicks_are_flushed(self):
+		self.assertEqual(self.titles(), ['First', 'Second'])
+		clicks.click_counter.record(self.second.id, 4)
+		clicks.flush_all()
+		with self.assertNumQueries(0):
+			self.assertEqual([(page['title'], page['views']) for page in leaderboards.top_pages()],
+				[('Second', 7), ('First', 5)])
+
+class VisitorCountTests(RangoTestCase):
+
+	def test_counts(self):
+		visitors.record_hit()
+		visitors.record_hit()
+		visitors.record_visit()
+		self.assertEqual(visitors.visit_counts(), {'hits': 2, 'visitors': 1})
+		self.assertEqual(visitors.visit_counts(timezone.localdate() - timedelta(days=1)), {'hits': 0, 'visitors': 0})
+
+	def test_index_hits_counted(self):
+		self.client.get('/rango/')
+		self.client.get('/rango/')
+		self.assertEqual(visitors.visit_counts()['hits'], 2)
+
+	def test_days_are_the_sites_own(self):
+		# 23:30 UTC on new year's eve is already the next day in Lagos (UTC+1)
+		with mock.patch('django.utils.timezone.now', return_value=datetime(2026, 12, 31, 23, 30, tzinfo=timezone.utc)):
+			visitors.record_hit()
+		self.assertEqual(visitors.visit_counts(date(2027, 1, 1))['hits'], 1)
+		self.assertEqual(visitors.visit_counts(date(2026, 12, 31))['hits'], 0)
+
+class SuggestionTests(RangoTestCase):
+
+	def setUp(self):
+		super(SuggestionTests, self).setUp()
+		self.addCleanup(setattr, suggestions, 'suggester', suggestions.suggester)
+		suggestions.suggester = suggestions.CategorySuggester()
+		for name, likes in (('Python', 5), ('Pyramid', 9), ('PyPy', 1), ('Perl', 20), ('pygame', 7)):
+			Category.objects.create(name=name, likes=likes)
+
+	def names(self, prefix, limit=suggestions.SUGGESTION_LIMIT):
+		return [category['name'] for category in suggestions.suggest_categories(prefix, limit)]
+
+	def test_prefix_matches_most_liked_first(self):
+		self.assertEqual(self.names('py'), ['Pyramid', 'pygame', 'Python', 'PyPy'])
+		self.assertEqual(self.names('PYT'), ['Python'])
+		self.assertEqual(self.names('java'), [])
+
+	def test_limit(self):
+		self.assertEqual(self.names('p', 2), ['Perl', 'Pyramid'])
+
+	def test_follows_changes(self):
+		self.names('py')
+		Category.objects.filter(name='PyPy').get().delete()
+		Category.objects.create(name='Pyro', likes=8)
+		self.assertEqual(self.names('py'), ['Pyramid', 'Pyro', 'pygame', 'Python'])
+
+class QueryProfilingTests(RangoTestCase):
+
+	def setUp(self):
+		super(QueryProfilingTests, self).setUp()
+		for name in ('PROFILING', 'QUERY_BUDGETS', 'QUERY_BUDGETS_STRICT'):
+			self.addCleanup(setattr, middleware, name, getattr(middleware, name))
+		middleware.PROFILING = True
+		middleware.QUERY_BUDGETS = {'about': 2}
+		middleware.QUERY_BUDGETS_STRICT = False
+
+	def run_view(self, *querysets):
+		# A request to /rango/about/ that runs the given querysets
+		def get_response(request):
+			for queryset in querysets:
+				list(queryset)
+			return HttpResponse()
+		request = RequestFactory().get('/rango/about/')
+		request.resolver_match = resolve('/rango/about/')
+		return middleware.QueryProfilingMiddleware(get_response)(request)
+
+	def test_over_budget_warns(self):
+		with self.assertLogs('rango.profiling', 'WARNING') as logs:
+			self.run_view(Category.objects.all(), Page.objects.all(), User.objects.all())
+		self.assertEqual(logs.output, ['WARNING:rango.profiling:/rango/about/ (about) ran 3 queries, its budget is 2'])
+
+	def test_within_budget(self):
+		with mock.patch.object(middleware.logger, 'warning') as warning:
+			self.run_view(Category.objects.all(), Page.objects.all())
+		warning.assert_not_called()
+
+	def test_strict_raises(self):
+		middleware.QUERY_BUDGETS_STRICT = True
+		with self.assertRaisesRegex(middleware.QueryBudgetExceeded, 'ran 3 queries, its budget is 2'):
+			self.run_view(Category.objects.all(), Page.objects.all(), User.objects.all())
+
+	def test_repeated_query_warns(self):
+		middleware.QUERY_BUDGETS = {}
+		with self.assertLogs('rango.profiling', 'WARNING') as logs:
+			self.run_view(*[Category.objects.filter(id=i) for i in range(1, middleware.DUPLICATE_QUERY_THRESHOLD + 1)])
+		self.assertEqual(len(logs.output), 1)
+		self.assertIn('ran the same query {0} times'.format(middleware.DUPLICATE_QUERY_THRESHOLD), logs.output[0])
+
+	def test_index_within_budget(self):
+		# The most the index runs: cold leaderboards, for a logged in visitor on their first visit of the day
+		Category.objects.create(name='Python')
+		User.objects.create_user('ann', password='secret')
+		self.client.login(username='ann', password='secret')
+		with CaptureQueriesContext(connection) as queries:
+			self.client.get('/rango/')
+		# Not counting the savepoints that only the test's own transaction brings
+		queries = [query for query in queries if 'SAVEPOINT' not in query['sql']]
+		self.assertEqual(len(queries), settings.RANGO_QUERY_BUDGETS['index'])
+
+class CategoryStatsTests(RangoTestCase):
+
+	def setUp(self):
+		super(CategoryStatsTests, self).setUp()
+		self.python = Category.objects.create(name='Python')
+		self.django = Category.objects.create(name='Django')
+
+	def assertTotals(self, category, page_count, total_page_views):
+		category.refresh_from_db()
+		self.assertEqual((category.page_count, category.total_page_views), (page_count, total_page_views))
+
+	def test_page_create_edit_delete(self):
+		page = Page.objects.create(category=self.python, title='Tutorial', url='http://docs.python.org/', views=4)
+		Page.objects.create(category=self.python, title='Wiki', url='http://wiki.python.org/', views=1)
+		self.assertTotals(self.python, 2, 5)
+		page.views = 10
+		page.save()
+		self.assertTotals(self.python, 2, 11)
+		page.delete()
+		self.assertTotals(self.python, 1, 1)
+
+	def test_page_moved(self):
+		page = Page.objects.create(category=self.python, title='Tutorial', url='http://docs.python.org/', views=4)
+		page.category = self.django
+		page.views = 6
+		with CaptureQueriesContext(connection) as queries:
+			page.save()
+		self.assertTotals(self.python, 0, 0)
+		self.assertTotals(self.django, 1, 6)
+		# The totals move by the difference, nothing counts the categories' pages again
+		self.assertFalse([query for query in queries if 'COUNT(' in query['sql'] or 'SUM(' in query['sql']])
+
+	def test_recompute_repairs_drift(self):
+		Page.objects.create(category=self.python, title='Tutorial', url='http://docs.python.org/', views=4)
+		Category.objects.update(page_count=7, total_page_views=99)
+		call_command('recompute_category_stats', stdout=StringIO())
+		self.assertTotals(self.python, 1, 4)
+		self.assertTotals(self.django, 0, 0)
+
+class ResponseCacheTests(RangoTestCase):
+	url = '/rango/category/python/'
+
+	def setUp(self):
+		super(ResponseCacheTests, self).setUp()
+		self.addCleanup(setattr, response_cache, 'RESPONSE_CACHE', response_cache.RESPONSE_CACHE)
+		response_cache.RESPONSE_CACHE = True
+		self.category = Category.objects.create(name='Python')
+		self.page = Page.objects.create(category=self.category, title='Tutorial', url='http://docs.python.org/')
+
+	def entry_key(self):
+		request = RequestFactory().get(self.url)
+		request.user = AnonymousUser()
+		return response_cache.entry_key(request)
+
+	def test_warm_entry_needs_no_queries(self):
+		first = self.client.get(self.url)
+		with self.assertNumQueries(0):
+			again = self.client.get(self.url)
+		self.assertEqual((again.status_code, again.content), (200, first.content))
+
+	def test_not_modified_from_cache(self):
+		etag = self.client.get(self.url)['ETag']
+		with self.assertNumQueries(0):
+			response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+		self.assertEqual(response.status_code, 304)
+
+	def test_adding_a_page_invalidates(self):
+		self.client.get(self.url)
+		Page.objects.create(category=self.category, title='Another', url='http://python.org/')
+		self.assertContains(self.client.get(self.url), 'Another')
+
+	def test_renaming_a_category_invalidates(self):
+		Category.objects.create(name='Django')
+		self.assertContains(self.client.get(self.url), 'Django')
+		django = Category.objects.get(name='Django')
+		django.name = 'Flask'
+		django.save()
+		response = self.client.get(self.url)
+		self.assertContains(response, 'Flask')
+		self.assertNotContains(response, 'Django')
+
+	def test_queryset_delete_invalidates(self):
+		self.assertContains(self.client.get(self.url), 'Tutorial')
+		Page.objects.filter(category=self.category).delete()
+		self.assertNotContains(self.client.get(self.url), 'Tutorial')
+
+	def test_only_lock_holder_regenerates(self):
+		self.client.get(self.url)
+		Page.objects.create(category=self.category, title='Another', url='http://python.org/')
+		# Another request is already rendering the stale entry again: this one gets the old copy
+		response_cache.get_cache().add(response_cache.lock_key(self.entry_key()), 1)
+		with self.assertNumQueries(0):
+			self.assertNotContains(self.client.get(self.url), 'Another')
+		response_cache.get_cache().delete(response_cache.lock_key(self.entry_key()))
+		self.assertContains(self.client.get(self.url), 'Another')
+
+	def test_logged_in_never_served_from_cache(self):
+		self.client.get(self.url)
+		# A bulk update doesn't invalidate anything, so only a freshly rendered page shows it
+		Page.objects.update(title='Renamed')
+		self.assertContains(self.client.get(self.url), 'Tutorial')
+		User.objects.create_user('ann', password='secret')
+		self.client.login(username='ann', password='secret')
+		self.assertContains(self.client.get(self.url), 'Renamed')
+
+class RouterTests(TestCase):
+
+	def setUp(self):
+		self.router = db.PrimaryReplicaRouter()
+		db.unpin(None)
+		self.addCleanup(db.unpin, None)
+
+	def test_reads_pinned_to_primary_after_write(self):
+		with mock.patch.dict(db.settings.DATABASES, {db.REPLICA: db.settings.DATABASES['default']}):
+			self.assertEqual(self.router.db_for_read(Page), db.REPLICA)
+			# Sessions and users are always read where they were written
+			self.assertEqual(self.router.db_for_read(User), 'default')
+			self.assertEqual(self.router.db_for_write(Page), 'default')
+			self.assertEqual(self.router.db_for_read(Page), 'default')
+			# Until the next request
+			db.unpin(None)
+			self.assertEqual(self.router.db_for_read(Page), db.REPLICA)
+
+	def test_no_replica(self):
+		self.assertEqual(self.router.db_for_read(Page), 'default')
+
+class SlugCacheTests(RangoTestCase):
+
+	def test_cached_miss_forgotten_on_create(self):
+		self.assertIsNone(slugs.get_category('python'))
+		with self.assertNumQueries(0):
+			self.assertIsNone(slugs.get_category('python'))
+		category = Category.objects.create(name='Python')
+		self.assertEqual(slugs.get_category('python').id, category.id)
+
+	def test_forgotten_on_rename(self):
+		category = Category.objects.create(name='Python')
+		self.assertEqual(slugs.get_category('python').id, category.id)
+		category.name = 'Snakes'
+		category.save()
+		self.assertIsNone(slugs.get_category('python'))
+		self.assertEqual(slugs.get_category('snakes').id, category.id)
+
+ran = []
+
+@tasks.task(max_attempts=3)
+def remember(value):
+	ran.append(value)
+
+@tasks.task(max_attempts=3)
+def fail():
+	raise ValueError('broken')
+
+@tasks.task()
+def outlast_lease():
+	# Runs so long that another worker takes the task over
+	tasks.claim(timezone.now() + timedelta(seconds=tasks.LEASE + 1))
+
+@override_settings(RANGO_TASK_INLINE_WORKERS=0)
+class TaskTests(RangoTestCase):
+
+	def setUp(self):
+		super(TaskTests, self).setUp()
+		del ran[:]
+
+	def make_due(self):
+		Task.objects.update(run_after=timezone.now())
+
+	def test_runs_and_deletes(self):
+		remember.delay('a')
+		self.assertEqual(tasks.run_pending(), 1)
+		self.assertEqual(ran, ['a'])
+		self.assertFalse(Task.objects.exists())
+
+	def test_dedupe(self):
+		self.assertTrue(remember.delay('a', dedupe=True))
+		self.assertFalse(remember.delay('a', dedupe=True))
+		self.assertTrue(remember.delay('b', dedupe=True))
+		self.assertEqual(Task.objects.count(), 2)
+		# Once a worker has it, the same call can be queued again
+		tasks.claim(timezone.now())
+		self.assertTrue(remember.delay('a', dedupe=True))
+
+	def test_countdown(self):
+		remember.delay('a', countdown=60)
+		self.assertEqual(tasks.run_pending(), 0)
+		self.make_due()
+		self.assertEqual(tasks.run_pending(), 1)
+
+	def test_retry_backoff(self):
+		fail.delay()
+		for attempt in (1, 2):
+			started = timezone.now()
+			with self.assertLogs('rango.tasks', 'WARNING'):
+				tasks.run_one()
+			task = Task.objects.get()
+			self.assertEqual((task.status, task.attempts, task.locked_until), (Task.PENDING, attempt, None))
+			delay = (task.run_after - started).total_seconds()
+			expected = tasks.RETRY_DELAY * 2 ** (attempt - 1)
+			self.assertTrue(expected <= delay < expected + 5, delay)
+			self.assertIn('ValueError: broken', task.last_error)
+			# Not due until then
+			self.assertFalse(tasks.run_one())
+			self.make_due()
+		with self.assertLogs('rango.tasks', 'ERROR'):
+			tasks.run_one()
+		task = Task.objects.get()
+		self.assertEqual((task.status, task.attempts), (Task.FAILED, 3))
+		self.assertFalse(tasks.run_one())
+
+	def test_lease_expiry_and_reclaim(self):
+		remember.delay('a')
+		now = timezone.now()
+		task = tasks.claim(now)
+		self.assertEqual((task.status, task.attempts), (Task.RUNNING, 1))
+		# Nobody else can have it while the lease lasts
+		self.assertIsNone(tasks.claim(now + timedelta(seconds=tasks.LEASE - 1)))
+		again = tasks.claim(now + timedelta(seconds=tasks.LEASE + 1))
+		self.assertEqual((again.id, again.attempts), (task.id, 2))
+		self.assertGreater(again.locked_until, task.locked_until)
+
+	def test_lost_lease_leaves_task_to_new_worker(self):
+		outlast_lease.delay()
+		with self.assertLogs('rango.tasks', 'WARNING'):
+			self.assertTrue(tasks.run_one())
+		# The worker that took it over holds it, the first run neither deleted nor released it
+		task = Task.objects.get()
+		self.assertEqual((task.status, task.attempts), (Task.RUNNING, 2))
+
+class AnalyticsTests(RangoTestCase):
+
+	def setUp(self):
+		super(AnalyticsTests, self).setUp()
+		category = Category.objects.create(name='Python')
+		self.tutorial, self.wiki, self.old = [Page.objects.create(category=category, title=title, url='http://example.com/')
+			for title in ('Tutorial', 'Wiki', 'Old')]
+		# Clicks at fixed times within a whole hour three hours ago, and some from before the minute buckets' retention
+		self.hour = analytics.bucket_start(timezone.now(), analytics.HOUR) - timedelta(hours=3)
+		analytics.record({self.tutorial.id: 2, self.wiki.id: 1}, self.hour + timedelta(minutes=5))
+		analytics.record({self.tutorial.id: 6}, self.hour + timedelta(minutes=10, seconds=30))
+		analytics.record({self.wiki.id: 4}, self.hour + timedelta(minutes=65))
+		analytics.record({self.old.id: 100}, timezone.now() - timedelta(hours=25))
+		PageViewBucket.objects.create(page=self.old, granularity=analytics.HOUR, views=100,
+			start=analytics.bucket_start(timezone.now() - timedelta(days=31), analytics.HOUR))
+
+	def buckets(self, granularity):
+		return sorted(PageViewBucket.objects.filter(granularity=granularity).values_list('page_id', 'start', 'views'))
+
+	def test_rollup(self):
+		minute = analytics.MINUTE
+		self.assertEqual(PageViewBucket.objects.filter(granularity=minute, page=self.tutorial).count(), 2)
+		call_command('rollup_analytics', stdout=StringIO())
+		self.assertEqual(self.buckets(analytics.HOUR), sorted([
+			(self.tutorial.id, self.hour, 8),
+			(self.wiki.id, self.hour, 1),
+			(self.wiki.id, self.hour + timedelta(hours=1), 4),
+		]))
+		days = {}
+		for page_id, start, views in self.buckets(analytics.HOUR):
+			key = (page_id, analytics.bucket_start(start, analytics.DAY))
+			days[key] = days.get(key, 0) + views
+		self.assertEqual(self.buckets(analytics.DAY), sorted((page_id, start, views) for (page_id, start), views in days.items()))
+		# Past their retention: the old minute bucket was never rolled up, the old hour bucket is gone
+		self.assertFalse(PageViewBucket.objects.filter(page=self.old).exists())
+		self.assertEqual(PageViewBucket.objects.filter(granularity=minute).count(), 4)
+		# Rolling up again changes nothing
+		before = [self.buckets(granularity) for granularity in (minute, analytics.HOUR, analytics.DAY)]
+		call_command('rollup_analytics', '--full', stdout=StringIO())
+		self.assertEqual([self.buckets(granularity) for granularity in (minute, analytics.HOUR, analytics.DAY)], before)
+
+	def test_trending(self):
+		call_command('rollup_analytics', stdout=StringIO())
+		html = self.client.get('/rango/trending/', {'window': 'day'}).content.decode('utf-8')
+		self.assertLess(html.index('Tutorial'), html.index('Wiki'))
+		self.assertNotIn('Old', html)
+		self.assertEqual([(page['title'], page['views']) for page in analytics.trending('day')], [('Tutorial', 8), ('Wiki', 5)])
+
+class ExportTests(RangoTestCase):
+
+	def setUp(self):
+		super(ExportTests, self).setUp()
+		for name, likes in (('Python', 3), ('Django', 0), ('Ünïcode, "quoted"', 1)):
+			category = Category.objects.create(name=name, likes=likes, views=likes * 2)
+			for i in range(3):
+				Page.objects.create(category=category, title='{0} page {1}'.format(name, i),
+					url='http://example.com/{0}'.format(i), views=i)
+		self.directory = tempfile.mkdtemp()
+		self.addCleanup(shutil.rmtree, self.directory)
+
+	def catalogue(self):
+		return (sorted(Category.objects.values_list('name', 'views', 'likes')),
+			sorted(Page.objects.values_list('category__name', 'title', 'url', 'views')))
+
+	def assertRoundTrip(self, write):
+		# write(path) exports to path, whose name says the format; loading it back into an
+		# empty catalogue has to give the same catalogue
+		expected = self.catalogue()
+		for name in ('export.jsonl', 'export.csv', 'export.jsonl.gz', 'export.csv.gz'):
+			path = os.path.join(self.directory, name)
+			write(path)
+			Category.objects.all().delete()
+			call_command('import_catalogue', path, stdout=StringIO())
+			self.assertEqual(self.catalogue(), expected, name)
+
+	def test_command_round_trip(self):
+		# Chunks of 2 rows, so chunk boundaries fall within the categories and within the pages
+		self.assertRoundTrip(lambda path: call_command('export_catalogue', path, '--chunk-size', '2', stdout=StringIO()))
+
+	def test_view_round_trip(self):
+		User.objects.create_superuser('admin', 'admin@example.com', 'secret')
+		self.client.login(username='admin', password='secret')
+		def write(path):
+			name = path[:-3] if path.endswith('.gz') else path
+			response = self.client.get('/rango/export/', {'format': name.rsplit('.', 1)[1],
+				'gzip': '1' if path.endswith('.gz') else '0'})
+			self.assertEqual(response.status_code, 200)
+			with open(path, 'wb') as f:
+				f.write(b''.join(response.streaming_content))
+		self.assertRoundTrip(write)
+
+	def test_every_row_once(self):
+		for chunk_size in (1, 2, 3, 4, 100):
+			chunks = list(exporter.record_chunks(chunk_size=chunk_size))
+			self.assertTrue(all(len(chunk) <= chunk_size for chunk in chunks))
+			records = [record for chunk in chunks for record in chunk]
+			pages = [(record['category'], record['title']) for record in records if 'title' in record]
+			self.assertEqual(len(records), 12, chunk_size)
+			self.assertEqual(sorted(pages), sorted(Page.objects.values_list('category__name', 'title')))
+
+	def test_gzip_is_gzip(self):
+		data = b''.join(exporter.export('csv', gzip=True, chunk_size=2))
+		lines = gzip.decompress(data).decode('utf-8').splitlines()
+		self.assertEqual(lines[0], ','.join(exporter.CSV_FIELDS))
+		self.assertEqual(len(lines), 13)
+
+class PageAdminTests(RangoTestCase):
+
+	def setUp(self):
+		super(PageAdminTests, self).setUp()
+		User.objects.create_superuser('admin', 'admin@example.com', 'secret')
+		self.client.login(username='admin', password='secret')
+		self.python = Category.objects.create(name='Python')
+		self.django = Category.objects.create(name='Django')
+		self.pages = [Page.objects.create(category=self.python, title=str(i), url='http://example.com/', views=i + 1)
+			for i in range(3)]
+		Page.objects.create(category=self.django, title='Docs', url='http://djangoproject.com/', views=10)
+
+	def assertTotals(self, category, page_count, total_page_views):
+		category.refresh_from_db()
+		self.assertEqual((category.page_count, category.total_page_views), (page_count, total_page_views))
+
+	def act(self, action, pages, **data):
+		return self.client.post('/admin/rango/page/', dict(data, action=action,
+			_selected_action=[page.id for page in pages]))
+
+	def test_reset_views(self):
+		self.act('reset_views', self.pages[:2])
+		self.assertEqual([page.views for page in Page.objects.filter(category=self.python).order_by('title')], [0, 0, 3])
+		self.assertTotals(self.python, 3, 3)
+		self.assertTotals(self.django, 1, 10)
+
+	def test_move_pages(self):
+		# The form asking for the category first
+		self.assertContains(self.act('move_pages', self.pages[:2]), 'Move pages to another category')
+		self.act('move_pages', self.pages[:2], apply='1', category=self.django.id)
+		self.assertEqual(Page.objects.filter(category=self.django).count(), 3)
+		self.assertTotals(self.python, 1, 3)
+		self.assertTotals(self.django, 3, 13)
+
+	def test_move_pages_to_own_category(self):
+		self.act('move_pages', self.pages[1:] + [Page.objects.get(title='Docs')], apply='1', category=self.django.id)
+		self.assertTotals(self.python, 1, 1)
+		self.assertTotals(self.django, 3, 15)
+
+	def test_estimated_count(self):
+		self.addCleanup(setattr, pagination, 'ESTIMATED_COUNT_THRESHOLD', pagination.ESTIMATED_COUNT_THRESHOLD)
+		pagination.ESTIMATED_COUNT_THRESHOLD = 100
+		with connection.cursor() as cursor:
+			cursor.execute('ANALYZE')
+			cursor.execute("UPDATE sqlite_stat1 SET stat = '5000 1' WHERE tbl = 'rango_page'")
+		self.assertEqual(EstimatedCountPaginator(Page.objects.order_by('id'), 10).count, 5000)
+		self.assertContains(self.client.get('/admin/rango/page/'), '5000 pages')
+		# Filtered lists are counted exactly, as are tables the statistics say are small
+		self.assertEqual(EstimatedCountPaginator(Page.objects.filter(category=self.python).order_by('id'), 10).count, 3)
+		pagination.ESTIMATED_COUNT_THRESHOLD = 10000
+		self.assertEqual(EstimatedCountPaginator(Page.objects.order_by('id'), 10).count, 4)
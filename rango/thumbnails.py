@@ -0,0 +1,90 @@
+import hashlib
+import io
+import logging
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from rango.models import UserProfile
+from rango.tasks import task
+from rango.versions import bump_version
+
+# Fixed size thumbnails of profile pictures, so listings don't pull the full uploads.
+# They are made off the request path by a background task (rango/tasks.py), re-encoded without the
+# original's metadata, and named after a hash of the picture's content so they can be
+# cached forever. Until they exist, templates fall back to the original picture.
+logger = logging.getLogger('rango.thumbnails')
+
+THUMBNAIL_SIZES = getattr(settings, 'RANGO_THUMBNAIL_SIZES', (64, 128, 256))
+THUMBNAIL_FORMAT = getattr(settings, 'RANGO_THUMBNAIL_FORMAT', 'WEBP')
+THUMBNAIL_QUALITY = getattr(settings, 'RANGO_THUMBNAIL_QUALITY', 85)
+THUMBNAIL_DIR = 'profile_images/thumbs'
+
+EXTENSIONS = {'WEBP': 'webp', 'JPEG': 'jpg', 'PNG': 'png'}
+
+def thumbnail_format():
+	# Not every Pillow build can write WebP, JPEG always works
+	from PIL import features
+	if THUMBNAIL_FORMAT == 'WEBP' and not features.check('webp'):
+		return 'JPEG'
+	return THUMBNAIL_FORMAT
+
+def thumbnail_path(name, size):
+	# name is what UserProfile.picture_thumbnail holds, <content hash>.<extension>
+	return '{0}/{1}/{2}'.format(THUMBNAIL_DIR, size, name)
+
+def make_thumbnails(data, force=False):
+	'''Write the thumbnails of the image in `data`, returning the name to store on the profile.
+	Ones that already exist are kept, unless `force`.'''
+	from PIL import Image, ImageOps
+	fmt = thumbnail_format()
+	name = '{0}.{1}'.format(hashlib.sha1(data).hexdigest()[:20], EXTENSIONS[fmt])
+	image = Image.open(io.BytesIO(data))
+	if hasattr(ImageOps, 'exif_transpose'):
+		# Apply the camera's rotation before the EXIF data is dropped
+		image = ImageOps.exif_transpose(image)
+	image = image.convert('RGBA' if fmt == 'PNG' else 'RGB')
+	for size in THUMBNAIL_SIZES:
+		path = thumbnail_path(name, size)
+		if default_storage.exists(path):
+			if not force:
+				# Same content, same name: already made for this or another profile
+				continue
+			# Storage doesn't overwrite, it would save under another name
+			default_storage.delete(path)
+		thumb = ImageOps.fit(image, (size, size), Image.LANCZOS)
+		out = io.BytesIO()
+		# Saving without exif/icc_profile arguments leaves the original's metadata behind
+		thumb.save(out, fmt, quality=THUMBNAIL_QUALITY)
+		default_storage.save(path, ContentFile(out.getvalue()))
+	return name
+
+@task()
+def generate(profile_id, force=False):
+	# Errors are left to the task queue, which tries again later. force remakes existing thumbnails.
+	profile = UserProfile.objects.filter(id=profile_id).first()
+	if profile is None:
+		return
+	name = ''
+	if profile.picture:
+		profile.picture.open('rb')
+		try:
+			name = make_thumbnails(profile.picture.read(), force)
+		finally:
+			profile.picture.close()
+	if name != profile.picture_thumbnail:
+		UserProfile.objects.filter(id=profile_id).update(picture_thumbnail=name)
+		# update() sends no signals, so invalidate the cached profile directory here
+		bump_version('profile')
+
+def generate_later(profile):
+	# A new picture while the last one's thumbnails are still queued needs only the one task
+	generate.delay(profile.id, dedupe=True)
+
+def thumbnail_url(picture, name, size):
+	'''URL of the size x size thumbnail, or of the original picture while there is none.'''
+	if name and size in THUMBNAIL_SIZES:
+		return default_storage.url(thumbnail_path(name, size))
+	if picture:
+		return default_storage.url(str(picture))
+	return ''
@@ -8,10 +8,21 @@ urlpatterns = [
 	url(r'^add_category/$', views.add_category, name='add_category'),
 	url(r'^category/(?P<category_name_slug>[\w\-]+)/add_page/$', views.add_page, name='add_page'),
 	url(r'^category/(?P<category_name_slug>[\w\-]+)/$', views.show_category, name='show_category'),
+	url(r'^category/(?P<category_name_slug>[\w\-]+)/like/$', views.like_category, name='like_category'),
 	url(r'^restricted', views.restricted, name='restricted'),
 	url(r'^goto/', views.track_url, name='goto'),
+	url(r'^trending/$', views.trending, name='trending'),
+	url(r'^export/$', views.export_catalogue, name='export_catalogue'),
+	url(r'^api/v1/categories/$', views.api_categories, name='api_categories'),
+	url(r'^api/v1/categories/(?P<category_name_slug>[\w\-]+)/pages/$', views.api_category_pages, name='api_category_pages'),
+	# Unversioned, the current version
+	url(r'^api/categories/$', views.api_categories),
+	url(r'^api/categories/(?P<category_name_slug>[\w\-]+)/pages/$', views.api_category_pages),
 	url(r'^register_profile/', views.register_profile, name='register_profile'),
 	url(r'^profile/(?P<username>[\w\-]+)/$', views.profile, name='profile'),
-	url(r'^profiles/', views.list_profiles, name='list_profiles')
+	url(r'^profiles/', views.list_profiles, name='list_profiles'),
+	url(r'^search/$', views.search, name='search'),
+	url(r'^suggest/$', views.suggest_category, name='suggest_category'),
+	url(r'^profiling/$', views.profiling, name='profiling'),
 	# url(r'^logout/$', views.user_logout, name='logout'),
 	]
\ No newline at end of file
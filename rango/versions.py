@@ -0,0 +1,48 @@
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+
+# A version number per table, kept in the cache. Anything cached from a table puts the
+# table's version in its key, so bumping the version on save/delete invalidates all of it at once.
+# A bump only reaches the processes that read the same cache: with several processes, point
+# RANGO_VERSION_CACHE at a cache they share, or the others only catch up as their entries expire.
+VERSION_CACHE = getattr(settings, 'RANGO_VERSION_CACHE', 'default')
+
+def version_key(name):
+	return 'rango:version:{0}'.format(name)
+
+def changed_key(name):
+	return 'rango:changed:{0}'.format(name)
+
+def get_version(name):
+	cache = caches[VERSION_CACHE]
+	key = version_key(name)
+	version = cache.get(key)
+	if version is None:
+		# Start from the clock rather than 1, so a version that fell out of the cache
+		# can never come back as a number that old entries were stored under.
+		version = int(time.time() * 1000)
+		if not cache.add(key, version, None):
+			version = cache.get(key, version)
+	return version
+
+def changed_at(name):
+	'''When the version was last bumped, as a timestamp. For Last-Modified headers.'''
+	cache = caches[VERSION_CACHE]
+	changed = cache.get(changed_key(name))
+	if changed is None:
+		# Nobody knows, so say it was just now: a validator that is too new only costs a full response
+		changed = int(time.time())
+		cache.add(changed_key(name), changed, None)
+	return changed
+
+def bump_version(name):
+	cache = caches[VERSION_CACHE]
+	key = version_key(name)
+	cache.set(changed_key(name), int(time.time()), None)
+	try:
+		return cache.incr(key)
+	except ValueError:
+		# Not in the cache (yet), so nothing can have been stored under it either
+		return get_version(name)
@@ -1,17 +1,37 @@
 from django.contrib.auth import authenticate, login, logout
 from django.core.urlresolvers import reverse
+from django.db import transaction
 from django.shortcuts import render
 from django.shortcuts import redirect
-from django.http import HttpResponse, HttpResponseRedirect
+from django.core.paginator import Paginator, EmptyPage, PageNotAnInteger
+from django.http import HttpResponse, HttpResponseRedirect, JsonResponse, Http404, StreamingHttpResponse
+from django.utils.cache import patch_cache_control
+from django.views.decorators.cache import never_cache
+from django.views.decorators.http import require_http_methods, require_safe
 from rango.models import Category
 from rango.models import Page, UserProfile
 from rango.forms import CategoryForm, UserForm, UserProfileForm, PageForm
+from rango import analytics, api, clicks, conditional, exporter, leaderboards, likes, linkcheck, profiles, slugs, thumbnails, visitors
+from rango.suggestions import suggest_categories, SUGGESTION_LIMIT
+from rango.search import search as search_index, SEARCH_PAGE_SIZE
+from rango.pagination import keyset_page
+from rango.response_cache import cache_anonymous
+from rango.middleware import profiling_report
 from django.contrib.auth.decorators import login_required
+from django.contrib.admin.views.decorators import staff_member_required
 from registration.backends.simple.views import RegistrationView
 from datetime import datetime
+import time
+from django.conf import settings
 from django.contrib.auth.models import User
 # Create your views here.
 
+VISIT_WINDOW = getattr(settings, 'RANGO_VISIT_WINDOW', 24 * 60 * 60)
+TRACK_ANONYMOUS_VISITS = getattr(settings, 'RANGO_TRACK_ANONYMOUS_VISITS', False)
+SUGGESTION_MAX_AGE = getattr(settings, 'RANGO_SUGGESTION_MAX_AGE', 60)
+CATEGORY_PAGE_SIZE = getattr(settings, 'RANGO_CATEGORY_PAGE_SIZE', 50)
+PAGE_ORDERING = ('-views', '-id')
+
 # More or less a helper method
 def get_server_side_cookie(request, cookie, default_val=None):
 	val = request.session.get(cookie)
@@ -20,71 +40,108 @@ def get_server_side_cookie(request, cookie, default_val=None):
 	return val
 
 def visitor_cookie_handler(request):
-	# Get the no of visits to the site with COOKIES.get()
-	# If the cookie exists, value returned is casted to an integer, else, default value of 1 is used.
-	visits = int(get_server_side_cookie(request, 'visits', '1'))
-	last_visit_cookie = get_server_side_cookie(request, 'last_visit', str(datetime.now()))
-	last_visit_time = datetime.strptime(last_visit_cookie[:-7], '%Y-%m-%d %H:%M:%S')
-
-	# If it's been more than a day since the last visit...
-	if (datetime.now() - last_visit_time).seconds > 0:
+	# Count the visits of this visitor, at most one per RANGO_VISIT_WINDOW (a day by default).
+	# The session is only written when the count changes, so refreshing the page costs no writes.
+	visits = int(get_server_side_cookie(request, 'visits', 0))
+	last_visit = get_server_side_cookie(request, 'last_visit')
+	now = time.time()
+
+	if isinstance(last_visit, str):
+		# Older sessions stored str(datetime.now()) here; read it once and store a timestamp from now on
+		try:
+			last_visit = time.mktime(datetime.strptime(last_visit[:19], '%Y-%m-%d %H:%M:%S').timetuple())
+		except ValueError:
+			last_visit = None
+
+	# Is this the first visit, or has it been more than a day since the last one?
+	if last_visit is None or visits == 0:
+		visits = 1
+	elif now - last_visit >= VISIT_WINDOW:
 		visits = visits + 1
-		# update the last cookie now that we have updated the count
-		request.session['last_visit'] = str(datetime.now())
 	else:
-		visits = 1
-		# set the last visit cookie 
-		request.session['last_visit'] = last_visit_cookie
-	# Update/set the visits cookie
+		return visits
+
+	# Update the session now that we have updated the count
 	request.session['visits'] = visits
+	request.session['last_visit'] = int(now)
+	visitors.record_visit()
+	return visits
 
 def index(request):
-	# You first query the database for a list of ALL categories currently stored.
-	# Order the categories by no. likes in descending order.
-	# Retrieve the top 5 only - or all if less than 5.
-	# Place the list in our context dictionary that will be passed to the template engine.
-	request.session.set_test_cookie()
-	category_list = Category.objects.order_by('-likes')[:5]
-	page_list = Page.objects.order_by('-views')[:5]
+	# Every hit is counted, including the ones answered from the response cache
+	visitors.record_hit()
+	return render_index(request)
+
+# Anonymous responses can be shared through the response cache (rango/response_cache.py),
+# until a category or page changes
+@cache_anonymous(lambda request: ['categories', 'pages', 'likes'])
+def render_index(request):
+	# Get the most liked categories and the most viewed pages - the top RANGO_LEADERBOARD_SIZE, or all if there are fewer.
+	# These come from the in-memory leaderboards (see rango/leaderboards.py) rather than sorting the tables on every hit.
+	# Place the lists in our context dictionary that will be passed to the template engine.
+	category_list = leaderboards.top_categories()
+	page_list = leaderboards.top_pages()
 	context = {'categories': category_list, 'pages':page_list}
-	visitor_cookie_handler(request)
-	context['visits'] = request.session['visits']
-	# context = {'boldmessage': "Crunchy, creamy, cookie, candy, cupcake!"}
-	response = render(request, 'rango/index.html', context=context)
-	return response
+	# Anonymous visitors are only counted site-wide unless RANGO_TRACK_ANONYMOUS_VISITS is on,
+	# so they get no session (and no session write) just for looking at the home page.
+	if request.user.is_authenticated() or TRACK_ANONYMOUS_VISITS:
+		context['visits'] = visitor_cookie_handler(request)
+	# If the browser's copy is still current, tell it so instead of rendering the page again
+	etag, last_modified = conditional.index_validators(request, category_list, page_list, context.get('visits'))
+	response = conditional.not_modified(request, etag, last_modified)
+	if response is None:
+		# context = {'boldmessage': "Crunchy, creamy, cookie, candy, cupcake!"}
+		response = render(request, 'rango/index.html', context=context)
+	return conditional.set_validators(request, response, etag, last_modified)
 
+# The visit counts on it go stale quickly, so it is only cached for a few seconds
+@cache_anonymous(lambda request: ['categories'], timeout=10)
 def about(request):
 	# if request.session.test_cookie_worked():
 	# 	print("TEST COOKIE WORKED...DOPE!!!")
 	# 	request.session.delete_test_cookie()
-	return render(request, 'rango/about.html', {})
+	return render(request, 'rango/about.html', {'visit_counts': visitors.visit_counts()})
 
+@cache_anonymous(lambda request, category_name_slug: ['categories', 'category:{0}'.format(category_name_slug)])
 def show_category(request, category_name_slug):
 	# creating a context dictionary that can be passed to the template rendering engine
 	context = {}
 
-	try:
-		# Check if we can find a category name slug with the given name
-		# If we cant, the .get() raises a DoesNotExist exception
-		# If we can, the .get() returns one model instance
-		category = Category.objects.get(slug=category_name_slug)
+	# Check if we can find a category name slug with the given name
+	# If we cant, we get None; if we can, one model instance.
+	# Both answers are cached for a while, see rango/slugs.py
+	category = slugs.get_category(category_name_slug)
+
+	# The category's updated_at moves on whenever it or its pages change, so it is all it takes
+	# to tell whether the browser's copy is still current
+	etag, last_modified = conditional.category_validators(request, category)
+	response = conditional.not_modified(request, etag, last_modified)
+	if response is not None:
+		return conditional.set_validators(request, response, etag, last_modified)
 
-		# We then retrieve all the associated pages
-		# Note that filter() returns a list of page objects or an empty list
-		pages = Page.objects.filter(category=category)
+	if category:
+		# We then retrieve one page of the associated pages, most viewed first.
+		# ?after= carries on from where the previous page stopped (see rango/pagination.py)
+		pages, next_cursor = keyset_page(Page.objects.filter(category=category), PAGE_ORDERING,
+			request.GET.get('after'), CATEGORY_PAGE_SIZE)
 
 		# Add our results list to the template context under the name pages
 		context['pages']=pages
+		if next_cursor:
+			context['next_url'] = '?after={0}'.format(next_cursor)
 		# Add the category object from the database to the context dictionary
 		# We'll use this in the template to verify that the category exists.
 		context['category']=category
-	except Category.DoesNotExist:
+	else:
 		# This is if we didnt find the specified category
 		context['category'] = None
 		context['pages'] = None
 
 	# Render the response and return it to the client
-	return render(request, 'rango/category.html', context)
+	response = render(request, 'rango/category.html', context)
+	if context.get('next_url'):
+		response['Link'] = '<{0}>; rel="next"'.format(request.build_absolute_uri(context['next_url']))
+	return conditional.set_validators(request, response, etag, last_modified)
 
 @login_required
 def add_category(request):
@@ -97,8 +154,9 @@ def add_category(request):
 			# Save the new category into the database
 			form.save(commit=True)
 			'''Now that the category is saved, we could give a confirmation message
-			But since the most recent category added is on the index page, we can then direct the user to the index page'''
-			return index(request)
+			But since the most recent category added is on the index page, we can then direct the user to the index page
+			(with a redirect, so reloading it doesn't post the form again)'''
+			return redirect('index')
 		else:
 			# If the supplied form contained errors, just print them to the terminal
 			print(form.errors)
@@ -107,10 +165,7 @@ def add_category(request):
 	return render(request, 'rango/add_category.html', {'form':form})
 
 def add_page(request, category_name_slug):
-	try: 
-		category = Category.objects.get(slug=category_name_slug)
-	except Category.DoesNotExist:
-		category = None
+	category = slugs.get_category(category_name_slug)
 
 	form = PageForm()
 	if request.method == 'POST':
@@ -120,14 +175,125 @@ def add_page(request, category_name_slug):
 				page = form.save(commit=False)
 				page.category = category
 				page.views = 0
-				page.save()
-				return show_category(request, category_name_slug)
+				# Whether the url works, and where it redirects to, is found out in the background;
+				# queued in the same transaction, so there is a task exactly when there is a page
+				with transaction.atomic():
+					page.save()
+					linkcheck.check_page.delay(page.id)
+				return redirect('show_category', category_name_slug=category_name_slug)
 		else:
 			print(form.errors)
 
 	context = {'form':form, 'category':category}
 	return render(request, 'rango/add_page.html', context)
 
+@never_cache
+@require_http_methods(['GET', 'POST', 'DELETE'])
+def like_category(request, category_name_slug):
+	# JSON for the like button: GET says whether the user likes the category, POST likes it and DELETE unlikes it
+	if not request.user.is_authenticated():
+		return JsonResponse({'error': 'Log in to like categories'}, status=403)
+	category = slugs.get_category(category_name_slug)
+	if category is None:
+		return JsonResponse({'error': 'No such category'}, status=404)
+	category_id = category.id
+
+	if request.method != 'GET':
+		# Per user and per address, so neither a script with one account nor one behind many gets far
+		wait = likes.rate_limiter.allow('user:{0}'.format(request.user.id), 'ip:{0}'.format(request.META.get('REMOTE_ADDR')))
+		if wait:
+			response = JsonResponse({'error': 'Too many likes, try again later'}, status=429)
+			response['Retry-After'] = int(wait) + 1
+			return response
+		if request.method == 'POST':
+			likes.like(request.user, category_id)
+		else:
+			likes.unlike(request.user, category_id)
+		liked = request.method == 'POST'
+	else:
+		liked = likes.liked(request.user, category_id)
+	return JsonResponse({'liked': liked, 'likes': likes.likes(category_id)})
+
+def search(request):
+	# The query comes in the GET string so result pages can be linked to and paginated
+	query = request.GET.get('query', '').strip()
+	context = {'query': query}
+	if query:
+		paginator = Paginator(search_index(query), SEARCH_PAGE_SIZE)
+		try:
+			result_list = paginator.page(request.GET.get('page'))
+		except PageNotAnInteger:
+			result_list = paginator.page(1)
+		except EmptyPage:
+			result_list = paginator.page(paginator.num_pages)
+		context['result_list'] = result_list
+	return render(request, 'rango/search.html', context)
+
+def suggest_category(request):
+	# JSON for the sidebar type-ahead: the most liked categories starting with ?suggestion=
+	prefix = request.GET.get('suggestion', '').strip()
+	try:
+		limit = min(int(request.GET.get('limit', SUGGESTION_LIMIT)), SUGGESTION_LIMIT)
+	except ValueError:
+		limit = SUGGESTION_LIMIT
+	categories = []
+	if prefix:
+		for category in suggest_categories(prefix, limit):
+			categories.append({
+				'name': category['name'],
+				'url': reverse('show_category', args=[category['slug']]),
+				'likes': category['likes'],
+			})
+	response = JsonResponse({'suggestion': prefix, 'categories': categories})
+	# The same prefix gives the same answer for a while, let browsers and proxies reuse it
+	patch_cache_control(response, public=True, max_age=SUGGESTION_MAX_AGE)
+	return response
+
+def profiling(request):
+	# The per-view timings and query counts collected by rango.middleware.QueryProfilingMiddleware.
+	# Only shown in DEBUG or to INTERNAL_IPS.
+	if not (settings.DEBUG or request.META.get('REMOTE_ADDR') in settings.INTERNAL_IPS):
+		raise Http404
+	return JsonResponse(profiling_report())
+
+@require_safe
+def api_categories(request):
+	# GET /rango/api/v1/categories/?fields=name,slug&sort=likes&limit=20&after=<cursor>
+	try:
+		rows, next_url = api.list_page(request, Category.objects.all(), api.CATEGORY_FIELDS,
+			api.CATEGORY_DEFAULT_FIELDS, api.CATEGORY_ORDERINGS, 'id')
+	except api.APIError as e:
+		return api.error_response(str(e), e.status)
+	return api.json_response(request, {'categories': rows, 'next': next_url}, next_url)
+
+@require_safe
+def api_category_pages(request, category_name_slug):
+	# GET /rango/api/v1/categories/<slug>/pages/?fields=id,title,views&sort=views&after=<cursor>
+	category = slugs.get_category(category_name_slug)
+	if category is None:
+		return api.error_response('No such category', 404)
+	try:
+		rows, next_url = api.list_page(request, Page.objects.filter(category_id=category.id), api.PAGE_FIELDS,
+			api.PAGE_DEFAULT_FIELDS, api.PAGE_ORDERINGS, 'views')
+	except api.APIError as e:
+		return api.error_response(str(e), e.status)
+	return api.json_response(request, {'category': category.slug, 'pages': rows, 'next': next_url}, next_url)
+
+@staff_member_required
+@never_cache
+def export_catalogue(request):
+	# The whole catalogue, streamed as it is read: ?format=jsonl (default) or csv,
+	# ?only=categories or pages for just one of them, ?gzip=1 to compress it
+	fmt = request.GET.get('format', 'jsonl')
+	only = request.GET.get('only')
+	if fmt not in exporter.FORMATS or only not in (None, 'categories', 'pages'):
+		return HttpResponse('Unknown format or selection', status=400)
+	gzip = request.GET.get('gzip') == '1'
+	response = StreamingHttpResponse(exporter.export(fmt, only != 'pages', only != 'categories', gzip),
+		content_type='application/gzip' if gzip else exporter.CONTENT_TYPES[fmt])
+	response['Content-Disposition'] = 'attachment; filename="{0}"'.format(exporter.filename(fmt, gzip))
+	return response
+
 # def register(request):
 # 	'''A boolean value for telling the template whether the registration was successful.
 # 	Set to false initially. Code changes value to true when registration succeeds.'''
@@ -223,16 +389,27 @@ def track_url(request):
 		if 'page_id' in request.GET:
 			page_id = request.GET['page_id']
 	if page_id:
+		# The url comes from the cached page map and the click is only buffered,
+		# the counter writes the views back to the database in batches.
 		try:
-			page = Page.objects.get(id=page_id)
-			page.views = page.views + 1
-			page.save()
-			return redirect(page.url)
-		except:
+			url = clicks.get_page_url(int(page_id))
+		except ValueError:
+			url = None
+		if url is None:
 			return HttpResponse("Page id {0} not found".format(page_id))
+		clicks.record_click(int(page_id))
+		return redirect(url)
 	print("No page_id in get string")
 	return redirect(reverse('index'))
 
+def trending(request):
+	# The most viewed pages of the last hour, day or week, from the analytics rollups
+	window = request.GET.get('window')
+	if window not in analytics.WINDOWS:
+		window = 'day'
+	context = {'pages': analytics.trending(window), 'window': window, 'windows': list(analytics.WINDOWS)}
+	return render(request, 'rango/trending.html', context)
+
 def register_profile(request):
 	form = UserProfileForm()
 	if request.method == 'POST':
@@ -241,6 +418,9 @@ def register_profile(request):
 			user_profile = form.save(commit=False)
 			user_profile.user = request.user
 			user_profile.save()
+			if 'picture' in form.changed_data:
+				# The thumbnails are made in the background, see rango/thumbnails.py
+				thumbnails.generate_later(user_profile)
 
 			return redirect('index')
 		else:
@@ -255,18 +435,24 @@ class MyRegistrationView(RegistrationView):
 
 @login_required
 def profile(request, username):
+	# Fetch the profile and its user together; only users without a profile yet need more queries
 	try:
-		user = User.objects.get(username=username)
-	except User.DoesNotExist:
-		return redirect('index')
-
-	userprofile = UserProfile.objects.get_or_create(user=user)[0]
+		userprofile = UserProfile.objects.select_related('user').get(user__username=username)
+		user = userprofile.user
+	except UserProfile.DoesNotExist:
+		try:
+			user = User.objects.get(username=username)
+		except User.DoesNotExist:
+			return redirect('index')
+		userprofile = UserProfile.objects.get_or_create(user=user)[0]
 	form = UserProfileForm({'website': userprofile.website, 'picture': userprofile.picture})
 
 	if request.method == 'POST':
 		form = UserProfileForm(request.POST, request.FILES, instance=userprofile)
 		if form.is_valid():
 			form.save(commit=True)
+			if 'picture' in form.changed_data:
+				thumbnails.generate_later(userprofile)
 			return redirect('profile', user.username)
 		else:
 			print(form.errors)
@@ -275,5 +461,6 @@ def profile(request, username):
 
 @login_required
 def list_profiles(request):
-	userprofile_list = UserProfile.objects.all()
-	return(render(request, 'rango/list_profiles.html', {'userprofile_list' : userprofile_list}))
\ No newline at end of file
+	# One page of the (cached) profile directory, see rango/profiles.py
+	directory = profiles.directory_page(request.GET.get('page', 1))
+	return(render(request, 'rango/list_profiles.html', {'userprofile_list' : directory['profiles'], 'directory': directory}))
\ No newline at end of file
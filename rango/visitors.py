@@ -0,0 +1,33 @@
+from django.core.cache import cache
+from django.utils import timezone
+
+# Site-wide visit counts per day, kept in the cache so counting them never writes to the database.
+#  hits     - every view of the index page
+#  visitors - visits counted by visitor_cookie_handler, at most one per visitor per RANGO_VISIT_WINDOW
+# Days are the site's own (TIME_ZONE) days. The counts are only site-wide if every process uses the
+# same default cache; with the per-process LocMem cache each process counts its own visits.
+COUNT_TIMEOUT = 2 * 24 * 60 * 60
+
+def count_key(kind, day=None):
+	return 'rango:{0}:{1}'.format(kind, (day or timezone.localdate()).isoformat())
+
+def record(kind):
+	key = count_key(kind)
+	cache.add(key, 0, COUNT_TIMEOUT)
+	try:
+		cache.incr(key)
+	except ValueError:
+		# Expired between the add and the incr
+		cache.set(key, 1, COUNT_TIMEOUT)
+
+def record_hit():
+	record('hits')
+
+def record_visit():
+	record('visitors')
+
+def visit_counts(day=None):
+	return {
+		'hits': cache.get(count_key('hits', day), 0),
+		'visitors': cache.get(count_key('visitors', day), 0),
+	}
@@ -0,0 +1,53 @@
+$(document).ready(function() {
+	// Sidebar type-ahead: swap the category list for the categories matching what has been typed
+	var cats = $('#cats');
+	var allCats = cats.html();
+	var pending = null;
+
+	$('#suggestion').keyup(function() {
+		var query = $(this).val();
+		var url = $(this).data('url');
+		if (pending) {
+			pending.abort();
+		}
+		if (!query) {
+			cats.html(allCats);
+			return;
+		}
+		pending = $.get(url, {suggestion: query}, function(data) {
+			var list = $('<ul></ul>');
+			$.each(data.categories, function(i, category) {
+				list.append($('<li></li>').append($('<a></a>').attr('href', category.url).text(category.name)));
+			});
+			cats.empty().append(list);
+		});
+	});
+
+	// Like button on category pages: GET the current state, then POST to like and DELETE to unlike
+	var like = $('#like');
+	var liked = false;
+
+	function showLikes(data) {
+		liked = data.liked;
+		like.text(liked ? 'Unlike' : 'Like');
+		$('#like_count').text(data.likes + (data.likes == 1 ? ' like' : ' likes'));
+	}
+
+	if (like.length) {
+		$.getJSON(like.data('url'), showLikes);
+		like.click(function() {
+			$.ajax({
+				url: like.data('url'),
+				type: liked ? 'DELETE' : 'POST',
+				headers: {'X-CSRFToken': like.data('csrf')},
+				dataType: 'json',
+				success: showLikes,
+				error: function(xhr) {
+					if (xhr.responseJSON) {
+						$('#like_count').text(xhr.responseJSON.error);
+					}
+				}
+			});
+		});
+	}
+});
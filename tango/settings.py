@@ -56,12 +56,14 @@ LOGIN_URL = '/accounts/login/'
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'rango.middleware.StaticAssetsMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'rango.middleware.QueryProfilingMiddleware',
 ]
 
 ROOT_URLCONF = 'tango.urls'
@@ -92,11 +94,104 @@ WSGI_APPLICATION = 'tango.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/1.10/ref/settings/#databases
 
-DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': os.path.join(BASE_DIR, 'db.sqlite3'),
+# RANGO_DB_ENGINE picks the database profile:
+#   'sqlite'     - RANGO_SQLITE_PATH (db.sqlite3 by default), tuned by RANGO_SQLITE_PRAGMAS below
+#   'postgresql' - RANGO_PG_NAME/USER/PASSWORD/HOST/PORT; point HOST/PORT at a pooler such as
+#                  pgbouncer to share server connections between processes
+# Connections are kept open for RANGO_CONN_MAX_AGE seconds instead of one per request, and
+# checked before each request reuses them. With RANGO_PG_REPLICA_HOST set, reads of rango's
+# tables go to that replica (see rango.db.PrimaryReplicaRouter).
+RANGO_DB_ENGINE = os.environ.get('RANGO_DB_ENGINE', 'sqlite')
+RANGO_CONN_MAX_AGE = int(os.environ.get('RANGO_CONN_MAX_AGE', 60))
+RANGO_DB_HEALTH_CHECKS = RANGO_CONN_MAX_AGE != 0
+
+if RANGO_DB_ENGINE == 'postgresql':
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.postgresql',
+            'NAME': os.environ.get('RANGO_PG_NAME', 'rango'),
+            'USER': os.environ.get('RANGO_PG_USER', 'rango'),
+            'PASSWORD': os.environ.get('RANGO_PG_PASSWORD', ''),
+            'HOST': os.environ.get('RANGO_PG_HOST', 'localhost'),
+            'PORT': os.environ.get('RANGO_PG_PORT', '5432'),
+            'CONN_MAX_AGE': RANGO_CONN_MAX_AGE,
+            'OPTIONS': {
+                'connect_timeout': 5,
+            },
+        }
+    }
+    if os.environ.get('RANGO_PG_REPLICA_HOST'):
+        DATABASES['replica'] = dict(DATABASES['default'],
+            HOST=os.environ['RANGO_PG_REPLICA_HOST'],
+            PORT=os.environ.get('RANGO_PG_REPLICA_PORT', DATABASES['default']['PORT']),
+            TEST={'MIRROR': 'default'})
+else:
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': os.environ.get('RANGO_SQLITE_PATH', os.path.join(BASE_DIR, 'db.sqlite3')),
+            'CONN_MAX_AGE': RANGO_CONN_MAX_AGE,
+            'OPTIONS': {
+                # Seconds to wait for another connection's write lock before giving up
+                'timeout': 5,
+            },
+        }
     }
+
+RANGO_SQLITE_PRAGMAS = {
+    'journal_mode': 'wal',
+    'synchronous': 'normal',
+    'busy_timeout': 5000,
+    'mmap_size': 256 * 1024 * 1024,
+}
+DATABASE_ROUTERS = ['rango.db.PrimaryReplicaRouter']
+
+
+# Sessions
+# RANGO_SESSION_STORE picks where session data lives:
+#   'db'             - the django_session table (Django's default)
+#   'cache'          - the cache only, no database writes at all (sessions go when the cache is cleared)
+#   'cached_db'      - the cache, written through to the database
+#   'signed_cookies' - signed, client side cookies, no server side storage
+RANGO_SESSION_STORE = os.environ.get('RANGO_SESSION_STORE', 'db')
+SESSION_ENGINE = {
+    'db': 'django.contrib.sessions.backends.db',
+    'cache': 'django.contrib.sessions.backends.cache',
+    'cached_db': 'django.contrib.sessions.backends.cached_db',
+    'signed_cookies': 'django.contrib.sessions.backends.signed_cookies',
+}[RANGO_SESSION_STORE]
+
+# Whole responses to anonymous visitors of the index, about and category pages can be cached
+# (rango/response_cache.py). Off unless RANGO_RESPONSE_CACHE is set; RANGO_RESPONSE_CACHE_BACKEND
+# picks where they are kept:
+#   'locmem' - this process's memory (every process has its own copy)
+#   'file'   - files under RANGO_RESPONSE_CACHE_DIR, shared by the processes on one machine
+#   'redis'  - the Redis server at RANGO_REDIS_URL, shared by all (needs the django-redis package)
+RANGO_RESPONSE_CACHE = os.environ.get('RANGO_RESPONSE_CACHE', '') not in ('', '0', 'false', 'False')
+RANGO_RESPONSE_CACHE_BACKEND = os.environ.get('RANGO_RESPONSE_CACHE_BACKEND', 'locmem')
+RANGO_RESPONSE_CACHE_ALIAS = 'responses'
+RANGO_RESPONSE_CACHE_TIMEOUT = 60
+RANGO_RESPONSE_CACHE_GRACE = 5 * 60
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'rango',
+    },
+    'responses': {
+        'locmem': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'rango-responses',
+        },
+        'file': {
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+            'LOCATION': os.environ.get('RANGO_RESPONSE_CACHE_DIR', os.path.join(BASE_DIR, '.cache', 'responses')),
+        },
+        'redis': {
+            'BACKEND': 'django_redis.cache.RedisCache',
+            'LOCATION': os.environ.get('RANGO_REDIS_URL', 'redis://127.0.0.1:6379/1'),
+        },
+    }[RANGO_RESPONSE_CACHE_BACKEND],
 }
 
 
@@ -141,3 +236,150 @@ MEDIA_URL = '/media/'
 # https://docs.djangoproject.com/en/1.10/howto/static-files/
 STATICFILES_DIRS = [STATIC_DIR, ]
 STATIC_URL = '/static/'
+# Where collectstatic puts the content hashed, bundled and precompressed files (rango/storage.py).
+# Without DEBUG, rango.middleware.StaticAssetsMiddleware serves them from here with long lived,
+# immutable Cache-Control headers, unless RANGO_SERVE_STATIC is turned off (e.g. behind nginx).
+STATIC_ROOT = os.path.join(BASE_DIR, 'staticfiles')
+STATICFILES_STORAGE = 'rango.storage.BundledManifestStaticFilesStorage'
+RANGO_SERVE_STATIC = not DEBUG
+# Bundle name -> the static files it is made of, loaded in templates with {% asset_bundle %}
+RANGO_ASSET_BUNDLES = {
+    'css/rango.bundle.css': [
+        'vendor/bootstrap/bootstrap-4.0.0.min.css',
+        'css/dashboard.css',
+        'css/signin.css',
+    ],
+    'js/rango.bundle.js': [
+        'vendor/jquery/jquery-3.7.1.min.js',
+        'vendor/bootstrap/bootstrap-4.0.0.bundle.min.js',
+        'js/rango-ajax.js',
+    ],
+}
+
+# Clicks on /rango/goto/ are buffered in memory and written back to Page.views in batches,
+# once this many clicks are pending or this many seconds have passed since the last write.
+RANGO_CLICK_FLUSH_SIZE = 100
+RANGO_CLICK_FLUSH_INTERVAL = 10
+
+# Category likes (rango/likes.py) are buffered the same way; each user, and each IP address, can
+# like or unlike RANGO_LIKE_RATE_LIMIT[0] times per RANGO_LIKE_RATE_LIMIT[1] seconds.
+RANGO_LIKE_FLUSH_SIZE = 50
+RANGO_LIKE_FLUSH_INTERVAL = 5
+RANGO_LIKE_RATE_LIMIT = (10, 60)
+
+# Cached things derived from a table (the sidebar, the profile directory) are keyed by the table's
+# version (rango/versions.py), bumped whenever it changes. The versions are kept in the
+# RANGO_VERSION_CACHE cache alias; with more than one process that has to be a cache they all
+# share, or a change made in one process only shows in the others once their entries time out.
+# With the default per-process LocMem cache, RANGO_SIDEBAR_CACHE_TIMEOUT (seconds) is how stale
+# another process's category sidebar can get.
+RANGO_VERSION_CACHE = 'default'
+RANGO_SIDEBAR_CACHE_TIMEOUT = 60
+
+# How many categories/pages the index page leaderboards show, and how many seconds
+# a leaderboard may go without being rebuilt from the database.
+RANGO_LEADERBOARD_SIZE = 5
+RANGO_LEADERBOARD_MAX_AGE = 60
+
+# Visitors are counted at most once per this many seconds. Anonymous visitors are only
+# counted site-wide (no session is created for them) unless RANGO_TRACK_ANONYMOUS_VISITS is True.
+RANGO_VISIT_WINDOW = 24 * 60 * 60
+RANGO_TRACK_ANONYMOUS_VISITS = False
+
+# The sidebar type-ahead returns at most this many categories, and lets clients cache an answer this many seconds.
+RANGO_SUGGESTION_LIMIT = 8
+RANGO_SUGGESTION_MAX_AGE = 60
+
+# How many pages of a category show_category lists at a time
+RANGO_CATEGORY_PAGE_SIZE = 50
+
+# Categories by slug are cached in each process (rango/slugs.py): how many, for how many seconds,
+# and for how long a slug is remembered as not existing.
+RANGO_SLUG_CACHE_SIZE = 1000
+RANGO_SLUG_CACHE_TIMEOUT = 60
+RANGO_SLUG_CACHE_NEGATIVE_TIMEOUT = 10
+
+# Page views over time (rango/analytics.py): seconds the minute, hour and day buckets are kept,
+# seconds between rollups of minutes into hours and days, and how many pages the trending list
+# shows, recomputed at most every RANGO_TRENDING_MAX_AGE seconds.
+RANGO_ANALYTICS_RETENTION = {'minute': 24 * 60 * 60, 'hour': 30 * 24 * 60 * 60, 'day': 400 * 24 * 60 * 60}
+RANGO_ANALYTICS_ROLLUP_INTERVAL = 5 * 60
+RANGO_TRENDING_SIZE = 10
+RANGO_TRENDING_MAX_AGE = 60
+
+# The admin's changelists take the count of an unfiltered table with at least this many rows from
+# the database's statistics rather than COUNT(*) (on SQLite those are only there once ANALYZE has run).
+RANGO_ESTIMATED_COUNT_THRESHOLD = 100000
+
+# The JSON API (rango/api.py): rows per page unless ?limit= says otherwise, the most ?limit= may
+# ask for, and how many seconds clients and shared caches may reuse a response.
+RANGO_API_PAGE_SIZE = 50
+RANGO_API_MAX_PAGE_SIZE = 200
+RANGO_API_MAX_AGE = 30
+
+# How many profiles list_profiles shows per page, and for how many seconds pages are cached:
+# they are rebuilt whenever a profile changes, but without a shared RANGO_VERSION_CACHE
+# another process only sees the change once its copy times out
+RANGO_PROFILES_PAGE_SIZE = 50
+RANGO_PROFILES_CACHE_TIMEOUT = 60
+
+# Request profiling (rango.middleware.QueryProfilingMiddleware): wall time, query count and SQL time
+# per view, shown at /rango/profiling/ to INTERNAL_IPS. Requests that repeat a query
+# RANGO_DUPLICATE_QUERY_THRESHOLD times, or go over their view's query budget, are logged as
+# warnings to the 'rango.profiling' logger - or with RANGO_QUERY_BUDGETS_STRICT, fail.
+RANGO_PROFILING = DEBUG
+# The index needs 6 at most: the two leaderboards and the sidebar when they aren't cached, and
+# for a logged in visitor the session and the user, plus the session write on their first visit of the day.
+RANGO_QUERY_BUDGETS = {
+    'index': 6,
+    'about': 3,
+    'show_category': 4,
+    'goto': 1,
+    'suggest_category': 1,
+    'list_profiles': 5,
+    'api_categories': 1,
+    'api_category_pages': 2,
+}
+RANGO_QUERY_BUDGETS_STRICT = False
+RANGO_DUPLICATE_QUERY_THRESHOLD = 3
+INTERNAL_IPS = ['127.0.0.1']
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {
+            'class': 'logging.StreamHandler',
+        },
+    },
+    'loggers': {
+        'rango': {
+            'handlers': ['console'],
+            'level': os.environ.get('RANGO_LOG_LEVEL', 'WARNING'),
+        },
+    },
+}
+
+# Profile picture thumbnails (rango/thumbnails.py): square sizes made for every upload, the format
+# (WEBP, falling back to JPEG where Pillow can't write it). They are made by background tasks.
+RANGO_THUMBNAIL_SIZES = (64, 128, 256)
+RANGO_THUMBNAIL_FORMAT = 'WEBP'
+
+# Link checking (manage.py check_links, rango/linkcheck.py): requests in flight at once, at most
+# RANGO_LINK_CHECK_PER_HOST of them to one host, started RANGO_LINK_CHECK_HOST_DELAY seconds apart.
+RANGO_LINK_CHECK_CONCURRENCY = 20
+RANGO_LINK_CHECK_PER_HOST = 2
+RANGO_LINK_CHECK_HOST_DELAY = 0.5
+RANGO_LINK_CHECK_TIMEOUT = 10
+# Only ever for testing: lets the link checker connect to localhost and private addresses
+RANGO_LINK_CHECK_ALLOW_PRIVATE = False
+
+# Background tasks (rango/tasks.py): thumbnails, checking the links of new pages. They are run by
+# RANGO_TASK_INLINE_WORKERS threads in each web process, or, with that set to 0, by separate
+# `manage.py run_tasks` processes. A worker that hasn't finished a task within RANGO_TASK_LEASE
+# seconds is taken to have died, and the task is run again; a task that fails is retried after
+# RANGO_TASK_RETRY_DELAY seconds, doubled for each retry after that.
+RANGO_TASK_INLINE_WORKERS = int(os.environ.get('RANGO_TASK_INLINE_WORKERS', 1))
+RANGO_TASK_LEASE = 5 * 60
+RANGO_TASK_RETRY_DELAY = 30
+RANGO_TASK_POLL_INTERVAL = 5